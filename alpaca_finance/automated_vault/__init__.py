@@ -1 +1,2 @@
 from .position import AutomatedVaultPosition
+from .portfolio import PositionScanner
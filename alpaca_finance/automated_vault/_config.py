@@ -1,6 +1,24 @@
 DEFAULT_BSC_RPC_URL = "https://bsc-dataseed.binance.org/"
+BSC_RPC_URLS = [
+    "https://bsc-dataseed.binance.org/",
+    "https://bsc-dataseed1.defibit.io/",
+    "https://bsc-dataseed1.ninicoin.io/",
+    "https://bsc-dataseed2.binance.org/",
+]
 
 # Contract Addresses:
 DELTA_NEUTRAL_ORACLE_ADDRESS = "0x08EA5fB66EA41f236E3001d2655e43A1E735787F"
 DELTA_NEUTRAL_VAULT_ADDRESS = "0xDb7ba1805b8284b1Ad662F03eF4259e4919DC1c5"
-AUTOMATED_VAULT_CONTROLLER_ADDRESS = "0xfd0694a29871Ee629D51cF4079842382368f1e15"
\ No newline at end of file
+AUTOMATED_VAULT_CONTROLLER_ADDRESS = "0xfd0694a29871Ee629D51cF4079842382368f1e15"
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+WBNB_ADDRESS = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+
+# Snapshot collector (alpaca-collector) API:
+DEFAULT_COLLECTOR_HOST = "127.0.0.1"
+DEFAULT_COLLECTOR_PORT = 9465
+
+# Local storage (rebalance history, snapshot recorder):
+DEFAULT_CACHE_DIR = "~/.cache/alpaca_finance"
+
+# Subgraphs:
+AUTOMATED_VAULT_SUBGRAPH_URL = "https://api.thegraph.com/subgraphs/name/alpaca-finance/automated-vault"
@@ -0,0 +1,343 @@
+"""
+Async counterparts of the informational contract and position classes, for use in asyncio applications.
+Every JSON-RPC and REST request made by these classes goes through one connection-pooled aiohttp session.
+"""
+from itertools import count
+from math import log10
+from time import perf_counter
+from typing import Union
+from weakref import WeakKeyDictionary
+import asyncio
+import json
+
+from ..util import get_bsc_contract_instance, get_entry_prices_async, checksum
+from ..registry import get_registry, VaultSummary
+from .. import transport, instrumentation
+from ..cassette import get_cassette
+from ..instrumentation import Event
+from ._config import DEFAULT_BSC_RPC_URL, DELTA_NEUTRAL_ORACLE_ADDRESS, AUTOMATED_VAULT_CONTROLLER_ADDRESS
+from .multicall import Multicall, decode_function_output
+from .snapshot import PositionSnapshot, SHARE_VALUE_UNIT
+
+import aiohttp
+import web3.contract
+from web3 import Web3
+from attrdict import AttrDict
+
+
+class AsyncRPC:
+    def __init__(self, rpc_url: str = DEFAULT_BSC_RPC_URL, session: aiohttp.ClientSession = None,
+                 pool_size: int = None, timeout: float = None):
+        """
+        Minimal async JSON-RPC client used to call prepared ContractFunctions.
+
+        :param rpc_url: The network RPC URL
+        :param session: (Optional) aiohttp session to share with the rest of the application
+        :param pool_size: Maximum amount of pooled keep-alive connections (if the session is created here)
+                          default = TransportConfig.pool_maxsize
+        :param timeout: Total timeout in seconds for each request (if the session is created here)
+                        default = TransportConfig.connect_timeout + TransportConfig.read_timeout
+        Failed requests are retried with the backoff settings of alpaca_finance.transport.
+        """
+        config = transport.get_config()
+        self.rpc_url = rpc_url
+        self.pool_size = config.pool_maxsize if pool_size is None else pool_size
+        self.timeout = sum(config.timeout) if timeout is None else timeout
+
+        # Offline Web3 instance, only used to build contract objects for ABI encoding/decoding
+        self.w3 = Web3()
+
+        self._session = session
+        self._owns_session = session is None
+        self._request_ids = count()
+        self._chain_id = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared aiohttp session (created on first use, inside the running event loop)"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def request(self, method: str, params: list):
+        """Send a JSON-RPC request and return its result (replayed from / recorded into the active cassette)"""
+        cassette = get_cassette()
+        response = None if cassette is None else cassette.rpc_lookup(method, params)
+        if response is None:
+            response = await self._send(method, params)
+            if cassette is not None:
+                cassette.rpc_record(method, params, response)
+
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    async def _send(self, method: str, params: list) -> dict:
+        payload = {"jsonrpc": "2.0", "id": next(self._request_ids), "method": method, "params": params}
+
+        started = perf_counter()
+        retries = transport.get_config().retries
+        try:
+            for attempt in range(retries + 1):
+                last_attempt = attempt == retries or method in transport.NON_IDEMPOTENT_RPC_METHODS
+                try:
+                    async with self.session.post(self.rpc_url, json=payload) as r:
+                        if r.status not in transport.RETRY_STATUS_CODES or last_attempt:
+                            r.raise_for_status()
+                            body = await r.read()
+                            response = await r.json(content_type=None)
+                            break
+                        instrumentation.record_retry(method, str(r.status))
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                    if last_attempt:
+                        raise
+                    instrumentation.record_retry(method, type(exc).__name__)
+                await asyncio.sleep(transport.backoff_delay(attempt))
+        except Exception as exc:
+            if instrumentation.enabled():
+                instrumentation.emit(Event(kind="rpc", name=method, duration=perf_counter() - started,
+                                           error=type(exc).__name__))
+            raise
+
+        if instrumentation.enabled():
+            instrumentation.emit(Event(kind="rpc", name=method, duration=perf_counter() - started,
+                                       request_bytes=len(json.dumps(payload)), response_bytes=len(body),
+                                       error=str(response["error"].get("code")) if "error" in response else None))
+        return response
+
+    async def call(self, function_call: web3.contract.ContractFunction,
+                   block_identifier: Union[int, str] = "latest"):
+        """Async counterpart of ContractFunction.call()"""
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+
+        result = await self.request("eth_call", [{"to": function_call.address,
+                                                  "data": function_call._encode_transaction_data()},
+                                                 block_identifier])
+        return decode_function_output(function_call, bytes.fromhex(result[2:]))
+
+    async def aggregate(self, multicall: Multicall, block_identifier: Union[int, str] = "latest") -> tuple[int, list]:
+        """Async counterpart of Multicall.aggregate()"""
+        return multicall.decode(await self.call(multicall.prepare(), block_identifier))
+
+    async def chain_id(self) -> int:
+        """Returns the chainId of the network (requested once)"""
+        if self._chain_id is None:
+            self._chain_id = int(await self.request("eth_chainId", []), 16)
+        return self._chain_id
+
+    async def close(self) -> None:
+        """Close the aiohttp session if it was created by this client"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+# Default AsyncRPC of each event loop (aiohttp sessions cannot be shared between loops)
+_default_rpcs = WeakKeyDictionary()
+
+
+def get_default_rpc() -> AsyncRPC:
+    """Returns the AsyncRPC shared by the async positions created without one (one per running event loop)"""
+    loop = asyncio.get_running_loop()
+    rpc = _default_rpcs.get(loop)
+    if rpc is None:
+        rpc = _default_rpcs[loop] = AsyncRPC()
+    return rpc
+
+
+async def close_default_rpc() -> None:
+    """Close the session of the running event loop's default AsyncRPC (See get_default_rpc())"""
+    rpc = _default_rpcs.pop(asyncio.get_running_loop(), None)
+    if rpc is not None:
+        await rpc.close()
+
+
+class AsyncDeltaNeutralOracle:
+    def __init__(self, rpc: AsyncRPC):
+        self.rpc = rpc
+        self.contract = get_bsc_contract_instance(contract_address=DELTA_NEUTRAL_ORACLE_ADDRESS,
+                                                  abi_filename="DeltaNeutralOracle.json", w3_provider=rpc.w3)
+
+    async def lpToDollar(self, lp_amount: int, pancakeswap_lp_token_address: str) -> int:
+        """Return the value in USD for the given lpAmount"""
+        return await self.rpc.call(self.contract.functions.lpToDollar(lp_amount, checksum(pancakeswap_lp_token_address)))
+
+    async def dollarToLp(self, dollar_amount: int, lp_token_address: str) -> int:
+        """Return the amount of LP for the given USD"""
+        return await self.rpc.call(self.contract.functions.dollarToLp(dollar_amount, checksum(lp_token_address)))
+
+    async def getTokenPrice(self, token_address: str) -> int:
+        """Return the price of the given token (address) in USD"""
+        return (await self.rpc.call(self.contract.functions.getTokenPrice(checksum(token_address))))[0] / 10 ** 18
+
+
+class AsyncDeltaNeutralVault:
+    def __init__(self, vault_address: str, rpc: AsyncRPC):
+        self.rpc = rpc
+        self.address = vault_address
+        self.contract = get_bsc_contract_instance(contract_address=vault_address,
+                                                  abi_filename="DeltaNeutralVault.json", w3_provider=rpc.w3)
+
+    async def shares(self, user_address: str) -> int:
+        """Return the number of shares owned by the given user"""
+        return await self.rpc.call(self.contract.functions.balanceOf(checksum(user_address)))
+
+    async def positionInfo(self) -> list:
+        """See DeltaNeutralVault.positionInfo()"""
+        return list(await self.rpc.call(self.contract.functions.positionInfo()))
+
+    async def sharesToUSD(self, share_amount: int) -> int:
+        """Returns the value in USD for the given amount of vault shares"""
+        return await self.rpc.call(self.contract.functions.shareToValue(share_amount))
+
+    async def stableTokenAddress(self) -> str:
+        """Returns the address for the delta vault stable token"""
+        return await self.rpc.call(self.contract.functions.stableToken())
+
+    async def assetTokenAddress(self) -> str:
+        """Returns the address for the delta vault asset token"""
+        return await self.rpc.call(self.contract.functions.assetToken())
+
+
+class AsyncAutomatedVaultController:
+    def __init__(self, rpc: AsyncRPC):
+        self.rpc = rpc
+        self.contract = get_bsc_contract_instance(contract_address=AUTOMATED_VAULT_CONTROLLER_ADDRESS,
+                                                  abi_filename="AutomatedVaultController.json", w3_provider=rpc.w3)
+
+    async def getUserVaultShares(self, owner_address: str, vault_address: str) -> int:
+        return await self.rpc.call(self.contract.functions.getUserVaultShares(checksum(owner_address),
+                                                                              checksum(vault_address)))
+
+    async def totalCredit(self, user_address: str) -> int:
+        """Get the user's total credit in USD"""
+        return await self.rpc.call(self.contract.functions.totalCredit(checksum(user_address)))
+
+
+class AsyncAutomatedVaultPosition:
+    def __init__(self, summary: dict, owner_wallet_address: str, rpc: AsyncRPC, addresses: dict):
+        """
+        Async counterpart of the AutomatedVaultPosition informational methods.
+        Use AsyncAutomatedVaultPosition.create() to build an instance from a position key.
+
+        :param summary: The vault's summary.json data (See AutomatedVaultPosition.get_vault_summary())
+        :param owner_wallet_address: The public wallet address of the position owner
+        :param rpc: AsyncRPC client shared by all async positions
+        :param addresses: The vault's .mainnet.json data (See VaultRegistry.adelta_neutral_vault())
+        """
+        self.rpc = rpc
+        self.owner_address = owner_wallet_address
+
+        # Store position metadata
+        self.key = summary['key']
+        self.name = summary['name']
+        self.address = summary['address'].lower()
+        self.vault_type = "neutral" if self.key.startswith("n") else "long/savings"
+        self.addresses = addresses
+        self.stable_token_address = checksum(self.addresses['stableToken'])
+        self.asset_token_address = checksum(self.addresses['assetToken'])
+
+        self.oracle = AsyncDeltaNeutralOracle(rpc)
+        self.vault = AsyncDeltaNeutralVault(self.address, rpc)
+        self.controller = AsyncAutomatedVaultController(rpc)
+
+    @classmethod
+    async def create(cls, position_key: str, owner_wallet_address: str,
+                     rpc: AsyncRPC = None) -> "AsyncAutomatedVaultPosition":
+        """
+        :param position_key: The position key as shown on the Alpaca Finance webapp (e.g. n3x-BNBBUSD-PCS1)
+        :param owner_wallet_address: The public wallet address of the position owner
+        :param rpc: (Optional) AsyncRPC client to share between positions (default = get_default_rpc())
+        """
+        rpc = get_default_rpc() if rpc is None else rpc
+
+        registry = get_registry()
+        await registry.aload(rpc.session)
+        try:
+            summary = await registry.astrategy_pool(position_key, rpc.session)
+        except KeyError:
+            raise ValueError(f"Could not locate a vault with the key {position_key}")
+        addresses = await registry.adelta_neutral_vault(summary['address'], rpc.session)
+
+        return cls(summary, owner_wallet_address, rpc, addresses)
+
+    async def get_vault_summary(self) -> AttrDict:
+        """See AutomatedVaultPosition.get_vault_summary()"""
+        return AttrDict(await get_registry().astrategy_pool(self.key, self.rpc.session))
+
+    async def vault_summary(self) -> VaultSummary:
+        """See AutomatedVaultPosition.vault_summary()"""
+        return await get_registry().avault_summary(self.key, self.rpc.session)
+
+    async def yields(self) -> list[float, float, float, float]:
+        """See AutomatedVaultPosition.yields()"""
+        summary = await self.vault_summary()
+        return [summary.aprTradingFeeExcluded, summary.apyTradingFeeExcluded, summary.apr, summary.apy]
+
+    async def tvl(self) -> list[float, float]:
+        """See AutomatedVaultPosition.tvl()"""
+        summary = await self.vault_summary()
+        return [summary.tvl, summary.tvlIncludingDebt]
+
+    async def capacity(self) -> float:
+        return (await self.vault_summary()).capacity
+
+    async def current_value(self) -> float:
+        """Returns the current position value in USD"""
+        return (await self.snapshot(include_entry_price=False)).shares_usd
+
+    async def pnl(self) -> float:
+        """Returns the pnl for the current position in USD value"""
+        return (await self.snapshot()).pnl
+
+    async def shares(self) -> tuple[int, float, float]:
+        """See AutomatedVaultPosition.shares()"""
+        snapshot = await self.snapshot(include_entry_price=False)
+        return snapshot.shares_int, snapshot.shares, snapshot.shares_usd
+
+    async def cost_basis(self) -> float:
+        """See AutomatedVaultPosition.cost_basis()"""
+        return (await self.snapshot()).cost_basis
+
+    async def snapshot(self, block_identifier: Union[int, str] = "latest",
+                       include_entry_price: bool = True) -> PositionSnapshot:
+        """
+        See AutomatedVaultPosition.snapshot()
+        The Multicall3 read and the avg-entry-prices request are sent concurrently.
+        """
+        multicall = Multicall(self.rpc.w3)
+        multicall.add(self.vault.contract.functions.balanceOf(checksum(self.owner_address)))
+        multicall.add(self.vault.contract.functions.decimals())
+        multicall.add(self.vault.contract.functions.shareToValue(SHARE_VALUE_UNIT))
+        multicall.add(self.vault.contract.functions.stableTo18ConversionFactor())
+        multicall.add(self.oracle.contract.functions.getTokenPrice(self.stable_token_address))
+
+        requests = [self.rpc.chain_id(), self.rpc.aggregate(multicall, block_identifier)]
+        if include_entry_price:
+            requests.append(get_entry_prices_async(self.owner_address, self.rpc.session))
+        chain_id, (block_number, results), *entry_prices = await asyncio.gather(*requests)
+
+        if chain_id != 56:
+            raise ValueError("This package currently supports positions on the Binance Smart Chain (BSC - 56) network only")
+
+        shares_int, vault_decimals, unit_share_value, conversion_factor, stable_price = results
+        snapshot = PositionSnapshot(blockNumber=block_number,
+                                    shares_int=shares_int,
+                                    vault_token_decimals=vault_decimals,
+                                    unit_share_value=unit_share_value,
+                                    stable_token_decimals=18 - round(log10(conversion_factor)),
+                                    stable_token_price=stable_price[0])
+
+        for data in (entry_prices[0] if entry_prices else []):
+            if data['strategyPoolAddress'].lower() == self.address:
+                snapshot.avgEntryPrice = int(data['avgEntryPrice'])
+
+        return snapshot
@@ -0,0 +1,341 @@
+"""
+Incremental alert rules over the snapshots refreshed by a SnapshotCollector (or any other source of metrics).
+
+    engine = AlertEngine()
+    engine.add_rule(PnLDrawdown(wallet, "n3x-BNBBUSD-PCS1", pct=0.05))
+    engine.add_rule(CapacityFreed("n3x-BNBBUSD-PCS1", amount=50000))
+    engine.on_alert(print)
+    engine.attach(collector)  # Rules are evaluated after every refresh, in the block the change was observed
+
+Metrics are keyed by (subject, metric): the subject is a vault key (e.g. "n3x-bnbbusd-pcs1") or a position
+("<wallet>/<vault key>"), both lowercase. On every observation only the rules of the metrics whose value changed
+are evaluated, and each rule only keeps the state it needs (a peak, a reference value, an armed flag),
+so thousands of rules cost a few dict lookups per tick and no history is rescanned.
+"""
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Mapping, Optional
+
+from ..registry import get_registry
+from .analytics import position_metrics, share_values
+from .collector import SnapshotCollector
+from .indexer import VaultEventIndexer
+
+
+# Metrics produced by position_values() and vault_values() - share_value is the USD value of one share
+POSITION_METRICS = ("shares", "value", "pnl", "roi", "share_value")
+VAULT_METRICS = ("apr", "apy", "tvl", "capacity", "available_capacity")
+
+
+@dataclass
+class Alert:
+    """Dataclass to model one alert fired by a rule"""
+    rule: str  # The rule name
+    subject: str  # Vault key or "<wallet>/<vault key>"
+    metric: str
+    value: float
+    blockNumber: int  # The block the change was observed at
+    message: str
+
+
+class Rule(ABC):
+    metric = None
+    reprime_on = ()  # Metrics of the same subject whose change resets the baseline (without evaluating the rule)
+
+    def __init__(self, subject: str, metric: str = None, cooldown_blocks: int = 0, name: str = None):
+        """
+        Base class of the alert rules: subclasses implement evaluate() (and prime() if they keep a baseline)
+
+        :param subject: Vault key or "<wallet>/<vault key>"
+        :param metric: The metric the rule watches (default = the metric of the rule class)
+        :param cooldown_blocks: Minimum amount of blocks between two alerts of the rule
+        :param name: (Optional) Rule name reported in the alerts, default = the class name
+        """
+        self.subject = subject.lower()
+        self.metric = self.metric if metric is None else metric
+        self.cooldown_blocks = cooldown_blocks
+        self.name = type(self).__name__ if name is None else name
+        self._fired_at = None
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.subject, self.metric
+
+    def prime(self, value: float) -> None:
+        """Set the baseline from the current value without alerting (first value of the metric, or rule added late)"""
+
+    @abstractmethod
+    def evaluate(self, value: float, previous: Optional[float]) -> Optional[str]:
+        """Returns the alert message if the new value triggers the rule, otherwise None"""
+
+    def update(self, value: float, previous: Optional[float], block_number: int) -> Optional[Alert]:
+        message = self.evaluate(value, previous)
+        if message is None:
+            return None
+        if self._fired_at is not None and block_number - self._fired_at < self.cooldown_blocks:
+            return None
+        self._fired_at = block_number
+        return Alert(rule=self.name, subject=self.subject, metric=self.metric, value=value, blockNumber=block_number,
+                     message=message)
+
+
+class Threshold(Rule):
+    def __init__(self, subject: str, metric: str, above: float = None, below: float = None, hysteresis: float = 0.0,
+                 **kwargs):
+        """
+        Fires once when the metric crosses the threshold, and re-arms only after it moved back past the
+        threshold by more than `hysteresis` (so a value oscillating around the threshold alerts once)
+
+        :param above: Fire when the value rises to `above` or higher
+        :param below: Fire when the value falls to `below` or lower
+        :param hysteresis: Distance the value must move back past the threshold before the rule can fire again
+        """
+        if (above is None) == (below is None):
+            raise ValueError("Threshold requires exactly one of above or below")
+        super().__init__(subject, metric, **kwargs)
+        self.above = above
+        self.below = below
+        self.hysteresis = hysteresis
+        self.armed = True
+
+    def _crossed(self, value: float) -> bool:
+        return value >= self.above if self.above is not None else value <= self.below
+
+    def _rearmed(self, value: float) -> bool:
+        return value < self.above - self.hysteresis if self.above is not None else value > self.below + self.hysteresis
+
+    def prime(self, value: float) -> None:
+        self.armed = not self._crossed(value)
+
+    def evaluate(self, value: float, previous: Optional[float]) -> Optional[str]:
+        if self.armed and self._crossed(value):
+            self.armed = False
+            direction, threshold = ("above", self.above) if self.above is not None else ("below", self.below)
+            return f"{self.subject} {self.metric} {direction} {threshold}: {value}"
+        if not self.armed and self._rearmed(value):
+            self.armed = True
+        return None
+
+
+class CapacityFreed(Threshold):
+    def __init__(self, position_key: str, amount: float, hysteresis: float = 0.0, **kwargs):
+        """Fires when the capacity left in the vault (capacity - TVL, USD) reaches `amount`"""
+        super().__init__(position_key, "available_capacity", above=amount, hysteresis=hysteresis, **kwargs)
+
+
+class PnLDrawdown(Rule):
+    metric = "share_value"
+    reprime_on = ("shares",)
+
+    def __init__(self, wallet_address: str, position_key: str, pct: float, hysteresis: float = 0.01, **kwargs):
+        """
+        Fires when the value of one share of the position falls `pct` below its running peak (the profit given back),
+        re-armed once the drawdown recovers below pct - hysteresis.
+        The per-share value does not move with deposits and withdrawals, and the peak is reset whenever the amount
+        of shares owned changes.
+
+        :param pct: Drawdown fraction (e.g. 0.05 = 5% below the peak)
+        """
+        super().__init__(f"{wallet_address}/{position_key}", **kwargs)
+        self.pct = pct
+        self.hysteresis = hysteresis
+        self.peak = None
+        self.armed = True
+
+    def prime(self, value: float) -> None:
+        self.peak = value
+        self.armed = True
+
+    def evaluate(self, value: float, previous: Optional[float]) -> Optional[str]:
+        self.peak = value if self.peak is None else max(self.peak, value)
+        drawdown = 1 - value / self.peak if self.peak > 0 else 0.0
+        if self.armed and drawdown >= self.pct:
+            self.armed = False
+            return f"{self.subject} share value {value:.4f} is {drawdown:.2%} below its peak of {self.peak:.4f}"
+        if not self.armed and drawdown < self.pct - self.hysteresis:
+            self.armed = True
+        return None
+
+
+class APYChange(Rule):
+    metric = "apy"
+
+    def __init__(self, position_key: str, change: float, **kwargs):
+        """
+        Fires when the APY moved by `change` percentage points from the reference value,
+        which is then reset to the new APY (the first observed value to begin with)
+        """
+        super().__init__(position_key, **kwargs)
+        self.change = change
+        self.reference = None
+
+    def prime(self, value: float) -> None:
+        self.reference = value
+
+    def evaluate(self, value: float, previous: Optional[float]) -> Optional[str]:
+        if self.reference is None:
+            self.reference = value
+        elif abs(value - self.reference) >= self.change:
+            message = f"{self.subject} APY changed from {self.reference:.2f}% to {value:.2f}%"
+            self.reference = value
+            return message
+        return None
+
+
+class RebalanceOccurred(Rule):
+    metric = "last_rebalance_block"
+
+    def __init__(self, position_key: str, **kwargs):
+        """
+        Fires when a new LogRebalance of the vault is indexed (requires AlertEngine.attach() with an indexer).
+        A vault without any indexed rebalance is observed at block 0, so its first rebalance fires too.
+        """
+        super().__init__(position_key, **kwargs)
+
+    def evaluate(self, value: float, previous: Optional[float]) -> Optional[str]:
+        if previous is not None and value > previous:
+            return f"{self.subject} rebalanced at block {int(value)}"
+        return None
+
+
+class AlertEngine:
+    def __init__(self):
+        self._rules = defaultdict(list)  # (subject, metric) -> [Rule]
+        self._reprimes = defaultdict(list)  # (subject, metric) -> [Rule] re-primed when the metric changes
+        self._values = {}  # (subject, metric) -> last observed value
+        self._callbacks = []
+        self._block_number = None  # Last observed block
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return sum(len(rules) for rules in self._rules.values())
+
+    def add_rule(self, rule: Rule) -> Rule:
+        """Register the rule (primed with the last observed value of its metric, if any)"""
+        with self._lock:
+            if rule.key in self._values:
+                rule.prime(self._values[rule.key])
+            self._rules[rule.key].append(rule)
+            for metric in rule.reprime_on:
+                self._reprimes[(rule.subject, metric)].append(rule)
+        return rule
+
+    def remove_rule(self, rule: Rule) -> None:
+        with self._lock:
+            self._rules[rule.key].remove(rule)
+            for metric in rule.reprime_on:
+                self._reprimes[(rule.subject, metric)].remove(rule)
+
+    def on_alert(self, callback: Callable[[Alert], Any]) -> None:
+        """Register a callable receiving every Alert (called from the observing thread)"""
+        self._callbacks.append(callback)
+
+    def observe(self, block_number: int, values: Mapping[tuple[str, str], float]) -> list[Alert]:
+        """
+        Evaluate the rules of the metrics that changed since the previous observation and fire the callbacks.
+        The first value of a metric only primes its rules, as does a change of one of their Rule.reprime_on metrics,
+        and observations of a block that was already observed are ignored.
+
+        :param block_number: The block the values were read at
+        :param values: Dict of (subject, metric) -> value (None/NaN values are skipped)
+        :return: The alerts fired
+        """
+        alerts = []
+        with self._lock:
+            if self._block_number is not None and block_number <= self._block_number:
+                return alerts
+            self._block_number = block_number
+
+            changed = {}  # key -> previous value
+            for key, value in values.items():
+                previous = self._values.get(key)
+                if value is None or value != value or value == previous:
+                    continue
+                changed[key] = previous
+                self._values[key] = value
+
+            reprimed = set()
+            for key in changed:
+                for rule in self._reprimes.get(key, ()):
+                    if id(rule) not in reprimed and rule.key in self._values:
+                        rule.prime(self._values[rule.key])
+                        reprimed.add(id(rule))
+
+            for key, previous in changed.items():
+                value = self._values[key]
+                for rule in self._rules.get(key, ()):
+                    if id(rule) in reprimed:
+                        continue
+                    if previous is None:  # First observation of the metric: baseline only
+                        rule.prime(value)
+                        continue
+                    alert = rule.update(value, previous, block_number)
+                    if alert is not None:
+                        alerts.append(alert)
+
+        for alert in alerts:
+            for callback in self._callbacks:
+                try:
+                    callback(alert)
+                except Exception as exc:
+                    print(f"COULD NOT DELIVER ALERT {alert.rule} ({alert.subject}) - {exc}")
+        return alerts
+
+    def attach(self, collector: SnapshotCollector, indexer: VaultEventIndexer = None) -> None:
+        """
+        Observe the metrics of every collector refresh, from the refreshing thread (alerts are delivered before the
+        next block is collected)
+
+        :param collector: The SnapshotCollector to subscribe to
+        :param indexer: (Optional) VaultEventIndexer synced on every refresh, to feed RebalanceOccurred rules
+                        (rebalances are observed once `indexer.confirmations` blocks deep)
+        """
+        def on_refresh(block_number: int, columns: dict) -> None:
+            values = position_values(columns)
+            values.update(vault_values(collector.scanner.vaults))
+            if indexer is not None:
+                values.update(rebalance_values(indexer, collector.scanner.vaults))
+            self.observe(block_number, values)
+
+        collector.add_listener(on_refresh)
+
+
+def position_values(columns: Mapping[str, list]) -> dict[tuple[str, str], float]:
+    """The POSITION_METRICS of PositionScanner.scan_raw() columns, keyed by ("<wallet>/<vault key>", metric)"""
+    metrics = position_metrics(columns)
+    # USD value of one whole share, NaN (not observed) while no shares are owned
+    metrics['share_value'] = share_values([10 ** decimals for decimals in columns['vault_token_decimals']],
+                                          columns['unit_share_value'])
+    metrics['share_value'][metrics['shares'] == 0] = float("nan")
+    values = {}
+    for i, (wallet, key) in enumerate(zip(columns['wallet'], columns['key'])):
+        subject = f"{wallet}/{key}".lower()
+        for name in POSITION_METRICS:
+            values[(subject, name)] = float(metrics[name][i])
+    return values
+
+
+def vault_values(position_keys) -> dict[tuple[str, str], float]:
+    """The VAULT_METRICS of the given vaults (from the cached summary.json), keyed by (vault key, metric)"""
+    registry = get_registry()
+    values = {}
+    for key in position_keys:
+        summary = registry.vault_summary(key)
+        for name, value in (("apr", summary.apr), ("apy", summary.apy), ("tvl", summary.tvl),
+                            ("capacity", summary.capacity), ("available_capacity", summary.capacity - summary.tvl)):
+            values[(key.lower(), name)] = value
+    return values
+
+
+def rebalance_values(indexer: VaultEventIndexer, vaults: Mapping[str, str]) -> dict[tuple[str, str], float]:
+    """
+    Sync the indexer and return the block of the last LogRebalance of each vault (0 if none was indexed yet),
+    keyed by (vault key, metric)
+    """
+    values = {}
+    for key, address in vaults.items():
+        indexer.sync(address)
+        values[(key.lower(), "last_rebalance_block")] = indexer.latest_block(address, "LogRebalance") or 0
+    return values
@@ -0,0 +1,123 @@
+"""
+Vectorized position analytics over many wallet x vault (x timestamp) rows with NumPy.
+
+The inputs are the raw on-chain integers (e.g. PositionScanner.scan_raw() columns), and the metrics use the same
+definitions as PositionSnapshot. Products of 256-bit integers (shares x shareToValue) are computed exactly on Python
+integers before the single conversion to float64. The returned dicts of arrays can be passed to pandas.DataFrame(...).
+"""
+from typing import Mapping, Sequence, Union
+
+from .snapshot import SHARE_VALUE_UNIT
+
+import numpy as np
+
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+ArrayLike = Union[Sequence, np.ndarray]
+
+
+def int_array(values: ArrayLike) -> np.ndarray:
+    """Object array of exact Python integers (None -> 0), safe for uint256 arithmetic"""
+    return np.array([0 if value is None else int(value) for value in values], dtype=object)
+
+
+def float_array(values: ArrayLike) -> np.ndarray:
+    """float64 array (None -> NaN)"""
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def share_values(shares_int: ArrayLike, unit_share_value: ArrayLike) -> np.ndarray:
+    """
+    The USD value of the shares, rounded down in integers like shareToValue() (See PositionSnapshot.shares_usd)
+
+    :param shares_int: Vault shares owned (in share token units)
+    :param unit_share_value: shareToValue(SHARE_VALUE_UNIT) of the vault of each row (18 decimals)
+    :return: float64 array of USD values
+    """
+    value_int = int_array(shares_int) * int_array(unit_share_value) // SHARE_VALUE_UNIT
+    return value_int.astype(np.float64) / 10 ** 18
+
+
+def position_metrics(columns: Mapping[str, ArrayLike]) -> dict[str, np.ndarray]:
+    """
+    Compute the position metrics of every row at once
+
+    :param columns: Column oriented dict with the keys of PositionScanner.scan_raw():
+                    shares_int, vault_token_decimals, unit_share_value, stable_token_decimals, stable_token_price,
+                    avgEntryPrice (None where unknown)
+    :return: Dict of float64 arrays (NaN where the entry price is unknown):
+                * shares: Vault shares owned in decimal format
+                * value: USD value of the shares (PositionSnapshot.shares_usd)
+                * cost_basis: PositionSnapshot.cost_basis (USD paid for the shares owned)
+                * pnl: PositionSnapshot.pnl (value - cost_basis)
+                * roi: pnl / cost_basis
+    """
+    shares = int_array(columns['shares_int']).astype(np.float64) / 10.0 ** float_array(columns['vault_token_decimals'])
+    value = share_values(columns['shares_int'], columns['unit_share_value'])
+
+    entry_share_price = float_array(columns['avgEntryPrice']) / 10.0 ** float_array(columns['stable_token_decimals'])
+    stable_token_price = int_array(columns['stable_token_price']).astype(np.float64) / 10 ** 18
+    cost_basis = stable_token_price * entry_share_price * shares
+    pnl = value - cost_basis
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(cost_basis != 0, pnl / cost_basis, np.nan)
+
+    return {"shares": shares, "value": value, "cost_basis": cost_basis, "pnl": pnl, "roi": roi}
+
+
+def drawdown(values: ArrayLike) -> np.ndarray:
+    """
+    Drawdown from the running peak along the last axis (0 at a new high, 0.25 when 25% below the peak)
+
+    :param values: Array of shape (..., time) - NaN gaps are skipped
+    """
+    values = np.asarray(values, dtype=np.float64)
+    peaks = np.fmax.accumulate(values, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - values / peaks
+
+
+def max_drawdown(values: ArrayLike) -> np.ndarray:
+    """Maximum drawdown of each series along the last axis (See drawdown()) - NaN for series without a known value"""
+    result = drawdown(values)
+    unknown = np.isnan(result)
+    return np.where(unknown.all(axis=-1), np.nan, np.max(np.where(unknown, -np.inf, result), axis=-1))
+
+
+def annualized_yield(values: ArrayLike, timestamps: ArrayLike) -> np.ndarray:
+    """
+    Compounded yearly growth between the first and last known value of each series.
+    Use per-share values (e.g. unit_share_value) rather than position values, so that deposits and withdrawals
+    do not count as yield.
+
+    :param values: Array of shape (..., time) - NaN gaps are skipped
+    :param timestamps: Unix timestamps of shape (time,) or the shape of values
+    :return: Array of shape (...) - NaN for series with less than two known values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.broadcast_to(np.asarray(timestamps, dtype=np.float64), values.shape)
+
+    known = np.isfinite(values)
+    first = np.argmax(known, axis=-1)[..., np.newaxis]
+    last = values.shape[-1] - 1 - np.argmax(known[..., ::-1], axis=-1)[..., np.newaxis]
+
+    growth = np.take_along_axis(values, last, -1) / np.take_along_axis(values, first, -1)
+    elapsed = np.take_along_axis(timestamps, last, -1) - np.take_along_axis(timestamps, first, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(elapsed > 0, growth ** (SECONDS_PER_YEAR / elapsed) - 1, np.nan)
+    return result[..., 0]
+
+
+def exposure(groups: ArrayLike, values: ArrayLike) -> dict[str, float]:
+    """
+    Sum the values per group (e.g. USD exposure per vault key or per wallet)
+
+    :param groups: The group of each row (e.g. the "key" or "wallet" column)
+    :param values: The value of each row (e.g. position_metrics(...)["value"]) - NaN counts as 0
+    :return: Dict of group -> total
+    """
+    names, inverse = np.unique(np.asarray(groups), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.nan_to_num(np.asarray(values, dtype=np.float64)), minlength=len(names))
+    return dict(zip(names.tolist(), totals.tolist()))
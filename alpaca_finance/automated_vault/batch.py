@@ -0,0 +1,267 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from math import floor
+from typing import Optional, Union
+
+from ..util import get_web3_provider, get_strategy_pools, get_vault_addresses, get_chain_id, checksum
+from ..instrumentation import ContextThreadPoolExecutor, instrumented
+from ._config import DEFAULT_BSC_RPC_URL
+from .contracts import DeltaNeutralVault, DeltaNeutralVaultGateway
+from .gas import GasPriceStrategy, get_gas_estimate_cache
+from .multicall import Multicall
+from .price_feed import get_gas_price_feed
+from .receipt import TransactionReceipt
+from .transactions import PendingTransaction, get_nonce_manager, wait_for_all
+
+import web3.contract
+from web3 import Web3
+from attrdict import AttrDict
+
+
+@dataclass
+class WithdrawAction:
+    """Dataclass to model one withdrawal of a BatchExecutor.execute() call"""
+    wallet: str
+    key: str  # The vault key (e.g. "n3x-BNBBUSD-PCS1")
+    strategy: str = "Minimize Trading"  # Minimize Trading or Convert All (see AutomatedVaultPosition.do_withdraw())
+    pct_stable: float = None  # Required by Convert All
+    shares: int = None  # Amount of shares to withdraw, None = close the position (all shares)
+
+
+@dataclass
+class ActionResult:
+    """Dataclass to model the outcome of one WithdrawAction"""
+    action: WithdrawAction
+    shares: int = 0  # The amount of shares withdrawn
+    approval: Optional[PendingTransaction] = None  # Set if the vault token had to be approved first
+    transaction: Optional[PendingTransaction] = None
+    receipt: Union[TransactionReceipt, AttrDict, None] = None
+    error: Optional[str] = None
+
+
+class BatchExecutor:
+    def __init__(self, wallet_keys: dict[str, str], w3_provider: Web3 = None,
+                 gas_price: Union[int, GasPriceStrategy] = 5000000000,
+                 gas_limit: int = 4000000, estimate_gas: bool = True, max_workers: int = 16, batch_size: int = 250):
+        """
+        Withdraws or closes many (wallet, vault) positions at once.
+
+        1. Shares and allowances of every action are read in Multicall3 batches pinned to one block
+        2. Every approval and withdraw transaction is built and signed up front, nonces are allocated locally per wallet
+        3. Wallets broadcast concurrently (each wallet in nonce order), then all receipts are awaited together
+
+        :param wallet_keys: Dict of wallet address -> private key, for every wallet used by the actions
+        :param w3_provider: Web3 provider (optional)
+        :param gas_price: The gasPrice (wei) of every transaction, or a GasPriceStrategy sampled once per execute()
+        :param gas_limit: Gas limit used when gas cannot be estimated (withdrawal following an unmined approval)
+        :param estimate_gas: If False, every transaction uses gas_limit (skips one eth_estimateGas per transaction)
+                             Estimated transactions fail to build if they would revert (estimates fill the GasEstimateCache)
+        :param max_workers: The maximum amount of concurrent RPC requests
+        :param batch_size: The maximum amount of calls per Multicall3 batch
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.wallet_keys = {wallet.lower(): key for wallet, key in wallet_keys.items()}
+        self.gas_price = gas_price
+        self.gas_limit = gas_limit
+        self.estimate_gas = estimate_gas
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        self._vaults = {}  # vault key -> (DeltaNeutralVault, DeltaNeutralVaultGateway)
+        self._gas_price = None
+
+    @instrumented("batch_execute")
+    def execute(self, actions: list[WithdrawAction], wait: bool = True, timeout: float = 120) -> list[ActionResult]:
+        """
+        Prefetch, sign and broadcast every action
+
+        :param actions: The withdrawals to execute
+        :param wait: If True, wait for every transaction to be mined and set ActionResult.receipt
+        :param timeout: Seconds to wait for the receipts - the results of the transactions still pending then have
+                        no receipt and an error, their ActionResult.transaction can still be awaited
+        :return: List of ActionResult objects, in the order of the actions
+        """
+        if get_chain_id(self.w3_provider) != 56:
+            raise ValueError("This package currently supports positions on the Binance Smart Chain (BSC - 56) network only")
+
+        results = [ActionResult(action=action) for action in actions]
+        allowances = self._prefetch(results)
+
+        self._gas_price = self.gas_price if isinstance(self.gas_price, int) else self.gas_price.gas_price(self.w3_provider)
+
+        # Build every transaction (gas estimates run concurrently), grouped per wallet in submission order
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            built = list(executor.map(self._build, results, allowances))
+
+        per_wallet = defaultdict(list)  # wallet -> [(result, "approval" / "transaction", txn)]
+        for result, transactions in zip(results, built):
+            for kind, txn in transactions:
+                per_wallet[result.action.wallet.lower()].append((result, kind, txn))
+
+        price_feed = get_gas_price_feed()
+        price_feed.peek()
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda item: self._send_wallet(*item, price_feed=price_feed), per_wallet.items()))
+
+        if wait:
+            sent = [result for result in results if result.transaction is not None]
+            try:
+                receipts = wait_for_all([result.transaction for result in sent], timeout=timeout)
+            except TimeoutError:
+                # Keep the receipts of the mined transactions, the others are left pending
+                receipts = [result.transaction.result() if result.transaction.done() else None for result in sent]
+
+            for result, receipt in zip(sent, receipts):
+                if receipt is None:
+                    result.error = f"Transaction not mined after {timeout} seconds (still pending)"
+                    continue
+                result.receipt = receipt
+                if not receipt.status:
+                    result.error = "Transaction reverted"
+
+        return results
+
+    def close_all(self, positions: list[tuple[str, str]], strategy: str = "Minimize Trading", pct_stable: float = None,
+                  wait: bool = True, timeout: float = 120) -> list[ActionResult]:
+        """
+        Close every given (wallet, vault key) position with the same strategy
+
+        :return: See self.execute()
+        """
+        return self.execute([WithdrawAction(wallet=wallet, key=key, strategy=strategy, pct_stable=pct_stable)
+                             for wallet, key in positions], wait=wait, timeout=timeout)
+
+    def _contracts(self, key: str) -> tuple[DeltaNeutralVault, DeltaNeutralVaultGateway]:
+        if key.lower() not in self._vaults:
+            pools = {pool['key'].lower(): pool for pool in get_strategy_pools()}
+            if key.lower() not in pools:
+                raise ValueError(f"Could not locate a vault with the key {key}")
+            address = pools[key.lower()]['address']
+            self._vaults[key.lower()] = (DeltaNeutralVault(address, w3_provider=self.w3_provider),
+                                         DeltaNeutralVaultGateway(get_vault_addresses(address)['gateway'],
+                                                                  w3_provider=self.w3_provider))
+        return self._vaults[key.lower()]
+
+    def _spender(self, action: WithdrawAction) -> str:
+        vault, gateway = self._contracts(action.key)
+        return vault.address if action.strategy.lower() == "minimize trading" else gateway.address
+
+    def _prefetch(self, results: list[ActionResult]) -> list[int]:
+        """
+        Read balanceOf and allowance of every action, pinned to the block of the first batch.
+        Sets ActionResult.shares (or ActionResult.error) and returns the allowance of each action (0 if invalid).
+        """
+        allowances = [0] * len(results)
+        valid = []
+        for i, result in enumerate(results):
+            action = result.action
+            if action.wallet.lower() not in self.wallet_keys:
+                result.error = f"No private key for wallet {action.wallet}"
+            elif action.strategy.lower() not in ("minimize trading", "convert all"):
+                result.error = "Invalid strategy - Options are 'Minimize Trading' or 'Convert All'"
+            elif action.strategy.lower() == "convert all" and not (action.pct_stable is not None
+                                                                   and 0.0 <= action.pct_stable <= 1.0):
+                result.error = "Convert All requires a pct_stable value following 0.0 <= pct_stable <= 1.0"
+            else:
+                try:
+                    self._contracts(action.key)
+                    valid.append((i, result))
+                except ValueError as exc:
+                    result.error = str(exc)
+
+        block_number = "latest"
+        per_batch = self.batch_size // 2
+        for i in range(0, len(valid), per_batch):
+            multicall = Multicall(self.w3_provider)
+            for _, result in valid[i:i + per_batch]:
+                vault, _ = self._contracts(result.action.key)
+                wallet = checksum(result.action.wallet)
+                multicall.add(vault.contract.functions.balanceOf(wallet))
+                multicall.add(vault.contract.functions.allowance(wallet, checksum(self._spender(result.action))))
+            block_number, values = multicall.aggregate(block_number)
+
+            for j, (index, result) in enumerate(valid[i:i + per_batch]):
+                balance, allowance = values[j * 2:j * 2 + 2]
+                shares = balance if result.action.shares is None else result.action.shares
+                if shares <= 0 or shares > balance:
+                    result.error = f"Shares owned insufficient to withdraw {shares} shares ({balance} owned)"
+                    continue
+                result.shares = shares
+                allowances[index] = allowance
+
+        return allowances
+
+    def _build(self, result: ActionResult, allowance: int) -> list[tuple[str, dict]]:
+        """Returns the unsigned (kind, transaction) list of the action (empty if the action is invalid)"""
+        if result.error is not None:
+            return []
+
+        action = result.action
+        vault, gateway = self._contracts(action.key)
+        transactions = []
+        if allowance < result.shares:
+            try:
+                transactions.append(("approval", self._build_transaction(
+                    vault.contract.functions.approve(checksum(self._spender(action)), 2 ** 256 - 1), action.wallet)))
+            except Exception as exc:
+                result.error = f"Could not build approval transaction - {exc}"
+                return []
+
+        if action.strategy.lower() == "minimize trading":
+            function_call = vault.withdraw(result.shares)
+        else:
+            function_call = gateway.withdraw(result.shares, stableReturnBps=floor(action.pct_stable * 10000))
+
+        try:
+            transactions.append(("transaction", self._build_transaction(function_call, action.wallet,
+                                                                        estimate=not transactions)))
+        except Exception as exc:
+            result.error = f"Could not build withdraw transaction - {exc}"
+            return []
+        return transactions
+
+    def _build_transaction(self, function_call: web3.contract.ContractFunction, wallet: str,
+                           estimate: bool = True) -> dict:
+        params = {"from": checksum(wallet), "chainId": 56, "gasPrice": self._gas_price}
+        if not (estimate and self.estimate_gas):
+            params["gas"] = self.gas_limit
+
+        # Always estimated (a cached estimate would skip the revert check of eth_estimateGas)
+        txn = function_call.buildTransaction(params)
+        if "gas" not in params:
+            get_gas_estimate_cache().put(function_call, txn["gas"])
+        return txn
+
+    def _send_wallet(self, wallet: str, transactions: list[tuple[ActionResult, str, dict]], price_feed) -> None:
+        """Sign and broadcast the transactions of one wallet in nonce order"""
+        nonce_manager = get_nonce_manager(self.w3_provider, wallet)
+        signed = []
+        for i, (result, kind, txn) in enumerate(transactions):
+            try:
+                txn["nonce"] = nonce_manager.allocate()
+                signed.append((result, kind, txn, self.w3_provider.eth.account.sign_transaction(
+                    txn, private_key=self.wallet_keys[wallet])))
+            except Exception as exc:
+                # Later nonces of this wallet would follow an unused one - do not sign them
+                result.error = result.error or f"Could not sign {kind} - {exc}"
+                for skipped, *_ in transactions[i + 1:]:
+                    skipped.error = skipped.error or f"Not broadcast - {exc}"
+                break
+
+        for i, (result, kind, txn, signed_txn) in enumerate(signed):
+            try:
+                tx_hash = self.w3_provider.eth.send_raw_transaction(signed_txn.rawTransaction)
+            except Exception as exc:
+                # Later nonces of this wallet can no longer be mined - do not send them
+                nonce_manager.resync()
+                for skipped, *_ in signed[i:]:
+                    skipped.error = skipped.error or f"Not broadcast - {exc}"
+                return
+
+            vault, gateway = self._contracts(result.action.key)
+            setattr(result, kind, PendingTransaction(self.w3_provider, tx_hash, nonce=txn["nonce"],
+                                                     gas_price=txn["gasPrice"], price_feed=price_feed,
+                                                     contract_addresses=(vault.address, gateway.address)))
+
+        if len(signed) < len(transactions):
+            nonce_manager.resync()  # The nonce allocated to the transaction that could not be signed is not used
@@ -0,0 +1,227 @@
+"""
+Bulk decoding of the calldata sent to the Delta Neutral Vaults, their gateways and oracles and the controller,
+for flow analysis over large block ranges.
+
+    decoder = TransactionDecoder(w3_provider)
+    for call in decoder.decode_blocks(21000000, 21010000):
+        call.contract, call.function, call.args, call.payload
+
+Blocks and transactions are fetched with batched JSON-RPC requests, calls are dispatched on a 4-byte selector table
+precompiled from the bundled ABIs, and the ABI decoding runs in a process pool while the next batch is fetched.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from os import cpu_count
+from typing import Iterable, Iterator, Optional
+
+from .. import transport
+from ..registry import get_registry
+from ..util import get_web3_provider, load_abi
+from ._config import DEFAULT_BSC_RPC_URL, AUTOMATED_VAULT_CONTROLLER_ADDRESS, DELTA_NEUTRAL_ORACLE_ADDRESS
+
+from eth_abi import decode_abi
+from eth_abi.exceptions import DecodingError
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+from web3._utils.abi import collapse_if_tuple
+
+
+ABI_FILENAMES = ("DeltaNeutralVault.json", "DeltaNeutralVaultGateway.json", "DeltaNeutralOracle.json",
+                 "AutomatedVaultController.json")
+
+# Layout of the inner `_data` payloads (as built by contracts.DeltaNeutralVault and contracts.DeltaNeutralVaultGateway)
+PAYLOAD_TYPES = {("DeltaNeutralVault", "deposit"): ["uint256"],
+                 ("DeltaNeutralVault", "withdraw"): ["uint256", "uint256"],
+                 ("DeltaNeutralVaultGateway", "withdraw"): ["uint256", "uint256"]}
+
+# Transaction fields kept for decoding (the rest is dropped before the transactions are sent to the workers)
+TRANSACTION_FIELDS = ("hash", "blockNumber", "transactionIndex", "from", "to", "value", "input")
+
+
+@dataclass
+class DecodedCall:
+    """Dataclass to model the decoded calldata of one transaction"""
+    transactionHash: str
+    blockNumber: int
+    transactionIndex: int
+    sender: str
+    to: str
+    value: int  # BNB sent (wei)
+    contract: Optional[str]  # ABI name (e.g. DeltaNeutralVaultGateway), None if the selector is unknown
+    function: Optional[str]
+    args: dict
+    payload: Optional[tuple] = None  # The decoded `_data` argument, if its layout is known (See PAYLOAD_TYPES)
+    error: Optional[str] = None  # Set if the calldata does not match the ABI of its selector
+
+
+class CalldataDecoder:
+    def __init__(self, abi_filenames: Iterable[str] = ABI_FILENAMES, contracts: dict[str, str] = None):
+        """
+        Decodes transaction calldata with a 4-byte selector table precompiled from the bundled ABIs,
+        without building web3 contract objects.
+
+        :param abi_filenames: The ABIs (from automated_vault/abi) to build the table from
+        :param contracts: (Optional) Dict of contract address -> ABI name (e.g. "DeltaNeutralVault"), used to pick
+                          the right ABI for selectors shared by several contracts (owner(), withdraw(...), ...)
+        """
+        self.functions = {}  # selector (bytes) -> {ABI name: (function name, [arg names], [arg types])}
+        for abi_filename in abi_filenames:
+            contract = abi_filename.rsplit(".", 1)[0]
+            for item in load_abi(abi_filename):
+                if item["type"] != "function":
+                    continue
+                types = [collapse_if_tuple(i) for i in item["inputs"]]
+                selector = bytes(function_signature_to_4byte_selector(f"{item['name']}({','.join(types)})"))
+                self.functions.setdefault(selector, {})[contract] = (item["name"], [i["name"] for i in item["inputs"]],
+                                                                     types)
+        self.contracts = {address.lower(): name for address, name in (contracts or {}).items()}
+
+    def decode(self, transaction: dict) -> DecodedCall:
+        """
+        Decode a transaction as returned by eth_getTransactionByHash (raw JSON-RPC result, hex quantities)
+
+        :return: DecodedCall object (contract = None if the selector is unknown, error set if the calldata is invalid)
+        """
+        to = (transaction.get("to") or "").lower()
+        call = DecodedCall(transactionHash=transaction["hash"],
+                           blockNumber=_to_int(transaction["blockNumber"]),
+                           transactionIndex=_to_int(transaction["transactionIndex"]),
+                           sender=transaction["from"].lower(), to=to, value=_to_int(transaction["value"]),
+                           contract=None, function=None, args={})
+
+        try:
+            data = bytes.fromhex(transaction["input"][2:])
+        except ValueError as exc:  # Odd length or non-hex input
+            call.error = str(exc)
+            return call
+        candidates = self.functions.get(data[:4])
+        if candidates is None:
+            return call
+
+        call.contract = self.contracts.get(to) if self.contracts.get(to) in candidates else next(iter(candidates))
+        call.function, names, types = candidates[call.contract]
+        try:
+            call.args = dict(zip(names, decode_abi(types, data[4:])))
+            payload_types = PAYLOAD_TYPES.get((call.contract, call.function))
+            if payload_types is not None:
+                call.payload = decode_abi(payload_types, call.args["_data"])
+        except (DecodingError, ValueError, OverflowError, TypeError, KeyError) as exc:
+            call.error = f"{type(exc).__name__}: {exc}"
+        return call
+
+
+class TransactionDecoder:
+    def __init__(self, w3_provider: Web3 = None, contracts: dict[str, str] = None, batch_size: int = 100,
+                 processes: Optional[int] = None, chunk_size: int = 2000):
+        """
+        Streams the decoded calls of every transaction sent to the vault contracts in a block range,
+        or of a list of transaction hashes.
+
+        :param w3_provider: Web3 provider (optional)
+        :param contracts: Dict of contract address -> ABI name of the contracts to decode the transactions of,
+                          default = every vault, gateway and oracle of .mainnet.json and the controller
+        :param batch_size: The amount of blocks/transactions requested per batched JSON-RPC request
+        :param processes: The amount of decoding processes (None = one per CPU, 0 = decode in this process)
+        :param chunk_size: The amount of transactions sent to a decoding process at once
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.contracts = vault_contracts() if contracts is None else {address.lower(): name
+                                                                      for address, name in contracts.items()}
+        self.batch_size = batch_size
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.decoder = CalldataDecoder(contracts=self.contracts)
+
+    def decode_blocks(self, start_block: int, end_block: int) -> Iterator[DecodedCall]:
+        """
+        Decode the transactions sent to self.contracts in the block range, in chain order
+
+        :param start_block: First block of the range
+        :param end_block: Last block of the range (included)
+        :return: Iterator of DecodedCall objects
+        """
+        def transactions() -> Iterator[dict]:
+            for first in range(start_block, end_block + 1, self.batch_size):
+                numbers = range(first, min(first + self.batch_size, end_block + 1))
+                for block in self._batch("eth_getBlockByNumber", [[hex(number), True] for number in numbers]):
+                    if block is None:  # Not produced yet
+                        continue
+                    for transaction in block["transactions"]:
+                        if (transaction.get("to") or "").lower() in self.contracts:
+                            yield {field: transaction[field] for field in TRANSACTION_FIELDS}
+
+        return self._decode(transactions())
+
+    def decode_transactions(self, transaction_hashes: Iterable[str]) -> Iterator[DecodedCall]:
+        """
+        Decode the given transactions (whatever contract they were sent to), in the order of the hashes.
+        Unknown transactions are skipped.
+
+        :param transaction_hashes: The transaction hashes (hex str)
+        :return: Iterator of DecodedCall objects
+        """
+        def transactions() -> Iterator[dict]:
+            hashes = iter(transaction_hashes)
+            while batch := list(islice(hashes, self.batch_size)):
+                for transaction in self._batch("eth_getTransactionByHash", [[h] for h in batch]):
+                    if transaction is not None and transaction.get("blockNumber") is not None:  # Mined
+                        yield {field: transaction[field] for field in TRANSACTION_FIELDS}
+
+        return self._decode(transactions())
+
+    def _decode(self, transactions: Iterator[dict]) -> Iterator[DecodedCall]:
+        chunks = iter(lambda: list(islice(transactions, self.chunk_size)), [])
+        if self.processes == 0:
+            for chunk in chunks:
+                yield from map(self.decoder.decode, chunk)
+            return
+
+        # Keep a bounded amount of chunks in flight: the next ones are fetched while the workers decode
+        processes = self.processes or cpu_count() or 1
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(self.contracts,)) as executor:
+            in_flight = deque()
+            max_in_flight = 2 * processes
+            for chunk in chunks:
+                in_flight.append(executor.submit(_decode_chunk, chunk))
+                while in_flight and (len(in_flight) > max_in_flight or in_flight[0].done()):
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    def _batch(self, method: str, params: list[list]) -> list:
+        """Send the calls in one JSON-RPC batch and return their results"""
+        responses = transport.rpc_batch(self.w3_provider, [(method, p) for p in params])
+        for response in responses:
+            if "error" in response:
+                raise ValueError(f"{method} failed: {response['error']}")
+        return [response["result"] for response in responses]
+
+
+def vault_contracts() -> dict[str, str]:
+    """Returns the address -> ABI name of every vault, gateway and oracle of .mainnet.json and of the controller"""
+    contracts = {AUTOMATED_VAULT_CONTROLLER_ADDRESS.lower(): "AutomatedVaultController",
+                 DELTA_NEUTRAL_ORACLE_ADDRESS.lower(): "DeltaNeutralOracle"}
+    for vault in get_registry().delta_neutral_vaults():
+        contracts[vault['address'].lower()] = "DeltaNeutralVault"
+        for field, name in (("gateway", "DeltaNeutralVaultGateway"), ("oracle", "DeltaNeutralOracle")):
+            if vault.get(field):
+                contracts[vault[field].lower()] = name
+    return contracts
+
+
+def _to_int(value) -> int:
+    return value if isinstance(value, int) else int(value, 16)
+
+
+_worker_decoder = None
+
+
+def _init_worker(contracts: dict[str, str]) -> None:
+    global _worker_decoder
+    _worker_decoder = CalldataDecoder(contracts=contracts)
+
+
+def _decode_chunk(transactions: list[dict]) -> list[DecodedCall]:
+    return [_worker_decoder.decode(transaction) for transaction in transactions]
@@ -0,0 +1,288 @@
+"""
+Long-running collector sharing one fetch pipeline between many consumers.
+
+The collector refreshes the configured wallets and vaults once per block (or every N blocks) with a single
+PositionScanner scan, keeps the latest snapshots in memory as pre-serialized JSON documents and serves them over a
+local HTTP API with ETags. CollectorClient mirrors the AutomatedVaultPosition informational methods on top of it,
+so N consumers cost one upstream fetch.
+
+    alpaca-collector --wallet 0x... --key n3x-BNBBUSD-PCS1 --port 9465
+
+    position = CollectorClient("n3x-BNBBUSD-PCS1", "0x...")
+    position.pnl()
+
+API (GET, JSON, ETag / If-None-Match):
+    /v1/status                      Block number and time of the last refresh, wallets and vault keys
+    /v1/vaults/<key>                The summary.json strategyPools entry of the vault
+    /v1/positions/<wallet>          Every position of the wallet, by vault key
+    /v1/positions/<wallet>/<key>    The PositionSnapshot fields of the position
+"""
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import time
+from typing import Any, Callable, Optional, Union
+import argparse
+import json
+
+from ..block_cache import BlockTracker
+from ..registry import CachedDocument, VaultSummary, get_registry
+from ..util import get_web3_provider
+from ._config import DEFAULT_BSC_RPC_URL, DEFAULT_COLLECTOR_HOST, DEFAULT_COLLECTOR_PORT
+from .portfolio import PositionScanner
+from .snapshot import PositionSnapshot
+
+from web3 import Web3
+from attrdict import AttrDict
+
+
+# PositionSnapshot fields served for every position
+SNAPSHOT_FIELDS = tuple(PositionSnapshot.__dataclass_fields__)
+
+
+class SnapshotCollector:
+    def __init__(self, wallet_addresses: list[str], position_keys: list[str] = None, w3_provider: Web3 = None,
+                 every_blocks: int = 1, poll_interval: float = 3.0, entry_price_interval: float = 300):
+        """
+        :param wallet_addresses: The public wallet addresses to collect
+        :param position_keys: The vault keys to collect (e.g. "n3x-BNBBUSD-PCS1"), default = all summary.json strategyPools
+        :param w3_provider: Web3 provider (optional)
+        :param every_blocks: Refresh the snapshots every `every_blocks` new blocks
+        :param poll_interval: Seconds between two polls of the chain head
+        :param entry_price_interval: Seconds between two refreshes of the avg-entry-prices of the wallets
+                                     (they only change on deposits/withdrawals)
+        """
+        self.scanner = PositionScanner(wallet_addresses, position_keys, w3_provider=w3_provider)
+        self.tracker = BlockTracker(self.scanner.w3_provider, poll_interval)
+        self.every_blocks = every_blocks
+        self.entry_price_interval = entry_price_interval
+
+        self.block_number = None  # Block of the last refresh
+        self.updated = None  # Unix timestamp of the last refresh
+        self._documents = {}  # path -> (JSON body, ETag)
+        self._entry_prices = {}  # (wallet, key) -> avgEntryPrice
+        self._entry_prices_at = 0.0
+        self._refresh_lock = Lock()
+        self._listeners = []
+        self._server = None
+
+    def refresh(self, block_identifier: Union[int, str] = "latest") -> int:
+        """
+        Scan every position and summary.json once and replace the served documents
+
+        :return: The block number the positions were read at
+        """
+        with self._refresh_lock:
+            include_entry_price = time() - self._entry_prices_at >= self.entry_price_interval
+            columns = self.scanner.scan_raw(block_identifier, include_entry_price=include_entry_price)
+            if include_entry_price:
+                self._entry_prices = dict(zip(zip(columns['wallet'], columns['key']), columns['avgEntryPrice']))
+                self._entry_prices_at = time()
+            else:
+                columns['avgEntryPrice'] = [self._entry_prices.get(pair) for pair in zip(columns['wallet'],
+                                                                                         columns['key'])]
+
+            registry = get_registry()
+            documents = {}
+            positions = {}  # wallet -> {key: position}
+            for i, (wallet, key) in enumerate(zip(columns['wallet'], columns['key'])):
+                position = {"wallet": wallet.lower(), "key": key, "address": self.scanner.vaults[key].lower()}
+                position.update((field, columns[field][i]) for field in SNAPSHOT_FIELDS)
+                positions.setdefault(wallet.lower(), {})[key.lower()] = position
+                documents[f"/v1/positions/{wallet.lower()}/{key.lower()}"] = position
+            for wallet, wallet_positions in positions.items():
+                documents[f"/v1/positions/{wallet}"] = wallet_positions
+            for key in self.scanner.vaults:
+                documents[f"/v1/vaults/{key.lower()}"] = registry.strategy_pool(key)
+
+            block_number = columns['blockNumber'][0] if columns['blockNumber'] else self.tracker.current()
+            updated = int(time())
+            documents["/v1/status"] = {"blockNumber": block_number, "updated": updated,
+                                       "wallets": sorted(positions), "vaults": sorted(self.scanner.vaults)}
+
+            # Serialize once per refresh, every request is then served from the same bytes
+            serialized = {}
+            for path, document in documents.items():
+                body = json.dumps(document, separators=(",", ":")).encode()
+                serialized[path] = (body, f'"{sha1(body).hexdigest()}"')
+
+            self._documents = serialized
+            self.block_number, self.updated = block_number, updated
+
+            for listener in list(self._listeners):
+                try:
+                    listener(block_number, columns)
+                except Exception as exc:
+                    print(f"COULD NOT NOTIFY LISTENER OF BLOCK {block_number} - {exc}")
+            return block_number
+
+    def add_listener(self, listener: Callable[[int, dict], Any]) -> None:
+        """
+        Register a callable receiving (block number, PositionScanner.scan_raw() columns) after every refresh,
+        from the refreshing thread (See alerts.AlertEngine.attach())
+        """
+        self._listeners.append(listener)
+
+    def document(self, path: str) -> Optional[tuple[bytes, str]]:
+        """Returns the (JSON body, ETag) served at the given path, None if there is none"""
+        return self._documents.get(path.rstrip("/").lower())
+
+    def start(self, host: str = DEFAULT_COLLECTOR_HOST, port: int = DEFAULT_COLLECTOR_PORT) -> ThreadingHTTPServer:
+        """
+        Refresh once, then serve the snapshots on http://host:port and refresh them from the block tracker thread
+
+        :return: The HTTP server (daemon thread)
+        """
+        if self._server is not None:
+            return self._server
+
+        self.refresh()
+        self.tracker.add_listener(self._on_block)
+        self.tracker.start()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def stop(self) -> None:
+        self.tracker.stop()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _on_block(self, block_number: int) -> None:
+        if self.block_number is not None and block_number < self.block_number + self.every_blocks:
+            return
+        try:
+            self.refresh(block_number)
+        except Exception as exc:
+            print(f"COULD NOT REFRESH THE SNAPSHOTS AT BLOCK {block_number} - {exc}")
+
+    def _handler(self):
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive
+
+            def do_GET(self):
+                document = collector.document(self.path.split("?", 1)[0])
+                if document is None:
+                    return self._send(404, b'{"error":"not found"}')
+                body, etag = document
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", etag)
+                self._send(200, body, etag)
+
+            def _send(self, status: int, body: bytes, etag: str = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class CollectorClient:
+    def __init__(self, position_key: str, owner_wallet_address: str,
+                 url: str = f"http://{DEFAULT_COLLECTOR_HOST}:{DEFAULT_COLLECTOR_PORT}", ttl: float = 1.0):
+        """
+        Read-only AutomatedVaultPosition served by a SnapshotCollector (no RPC or Alpaca API access).
+        Documents are revalidated with If-None-Match at most once per TTL, so an unchanged snapshot costs a 304.
+
+        :param position_key: The vault key (e.g. "n3x-BNBBUSD-PCS1")
+        :param owner_wallet_address: The public wallet address
+        :param url: The base URL of the collector
+        :param ttl: Seconds before a document is revalidated
+        """
+        self.key = position_key
+        self.owner_address = owner_wallet_address
+        self._position = CachedDocument(f"{url}/v1/positions/{owner_wallet_address.lower()}/{position_key.lower()}",
+                                        ttl=ttl)
+        self._vault = CachedDocument(f"{url}/v1/vaults/{position_key.lower()}", ttl=ttl)
+        self._summary = (0, None)  # (document version, VaultSummary)
+
+    @property
+    def address(self) -> str:
+        return self._position.get()['address']
+
+    def get_vault_summary(self) -> AttrDict:
+        """See AutomatedVaultPosition.get_vault_summary()"""
+        return AttrDict(self._vault.get())
+
+    def vault_summary(self) -> VaultSummary:
+        """See AutomatedVaultPosition.vault_summary()"""
+        pool = self._vault.get()
+        if self._summary[0] != self._vault.version:
+            self._summary = (self._vault.version, VaultSummary.from_pool(pool))
+        return self._summary[1]
+
+    def yields(self) -> list[float, float, float, float]:
+        """See AutomatedVaultPosition.yields()"""
+        summary = self.vault_summary()
+        return [summary.aprTradingFeeExcluded, summary.apyTradingFeeExcluded, summary.apr, summary.apy]
+
+    def tvl(self) -> list[float, float]:
+        """See AutomatedVaultPosition.tvl()"""
+        summary = self.vault_summary()
+        return [summary.tvl, summary.tvlIncludingDebt]
+
+    def capacity(self) -> float:
+        return self.vault_summary().capacity
+
+    def snapshot(self) -> PositionSnapshot:
+        """The PositionSnapshot of the last collector refresh"""
+        position = self._position.get()
+        return PositionSnapshot(**{field: position[field] for field in SNAPSHOT_FIELDS})
+
+    def current_value(self) -> float:
+        return self.snapshot().shares_usd
+
+    def pnl(self) -> Optional[float]:
+        return self.snapshot().pnl
+
+    def shares(self) -> tuple[int, float, float]:
+        """See AutomatedVaultPosition.shares()"""
+        snapshot = self.snapshot()
+        return snapshot.shares_int, snapshot.shares, snapshot.shares_usd
+
+    def cost_basis(self) -> Optional[float]:
+        return self.snapshot().cost_basis
+
+
+def main(args: list[str] = None) -> None:
+    """Console entry point (alpaca-collector)"""
+    parser = argparse.ArgumentParser(description="Serve Automated Vault position snapshots to local consumers")
+    parser.add_argument("--wallet", action="append", required=True, help="Wallet address to collect (repeatable)")
+    parser.add_argument("--key", action="append", help="Vault key to collect (repeatable, default = all vaults)")
+    parser.add_argument("--rpc-url", default=DEFAULT_BSC_RPC_URL)
+    parser.add_argument("--host", default=DEFAULT_COLLECTOR_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_COLLECTOR_PORT)
+    parser.add_argument("--every-blocks", type=int, default=1, help="Refresh every N new blocks")
+    parser.add_argument("--poll-interval", type=float, default=3.0, help="Seconds between two chain head polls")
+    parser.add_argument("--entry-price-interval", type=float, default=300,
+                        help="Seconds between two avg-entry-prices refreshes")
+    args = parser.parse_args(args)
+
+    collector = SnapshotCollector(args.wallet, args.key, w3_provider=get_web3_provider(args.rpc_url),
+                                  every_blocks=args.every_blocks, poll_interval=args.poll_interval,
+                                  entry_price_interval=args.entry_price_interval)
+    server = collector.start(args.host, args.port)
+    print(f"Serving {len(collector.scanner.wallets)} wallets x {len(collector.scanner.vaults)} vaults "
+          f"on http://{args.host}:{server.server_address[1]} (block {collector.block_number})")
+    try:
+        Event().wait()
+    except KeyboardInterrupt:
+        collector.stop()
+
+
+if __name__ == "__main__":
+    main()
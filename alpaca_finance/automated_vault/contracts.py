@@ -1,8 +1,8 @@
 from ..util import get_bsc_contract_instance
+from ..registry import get_registry
 from ._config import DELTA_NEUTRAL_ORACLE_ADDRESS, AUTOMATED_VAULT_CONTROLLER_ADDRESS
 # from .work_bytes import WithdrawWorkByte  #  <- Deprecated
 
-import requests
 import web3.contract
 from web3 import Web3
 from bep20.util import checksum
@@ -45,11 +45,11 @@ class DeltaNeutralVault:
 
         self.ACTION_WORK = 1
 
-        r = requests.get("https://raw.githubusercontent.com/alpaca-finance/bsc-alpaca-contract/main/.mainnet.json").json()
+        registry = get_registry()
 
         # Get vault addresses:
         try:
-            self.addresses = list(filter(lambda v: v['address'].lower() == vault_address.lower(), r['DeltaNeutralVaults']))[0]
+            self.addresses = registry.delta_neutral_vault(vault_address)
             """
             E.x.
             "name": "Long 3x BUSD-BTCB PCS2",
@@ -68,14 +68,15 @@ class DeltaNeutralVault:
             "assetVaultPosId": "54752",
             "stableVaultPosId": "5630"
             """
-        except IndexError:
+        except KeyError:
             raise IndexError(f"Could not locate Delta Neutral Vault with address {vault_address}")
 
         # Get strategy addresses:
         # self.partialCloseMinimizeStrat = {"pancakeswap": "0x8dcEC5e136B6321a50F8567588c2f25738D286C2",
         #                                   "biswap": "0x3739d1E01104b019Ff105B3A8F57BC6ed62F18a4"}
-        self.partialCloseMinimizeStrat = {"pancakeswap": r['SharedStrategies']["Pancakeswap"]["StrategyPartialCloseMinimizeTrading"],
-                                          "biswap": r['SharedStrategies']["Biswap"]["StrategyPartialCloseMinimizeTrading"]}
+        shared_strategies = registry.shared_strategies()
+        self.partialCloseMinimizeStrat = {"pancakeswap": shared_strategies["Pancakeswap"]["StrategyPartialCloseMinimizeTrading"],
+                                          "biswap": shared_strategies["Biswap"]["StrategyPartialCloseMinimizeTrading"]}
 
     def invest(self, stableTokenAmount: int, assetTokenAmount: int, shareReceiver: str) -> web3.contract.ContractFunction:
         """Invest the specified token into the vault"""
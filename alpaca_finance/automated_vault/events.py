@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from ..util import load_abi
+
+from eth_abi import decode_abi, decode_single
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3._utils.abi import collapse_if_tuple
+
+
+@dataclass
+class DecodedEvent:
+    """Dataclass to model a decoded contract event log"""
+    event: str
+    address: str
+    blockNumber: int
+    logIndex: int
+    transactionHash: str
+    args: dict
+
+
+class EventDecoder:
+    def __init__(self, abi_filenames: list[str] = ("DeltaNeutralVault.json", "DeltaNeutralVaultGateway.json")):
+        """
+        Decodes raw event logs with decoders precompiled from the bundled ABIs (keyed by topic0),
+        without building web3 contract objects or event filters.
+
+        :param abi_filenames: The ABIs (from automated_vault/abi) to build decoders for
+        """
+        self.decoders = {}  # topic0 (bytes) -> (name, [(indexed arg name, type)], [data arg names], [data arg types])
+        for abi_filename in abi_filenames:
+            for item in load_abi(abi_filename):
+                if item["type"] != "event" or item.get("anonymous"):
+                    continue
+
+                topic = bytes(event_abi_to_log_topic(item))
+                if topic in self.decoders:
+                    continue
+                indexed = [(i["name"], collapse_if_tuple(i)) for i in item["inputs"] if i["indexed"]]
+                data = [i for i in item["inputs"] if not i["indexed"]]
+                self.decoders[topic] = (item["name"], indexed,
+                                        [i["name"] for i in data], [collapse_if_tuple(i) for i in data])
+
+    def topic(self, event_name: str) -> str:
+        """Returns the topic0 (hex) of the given event name"""
+        for topic, (name, *_) in self.decoders.items():
+            if name == event_name:
+                return "0x" + topic.hex()
+        raise KeyError(event_name)
+
+    def decode(self, log: dict) -> Optional[DecodedEvent]:
+        """
+        Decode a log as returned by eth_getLogs or in a transaction receipt
+
+        :return: DecodedEvent object, or None if the log does not match any known event
+        """
+        topics = [HexBytes(topic) for topic in log["topics"]]
+        if not topics or bytes(topics[0]) not in self.decoders:
+            return None
+
+        name, indexed, data_names, data_types = self.decoders[bytes(topics[0])]
+        if len(topics) - 1 != len(indexed):
+            # Same signature but a different indexing (e.g. another token standard) - not one of ours
+            return None
+
+        args = {arg: decode_single(arg_type, bytes(topic)) for (arg, arg_type), topic in zip(indexed, topics[1:])}
+        args.update(zip(data_names, decode_abi(data_types, bytes(HexBytes(log["data"])))))
+
+        return DecodedEvent(event=name,
+                            address=log["address"],
+                            blockNumber=_to_int(log["blockNumber"]),
+                            logIndex=_to_int(log["logIndex"]),
+                            transactionHash=HexBytes(log["transactionHash"]).hex(),
+                            args=args)
+
+
+def _to_int(value: Union[int, str]) -> int:
+    return value if isinstance(value, int) else int(value, 16)
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Union
+
+from ..block_cache import BlockTracker
+from ..registry import get_registry
+from ..util import get_bsc_contract_instance, get_web3_provider, checksum
+from ..instrumentation import instrumented
+from ._config import DEFAULT_BSC_RPC_URL, DELTA_NEUTRAL_ORACLE_ADDRESS
+from .analytics import float_array
+from .multicall import Multicall
+
+import numpy as np
+from web3 import Web3
+
+
+LP_UNIT = 10 ** 18  # LP amount priced with lpToDollar (LP tokens have 18 decimals)
+
+
+@dataclass
+class VaultExposure:
+    """
+    Dataclass to model the exposure of every Delta Neutral Vault at one block, as parallel arrays (one entry per vault).
+    USD amounts are in decimal format, NaN where a call failed.
+    """
+    blockNumber: int
+    symbols: list[str]  # .mainnet.json vault symbols (e.g. n3x-BNBBUSD-PCS1)
+    addresses: list[str]  # Vault addresses (lowercase)
+    stable_equity: np.ndarray  # positionInfo().stablePositionEquity
+    stable_debt: np.ndarray  # positionInfo().stablePositionDebtValue
+    asset_equity: np.ndarray  # positionInfo().assetPositionEquity
+    asset_debt: np.ndarray  # positionInfo().assetPositionDebtValue
+    lp_amount: np.ndarray  # stableLpAmount + assetLpAmount (decimal format)
+    lp_value: np.ndarray  # The LP amount priced with DeltaNeutralOracle.lpToDollar
+    asset_price: np.ndarray  # DeltaNeutralOracle.getTokenPrice(asset token)
+    asset_price_updated: np.ndarray  # Unix timestamp of the last asset price update
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def equity(self) -> np.ndarray:
+        return self.stable_equity + self.asset_equity
+
+    @property
+    def debt(self) -> np.ndarray:
+        return self.stable_debt + self.asset_debt
+
+    @property
+    def position_value(self) -> np.ndarray:
+        """Equity + debt, the value the vault accounts its LP at"""
+        return self.equity + self.debt
+
+    @property
+    def leverage(self) -> np.ndarray:
+        """Position value / equity (e.g. 3.0 for the 3x vaults)"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.equity > 0, self.position_value / self.equity, np.nan)
+
+    @property
+    def debt_ratio(self) -> np.ndarray:
+        """Debt / position value"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.position_value > 0, self.debt / self.position_value, np.nan)
+
+    @property
+    def net_delta(self) -> np.ndarray:
+        """USD exposure to the asset token: the asset half of the LP minus the asset debt (0 = perfectly neutral)"""
+        return self.lp_value / 2 - self.asset_debt
+
+    @property
+    def delta(self) -> np.ndarray:
+        """Net delta as a fraction of the equity (e.g. 0.05 = 5% of the equity moves with the asset price)"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.equity > 0, self.net_delta / self.equity, np.nan)
+
+    @property
+    def net_delta_asset(self) -> np.ndarray:
+        """Net delta in asset tokens"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.net_delta / self.asset_price
+
+    @property
+    def lp_deviation(self) -> np.ndarray:
+        """Oracle value of the LP relative to the position value (drift since the last rebalance/reinvest)"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.position_value > 0, self.lp_value / self.position_value - 1, np.nan)
+
+    def at_risk(self, max_delta: float = 0.05, max_debt_ratio: float = 0.8, max_lp_deviation: float = 0.02) -> list[str]:
+        """
+        Returns the symbols of the vaults outside the given bounds (candidates for a rebalance)
+
+        :param max_delta: Maximum absolute net delta (fraction of the equity)
+        :param max_debt_ratio: Maximum debt ratio
+        :param max_lp_deviation: Maximum absolute LP deviation
+        """
+        with np.errstate(invalid="ignore"):
+            outside = ((np.abs(self.delta) > max_delta) | (self.debt_ratio > max_debt_ratio)
+                       | (np.abs(self.lp_deviation) > max_lp_deviation))
+        return [symbol for symbol, flagged in zip(self.symbols, outside) if flagged]
+
+    def to_columns(self) -> dict[str, list]:
+        """Convert the exposures to a column oriented dict of lists (e.g. for pandas.DataFrame(...) or JSON)"""
+        columns = {"symbol": list(self.symbols), "address": list(self.addresses)}
+        for name in ("equity", "debt", "position_value", "lp_value", "leverage", "debt_ratio", "net_delta", "delta",
+                     "net_delta_asset", "lp_deviation", "asset_price", "asset_price_updated"):
+            columns[name] = getattr(self, name).tolist()
+        return columns
+
+
+class ExposureEngine:
+    def __init__(self, w3_provider: Web3 = None, tracker: BlockTracker = None, max_blocks: int = 64):
+        """
+        Computes the exposure (net delta, leverage, debt ratio, LP drift) of every .mainnet.json Delta Neutral Vault.
+        positionInfo, lpToDollar and getTokenPrice of all vaults are read in one Multicall3 round pinned to a block,
+        the metrics are computed on arrays, and the result is cached per block.
+
+        :param w3_provider: Web3 provider (optional)
+        :param tracker: (Optional) BlockTracker resolving "latest" (e.g. the one of enable_block_cache()), so that
+                        repeated reads within a block cost no request. Required by subscribe().
+        :param max_blocks: Amount of blocks kept in the cache
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.tracker = tracker
+        self.max_blocks = max_blocks
+
+        self._cache = OrderedDict()  # block number -> VaultExposure
+        self._lock = Lock()
+
+        # LP token of each vault, from the summary.json workingToken
+        registry = get_registry()
+        lp_tokens = {summary.address.lower(): summary.workingToken.address
+                     for summary in registry.vault_summaries() if summary.workingToken is not None}
+
+        self.vaults = []  # (symbol, vault contract, oracle contract, asset token, LP token or None)
+        for vault in registry.delta_neutral_vaults():
+            oracle = get_bsc_contract_instance(contract_address=vault.get('oracle') or DELTA_NEUTRAL_ORACLE_ADDRESS,
+                                               abi_filename="DeltaNeutralOracle.json", w3_provider=self.w3_provider)
+            contract = get_bsc_contract_instance(contract_address=vault['address'],
+                                                 abi_filename="DeltaNeutralVault.json", w3_provider=self.w3_provider)
+            lp_token = lp_tokens.get(vault['address'].lower())
+            self.vaults.append((vault.get('symbol', vault['address']), contract, oracle, checksum(vault['assetToken']),
+                                None if lp_token is None else checksum(lp_token)))
+
+    @instrumented("exposure")
+    def exposure(self, block_identifier: Union[int, str] = "latest") -> VaultExposure:
+        """
+        Returns the exposure of every vault at the given block (computed once per block)
+
+        :param block_identifier: Block number, or "latest" (resolved with the tracker, or eth_blockNumber)
+        :return: VaultExposure object
+        """
+        if block_identifier == "latest":
+            block_identifier = self.tracker.current() if self.tracker is not None else self.w3_provider.eth.block_number
+
+        if isinstance(block_identifier, int):
+            with self._lock:
+                if block_identifier in self._cache:
+                    self._cache.move_to_end(block_identifier)
+                    return self._cache[block_identifier]
+
+        exposure = self._read(block_identifier)
+        with self._lock:
+            self._cache[exposure.blockNumber] = exposure
+            while len(self._cache) > self.max_blocks:
+                self._cache.popitem(last=False)
+        return exposure
+
+    def subscribe(self, callback: Callable[[VaultExposure], Any]) -> None:
+        """Call `callback` with the exposure of every new block seen by the tracker (start() the tracker to poll)"""
+        if self.tracker is None:
+            raise ValueError("subscribe() requires an ExposureEngine created with a BlockTracker")
+
+        def on_block(block_number: int) -> None:
+            try:
+                callback(self.exposure(block_number))
+            except Exception as exc:
+                print(f"COULD NOT COMPUTE EXPOSURE AT BLOCK {block_number} - {exc}")
+
+        self.tracker.add_listener(on_block)
+
+    def _read(self, block_identifier: Union[int, str]) -> VaultExposure:
+        multicall = Multicall(self.w3_provider)
+        indexes = []  # (positionInfo, lpToDollar or None, getTokenPrice) result indexes of each vault
+        prices = {}  # (oracle, asset token) -> result index, each price is read once
+        for _, contract, oracle, asset_token, lp_token in self.vaults:
+            info = multicall.add(contract.functions.positionInfo(), allow_failure=True)
+            lp = None if lp_token is None else multicall.add(oracle.functions.lpToDollar(LP_UNIT, lp_token),
+                                                             allow_failure=True)
+            if (oracle.address, asset_token) not in prices:
+                prices[(oracle.address, asset_token)] = multicall.add(oracle.functions.getTokenPrice(asset_token),
+                                                                      allow_failure=True)
+            indexes.append((info, lp, prices[(oracle.address, asset_token)]))
+        block_number, results = multicall.aggregate(block_identifier)
+
+        infos = [results[info] or (None,) * 6 for info, _, _ in indexes]
+        lp_prices = [None if lp is None or results[lp] is None else results[lp][0] for _, lp, _ in indexes]
+        asset_prices = [results[price] or (None, None) for _, _, price in indexes]
+
+        def usd(values: list) -> np.ndarray:
+            return float_array([None if value is None else value / 10 ** 18 for value in values])
+
+        lp_amounts = [None if info[2] is None else info[2] + info[5] for info in infos]
+        lp_values = [None if amount is None or price is None else amount * price // LP_UNIT
+                     for amount, price in zip(lp_amounts, lp_prices)]
+
+        return VaultExposure(blockNumber=block_number,
+                             symbols=[symbol for symbol, *_ in self.vaults],
+                             addresses=[contract.address.lower() for _, contract, *_ in self.vaults],
+                             stable_equity=usd([info[0] for info in infos]),
+                             stable_debt=usd([info[1] for info in infos]),
+                             asset_equity=usd([info[3] for info in infos]),
+                             asset_debt=usd([info[4] for info in infos]),
+                             lp_amount=usd(lp_amounts),
+                             lp_value=usd(lp_values),
+                             asset_price=usd([price for price, _ in asset_prices]),
+                             asset_price_updated=float_array([updated for _, updated in asset_prices]))
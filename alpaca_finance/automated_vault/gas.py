@@ -0,0 +1,158 @@
+from abc import ABC, abstractmethod
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from .. import instrumentation
+
+import web3.contract
+from web3 import Web3
+
+
+class GasPriceStrategy(ABC):
+    def __init__(self, ttl: float = 15):
+        """
+        Base class of a TTL-cached gas price (wei). Subclasses implement sample().
+
+        :param ttl: Seconds a sampled gas price is reused for
+        """
+        self.ttl = ttl
+        self._gas_price = None
+        self._sampled_at = None
+        self._lock = Lock()
+
+    @abstractmethod
+    def sample(self, w3_provider: Web3) -> int:
+        """Returns a freshly sampled gas price in wei (network request)"""
+
+    def gas_price(self, w3_provider: Web3) -> int:
+        """Returns the gas price in wei to send a transaction with, sampling it again once the TTL expired"""
+        with self._lock:
+            if self._sampled_at is None or monotonic() - self._sampled_at > self.ttl:
+                self._gas_price = self.sample(w3_provider)
+                self._sampled_at = monotonic()
+            return self._gas_price
+
+
+class FixedGasPrice(GasPriceStrategy):
+    def __init__(self, gas_price: int = 5000000000):
+        """Always use the given gas price (wei)"""
+        super().__init__(ttl=float("inf"))
+        self.fixed = gas_price
+
+    def sample(self, w3_provider: Web3) -> int:
+        return self.fixed
+
+
+class NodeGasPrice(GasPriceStrategy):
+    def __init__(self, ttl: float = 15, multiplier: float = 1.0, minimum: int = None, maximum: int = None):
+        """
+        Gas price suggested by the node (eth_gasPrice)
+
+        :param ttl: Seconds a sampled gas price is reused for
+        :param multiplier: Factor applied to the suggested price (e.g. 1.1 to outbid by 10%)
+        :param minimum: (Optional) Lower bound in wei
+        :param maximum: (Optional) Upper bound in wei
+        """
+        super().__init__(ttl)
+        self.multiplier = multiplier
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def sample(self, w3_provider: Web3) -> int:
+        return self._bound(int(w3_provider.eth.gas_price * self.multiplier))
+
+    def _bound(self, gas_price: int) -> int:
+        if self.minimum is not None:
+            gas_price = max(self.minimum, gas_price)
+        if self.maximum is not None:
+            gas_price = min(self.maximum, gas_price)
+        return gas_price
+
+
+class FeeHistoryGasPrice(NodeGasPrice):
+    def __init__(self, ttl: float = 15, blocks: int = 20, percentile: float = 50, minimum: int = None,
+                 maximum: int = None):
+        """
+        Gas price sampled from eth_feeHistory: the base fee of the next block plus the median (by default) of the
+        given reward percentile over the last blocks. Transactions are still sent as legacy (gasPrice) transactions.
+        Falls back to eth_gasPrice if the node does not support eth_feeHistory.
+
+        :param ttl: Seconds a sampled gas price is reused for
+        :param blocks: Amount of recent blocks to sample
+        :param percentile: Reward percentile (of the gas used in each block) to sample
+        :param minimum: (Optional) Lower bound in wei
+        :param maximum: (Optional) Upper bound in wei
+        """
+        super().__init__(ttl, minimum=minimum, maximum=maximum)
+        self.blocks = blocks
+        self.percentile = percentile
+
+    def sample(self, w3_provider: Web3) -> int:
+        try:
+            history = w3_provider.eth.fee_history(self.blocks, "latest", [self.percentile])
+        except ValueError:
+            return super().sample(w3_provider)
+
+        rewards = sorted(reward[0] for reward in history['reward'] if reward)
+        if not rewards:
+            return super().sample(w3_provider)
+        return self._bound(history['baseFeePerGas'][-1] + rewards[len(rewards) // 2])
+
+
+class GasEstimateCache:
+    def __init__(self, ttl: float = 3600, margin: float = 1.2):
+        """
+        Caches eth_estimateGas results per (contract, method, arguments), with the integer arguments bucketed by their
+        bit length (powers of 2), since gas rarely depends on the exact amount. Other arguments (addresses, bytes)
+        are part of the key as they are.
+        Estimates are only reused by preflight(), once the eth_call simulation of the call succeeded.
+
+        :param ttl: Seconds an estimate is reused for
+        :param margin: Factor applied to cached estimates, to absorb state changes since they were made
+        """
+        self.ttl = ttl
+        self.margin = margin
+        self._estimates = {}  # key -> (estimate, monotonic time)
+        self._lock = Lock()
+
+    @staticmethod
+    def key(function_call: web3.contract.ContractFunction) -> tuple:
+        return (function_call.address.lower(), function_call.fn_name,
+                tuple(GasEstimateCache._key_arg(arg) for arg in function_call.arguments))
+
+    @staticmethod
+    def _key_arg(arg):
+        if isinstance(arg, bool):
+            return arg
+        if isinstance(arg, int):
+            return "int", arg.bit_length()
+        if isinstance(arg, str):
+            return arg.lower()
+        if isinstance(arg, (bytes, bytearray)):
+            return bytes(arg)
+        if isinstance(arg, (list, tuple)):
+            return tuple(GasEstimateCache._key_arg(item) for item in arg)
+        return repr(arg)
+
+    def get(self, function_call: web3.contract.ContractFunction) -> Optional[int]:
+        """Returns the cached estimate (margin included) of a similar call, None if there is none"""
+        with self._lock:
+            entry = self._estimates.get(self.key(function_call))
+        if entry is None or monotonic() - entry[1] > self.ttl:
+            instrumentation.record_cache("gas_estimates", False)
+            return None
+        instrumentation.record_cache("gas_estimates", True)
+        return int(entry[0] * self.margin)
+
+    def put(self, function_call: web3.contract.ContractFunction, estimate: int) -> None:
+        with self._lock:
+            self._estimates[self.key(function_call)] = (estimate, monotonic())
+
+
+_gas_estimate_cache = GasEstimateCache()
+
+
+def get_gas_estimate_cache() -> GasEstimateCache:
+    """Returns the process-wide GasEstimateCache used by AutomatedVaultPosition and BatchExecutor"""
+    return _gas_estimate_cache
@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import Union
+
+from ..util import get_bsc_contract_instance, get_web3_provider
+from ..instrumentation import ContextThreadPoolExecutor, instrumented
+from ._config import DEFAULT_BSC_RPC_URL, AUTOMATED_VAULT_CONTROLLER_ADDRESS
+from .analytics import int_array, share_values
+from .indexer import VaultEventIndexer, get_vault_event_indexer
+from .multicall import Multicall
+from .snapshot import SHARE_VALUE_UNIT
+
+import numpy as np
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+
+BALANCE_OF_SELECTOR = function_signature_to_4byte_selector("balanceOf(address)")
+TOTAL_CREDIT_SELECTOR = function_signature_to_4byte_selector("totalCredit(address)")
+
+
+@dataclass
+class HolderSnapshot:
+    """Dataclass to model every share holder of one vault at one block, as parallel arrays (one entry per holder)"""
+    vault: str
+    blockNumber: int
+    holders: np.ndarray  # Holder addresses (lowercase)
+    shares_int: np.ndarray  # balanceOf (exact integers, object array)
+    shares: np.ndarray  # Shares in decimal format (float64)
+    value: np.ndarray  # USD value of the shares (float64)
+    credit: np.ndarray  # AutomatedVaultController.totalCredit in USD (float64, NaN if the call failed)
+
+    def __len__(self) -> int:
+        return len(self.holders)
+
+    @property
+    def total_shares(self) -> float:
+        return float(self.shares.sum())
+
+    def share_of_supply(self) -> np.ndarray:
+        """The fraction of the held shares owned by each holder"""
+        total = self.shares.sum()
+        return self.shares / total if total else np.zeros(len(self))
+
+    def top(self, n: int = 10) -> "HolderSnapshot":
+        """Returns a snapshot of the `n` largest holders, largest first"""
+        order = np.argsort(-self.shares, kind="stable")[:n]
+        return HolderSnapshot(vault=self.vault, blockNumber=self.blockNumber, holders=self.holders[order],
+                              shares_int=self.shares_int[order], shares=self.shares[order], value=self.value[order],
+                              credit=self.credit[order])
+
+    def concentration(self) -> dict[str, float]:
+        """
+        :return: Dict containing:
+                    * holders: int
+                    * top10: float (fraction of the shares held by the 10 largest holders)
+                    * hhi: float (Herfindahl-Hirschman index of the share distribution, 1 = a single holder)
+        """
+        fractions = self.share_of_supply()
+        return {"holders": len(self),
+                "top10": float(np.sort(fractions)[::-1][:10].sum()),
+                "hhi": float((fractions ** 2).sum())}
+
+    def to_columns(self) -> dict[str, list]:
+        """Convert the snapshot to a column oriented dict of lists (e.g. for pandas.DataFrame(...) or JSON)"""
+        return {"holder": self.holders.tolist(), "shares_int": self.shares_int.tolist(),
+                "shares": self.shares.tolist(), "value": self.value.tolist(), "credit": self.credit.tolist()}
+
+
+class HolderSnapshotter:
+    def __init__(self, indexer: VaultEventIndexer = None, w3_provider: Web3 = None, batch_size: int = 1000,
+                 max_workers: int = 8):
+        """
+        Snapshots every share holder of a vault: the holder set is derived incrementally from the vault token's
+        Transfer logs (VaultEventIndexer), then balances and controller credits are read in large Multicall3
+        batches pinned to one block. A snapshot costs 1 + ceil(2 x holders / batch_size) eth_calls.
+
+        :param indexer: (Optional) VaultEventIndexer to read the Transfer logs from
+                        (default = the process-wide indexer persisted in the package cache directory)
+        :param w3_provider: Web3 provider (optional)
+        :param batch_size: The maximum amount of calls per Multicall3 batch
+        :param max_workers: The maximum amount of concurrent batches
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.indexer = get_vault_event_indexer(self.w3_provider) if indexer is None else indexer
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.controller = get_bsc_contract_instance(contract_address=AUTOMATED_VAULT_CONTROLLER_ADDRESS,
+                                                    abi_filename="AutomatedVaultController.json",
+                                                    w3_provider=self.w3_provider)
+
+    @instrumented("holder_snapshot")
+    def snapshot(self, vault_address: str, block_identifier: Union[int, str] = None, sync: bool = True,
+                 include_zero: bool = False) -> HolderSnapshot:
+        """
+        Read the balance, value and controller credit of every holder of the vault
+
+        :param vault_address: The Delta Neutral Vault address
+        :param block_identifier: The block to read the balances at, default = the indexer checkpoint, so that the
+                                 holder set is complete for the block read
+        :param sync: If True, index the new Transfer logs of the vault first
+        :param include_zero: If True, keep the past holders whose balance is now 0
+        :return: HolderSnapshot object
+        """
+        if sync:
+            self.indexer.sync(vault_address)
+        if block_identifier is None:
+            block_identifier = self.indexer.checkpoint(vault_address)
+
+        vault = get_bsc_contract_instance(contract_address=vault_address, abi_filename="DeltaNeutralVault.json",
+                                          w3_provider=self.w3_provider)
+        multicall = Multicall(self.w3_provider)
+        multicall.add(vault.functions.decimals())
+        multicall.add(vault.functions.shareToValue(SHARE_VALUE_UNIT))
+        block_number, (decimals, unit_share_value) = multicall.aggregate(block_identifier)
+
+        holders = self.indexer.holders(vault_address)
+        per_batch = max(1, self.batch_size // 2)
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            batches = executor.map(lambda chunk: self._read(vault.address, chunk, block_number),
+                                   [holders[i:i + per_batch] for i in range(0, len(holders), per_batch)])
+            results = [result for batch in batches for result in batch]
+
+        balances = int_array(results[0::2])
+        credits = np.array([np.nan if credit is None else credit / 10 ** 18 for credit in results[1::2]],
+                           dtype=np.float64)
+        holders = np.array(holders, dtype=object)
+        if not include_zero:
+            held = balances != 0
+            balances, credits, holders = balances[held], credits[held], holders[held]
+
+        return HolderSnapshot(vault=vault_address.lower(), blockNumber=block_number, holders=holders,
+                              shares_int=balances, shares=balances.astype(np.float64) / 10.0 ** decimals,
+                              value=share_values(balances, [unit_share_value] * len(balances)), credit=credits)
+
+    def _read(self, vault_address: str, holders: list[str], block_number: int) -> list:
+        # Encoded by hand: web3's per-call validation would dominate the cost of tens of thousands of calls
+        multicall = Multicall(self.w3_provider)
+        for holder in holders:
+            argument = bytes(12) + bytes.fromhex(holder[2:])
+            multicall.add_raw(vault_address, BALANCE_OF_SELECTOR + argument, ["uint256"])
+            multicall.add_raw(self.controller.address, TOTAL_CREDIT_SELECTOR + argument, ["uint256"],
+                              allow_failure=True)
+        return multicall.aggregate(block_number)[1]
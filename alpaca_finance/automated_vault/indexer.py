@@ -0,0 +1,293 @@
+from collections import defaultdict
+from os import makedirs
+from os.path import dirname, expanduser, join
+from threading import Lock
+from typing import Optional, Union
+import json
+import sqlite3
+
+from ..util import get_web3_provider, checksum
+from ..registry import get_registry
+from ..instrumentation import instrumented
+from ._config import DEFAULT_BSC_RPC_URL, DEFAULT_CACHE_DIR
+from .events import EventDecoder
+
+import requests
+from web3 import Web3
+
+
+# DeltaNeutralVault events stored by the indexer
+INDEXED_EVENTS = ("LogDeposit", "LogWithdraw", "LogRebalance", "LogReinvest", "Transfer")
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+DEFAULT_EVENT_DB_PATH = join(DEFAULT_CACHE_DIR, "vault_events.sqlite3")
+
+
+class VaultEventIndexer:
+    def __init__(self, w3_provider: Web3 = None, db_path: str = DEFAULT_EVENT_DB_PATH, initial_chunk_size: int = 5000,
+                 max_chunk_size: int = 50000, confirmations: int = 15):
+        """
+        Incrementally indexes the Deposit/Withdraw/Rebalance/Reinvest/Transfer logs of Delta Neutral Vaults into SQLite.
+
+        Logs are scanned with eth_getLogs from each vault's deployedBlock (.mainnet.json) in adaptive chunks:
+        the chunk size doubles after every successful request and is halved whenever the RPC rejects the range
+        (range/result limits, timeouts). Progress is checkpointed together with the stored logs, so a sync can
+        be interrupted and resumed.
+
+        :param w3_provider: Web3 provider (optional)
+        :param db_path: Path of the SQLite database file (default = in the package cache directory,
+                        ":memory:" = not persisted)
+        :param initial_chunk_size: Amount of blocks requested per eth_getLogs call to begin with
+        :param max_chunk_size: Maximum amount of blocks requested per eth_getLogs call
+        :param confirmations: Blocks behind the chain head that are considered final (and safe to checkpoint)
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.decoder = EventDecoder(["DeltaNeutralVault.json"])
+        self.topics = [self.decoder.topic(event) for event in INDEXED_EVENTS]
+        self.chunk_size = initial_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.confirmations = confirmations
+
+        self._lock = Lock()
+        if db_path != ":memory:":
+            db_path = expanduser(db_path)
+            if dirname(db_path):
+                makedirs(dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS vault_events (
+                vault TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                log_index INTEGER NOT NULL,
+                transaction_hash TEXT NOT NULL,
+                event TEXT NOT NULL,
+                account TEXT,
+                counterparty TEXT,
+                args TEXT NOT NULL,
+                PRIMARY KEY (vault, block_number, log_index)
+            );
+            CREATE INDEX IF NOT EXISTS vault_events_account ON vault_events (vault, account);
+            CREATE INDEX IF NOT EXISTS vault_events_counterparty ON vault_events (vault, counterparty);
+            CREATE INDEX IF NOT EXISTS vault_events_event ON vault_events (vault, event, block_number);
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                vault TEXT PRIMARY KEY,
+                last_block INTEGER NOT NULL
+            );""")
+        self._db.commit()
+
+    def checkpoint(self, vault_address: str) -> int:
+        """Returns the last block indexed for the vault (deployedBlock - 1 if it was never indexed)"""
+        row = self._db.execute("SELECT last_block FROM checkpoints WHERE vault = ?",
+                               (vault_address.lower(),)).fetchone()
+        if row is not None:
+            return row[0]
+        return int(get_registry().delta_neutral_vault(vault_address)['deployedBlock']) - 1
+
+    @instrumented("index_sync")
+    def sync(self, vault_address: str, to_block: Union[int, str] = "latest") -> int:
+        """
+        Index the vault's logs from the last checkpoint up to the given block
+
+        :param vault_address: The Delta Neutral Vault address
+        :param to_block: The last block to index (default = latest - confirmations)
+        :return: The amount of new logs stored
+        """
+        if to_block == "latest":
+            to_block = self.w3_provider.eth.block_number - self.confirmations
+
+        vault_address = vault_address.lower()
+        stored = 0
+        with self._lock:
+            from_block = self.checkpoint(vault_address) + 1
+            while from_block <= to_block:
+                chunk_end = min(to_block, from_block + self.chunk_size - 1)
+                try:
+                    logs = self.w3_provider.eth.get_logs({"address": checksum(vault_address),
+                                                          "fromBlock": from_block,
+                                                          "toBlock": chunk_end,
+                                                          "topics": [self.topics]})
+                except (ValueError, requests.RequestException) as exc:
+                    # Range or result size limit (or timeout): split the range
+                    if self.chunk_size == 1:
+                        raise exc
+                    self.chunk_size = max(1, self.chunk_size // 2)
+                    continue
+
+                stored += self._store(vault_address, logs, chunk_end)
+                from_block = chunk_end + 1
+                self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+
+        return stored
+
+    def sync_all(self, to_block: Union[int, str] = "latest") -> dict[str, int]:
+        """
+        Index every vault listed under "DeltaNeutralVaults" in .mainnet.json up to the same block
+
+        :return: Dict of vault address -> amount of new logs stored
+        """
+        if to_block == "latest":
+            to_block = self.w3_provider.eth.block_number - self.confirmations
+
+        return {vault['address']: self.sync(vault['address'], to_block)
+                for vault in get_registry().delta_neutral_vaults()}
+
+    def events(self, vault_address: str, event: str = None, account: str = None) -> list[dict]:
+        """
+        Return the stored logs of the vault, oldest first
+
+        :param vault_address: The Delta Neutral Vault address
+        :param event: (Optional) Only return logs of this event (e.g. LogDeposit)
+        :param account: (Optional) Only return logs involving this wallet address
+        :return: List of dicts containing: blockNumber, logIndex, transactionHash, event, args
+        """
+        query = "SELECT block_number, log_index, transaction_hash, event, args FROM vault_events WHERE vault = ?"
+        params = [vault_address.lower()]
+        if event is not None:
+            query += " AND event = ?"
+            params.append(event)
+        if account is not None:
+            query += " AND (account = ? OR counterparty = ?)"
+            params += [account.lower(), account.lower()]
+
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY block_number, log_index", params).fetchall()
+
+        return [{"blockNumber": block_number, "logIndex": log_index, "transactionHash": transaction_hash,
+                 "event": name, "args": json.loads(args)}
+                for block_number, log_index, transaction_hash, name, args in rows]
+
+    def latest_block(self, vault_address: str, event: str) -> Optional[int]:
+        """Returns the block of the most recent stored log of the event (e.g. LogRebalance), None if there is none"""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(block_number) FROM vault_events WHERE vault = ? AND event = ?",
+                                   (vault_address.lower(), event)).fetchone()
+        return row[0]
+
+    def holders(self, vault_address: str) -> list[str]:
+        """
+        Return every address that received shares of the vault in the indexed Transfer logs (lowercase),
+        i.e. every address that can hold a nonzero balance up to the checkpoint
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT counterparty FROM vault_events "
+                                    "WHERE vault = ? AND event = 'Transfer' AND counterparty != ?",
+                                    (vault_address.lower(), ZERO_ADDRESS)).fetchall()
+        return [row[0] for row in rows]
+
+    def wallet_flows(self, vault_address: str) -> dict[str, dict]:
+        """
+        Aggregate the stored logs of the vault into per-wallet flows and cost basis.
+
+        The cost basis is the stable and asset token amounts of the LogDeposits attributable to the shares still held,
+        with the average cost method: shares leaving a wallet (withdrawn or transferred) take their proportional part
+        of the cost with them, to the receiving wallet for transfers. It is in token units, not USD (the logs carry
+        no prices), and LogWithdraw only carries the minimum amounts accepted, so withdrawn amounts and realized PnL
+        are not derived.
+
+        :return: Dict of wallet address (lowercase) -> dict containing (integer token/share units):
+                    * deposits: int (amount of deposit transactions)
+                    * withdrawals: int (amount of withdraw transactions)
+                    * stable_deposited: int
+                    * asset_deposited: int
+                    * shares_minted: int
+                    * shares_burned: int
+                    * shares_transferred_in: int (from other wallets)
+                    * shares_transferred_out: int (to other wallets)
+                    * shares: int (current balance according to the indexed logs)
+                    * stable_cost_basis: int (stable tokens deposited for the current shares)
+                    * asset_cost_basis: int (asset tokens deposited for the current shares)
+        """
+        flows = defaultdict(lambda: defaultdict(int))
+
+        def release_cost(flow: dict, shares: int) -> tuple[int, int]:
+            """Remove and return the cost of `shares` leaving the wallet (average cost of its current balance)"""
+            balance = flow["shares"]
+            if balance <= 0:
+                return 0, 0
+            shares = min(shares, balance)
+            stable = flow["stable_cost_basis"] * shares // balance
+            asset = flow["asset_cost_basis"] * shares // balance
+            flow["stable_cost_basis"] -= stable
+            flow["asset_cost_basis"] -= asset
+            return stable, asset
+
+        for log in self.events(vault_address):
+            args = log["args"]
+            if log["event"] == "LogDeposit":
+                wallet = flows[args["_shareReceiver"]]
+                wallet["deposits"] += 1
+                wallet["stable_deposited"] += args["_stableTokenAmount"]
+                wallet["asset_deposited"] += args["_assetTokenAmount"]
+                wallet["stable_cost_basis"] += args["_stableTokenAmount"]
+                wallet["asset_cost_basis"] += args["_assetTokenAmount"]
+            elif log["event"] == "LogWithdraw":
+                flows[args["_shareOwner"]]["withdrawals"] += 1
+            elif log["event"] == "Transfer":
+                sender, receiver, value = args["from"], args["to"], args["value"]
+                if sender == ZERO_ADDRESS:
+                    flows[receiver]["shares_minted"] += value
+                    flows[receiver]["shares"] += value
+                elif receiver == ZERO_ADDRESS:
+                    release_cost(flows[sender], value)
+                    flows[sender]["shares_burned"] += value
+                    flows[sender]["shares"] -= value
+                else:
+                    stable, asset = release_cost(flows[sender], value)
+                    flows[receiver]["stable_cost_basis"] += stable
+                    flows[receiver]["asset_cost_basis"] += asset
+                    flows[sender]["shares_transferred_out"] += value
+                    flows[sender]["shares"] -= value
+                    flows[receiver]["shares_transferred_in"] += value
+                    flows[receiver]["shares"] += value
+
+        keys = ["deposits", "withdrawals", "stable_deposited", "asset_deposited", "shares_minted", "shares_burned",
+                "shares_transferred_in", "shares_transferred_out", "shares", "stable_cost_basis", "asset_cost_basis"]
+        return {wallet: {key: flow[key] for key in keys} for wallet, flow in flows.items() if wallet != ZERO_ADDRESS}
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _store(self, vault_address: str, logs: list, last_block: int) -> int:
+        rows = []
+        for log in logs:
+            decoded = self.decoder.decode(log)
+            if decoded is None:
+                continue
+            args = {key: value.lower() if isinstance(value, str) else value for key, value in decoded.args.items()}
+            if decoded.event == "Transfer":
+                account, counterparty = args["from"], args["to"]
+            else:
+                account, counterparty = args.get("_shareReceiver", args.get("_shareOwner")), None
+            rows.append((vault_address, decoded.blockNumber, decoded.logIndex, decoded.transactionHash,
+                         decoded.event, account, counterparty, json.dumps(args)))
+
+        # Logs and checkpoint are committed together, so an interrupted sync resumes from a consistent state
+        with self._db:
+            cursor = self._db.executemany("INSERT OR IGNORE INTO vault_events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO checkpoints (vault, last_block) VALUES (?, ?)",
+                             (vault_address, last_block))
+        return cursor.rowcount if rows else 0
+
+
+
+_default_indexer = None
+_default_indexer_lock = Lock()
+
+
+def get_vault_event_indexer(w3_provider: Web3 = None) -> VaultEventIndexer:
+    """
+    Returns the process-wide VaultEventIndexer, stored at DEFAULT_EVENT_DB_PATH (in memory if the cache directory
+    is not writable)
+
+    :param w3_provider: Web3 provider the indexer is created with on the first call (optional)
+    """
+    global _default_indexer
+    with _default_indexer_lock:
+        if _default_indexer is None:
+            try:
+                _default_indexer = VaultEventIndexer(w3_provider)
+            except (OSError, sqlite3.Error) as exc:
+                print(f"COULD NOT OPEN THE VAULT EVENT INDEX AT {DEFAULT_EVENT_DB_PATH} - {exc}")
+                _default_indexer = VaultEventIndexer(w3_provider, db_path=":memory:")
+        return _default_indexer
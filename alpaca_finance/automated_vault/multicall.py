@@ -0,0 +1,104 @@
+from typing import Union
+
+from ..util import get_bsc_contract_instance
+from ._config import MULTICALL3_ADDRESS
+
+import web3.contract
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from eth_abi import decode_abi, encode_abi
+from eth_utils import function_signature_to_4byte_selector
+from hexbytes import HexBytes
+
+
+AGGREGATE3_SELECTOR = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+GET_BLOCK_NUMBER_CALLDATA = function_signature_to_4byte_selector("getBlockNumber()")
+
+
+class Multicall:
+    def __init__(self, w3_provider: Web3 = None):
+        """
+        Batches view calls into a single Multicall3.aggregate3() eth_call so that every result is read
+        from the same block in one RPC round-trip.
+
+        :param w3_provider: Web3 provider (optional)
+        """
+        self.contract = get_bsc_contract_instance(contract_address=MULTICALL3_ADDRESS,
+                                                  abi_filename="Multicall3.json", w3_provider=w3_provider)
+        self._calls = []
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def add(self, function_call: web3.contract.ContractFunction, allow_failure: bool = False) -> int:
+        """
+        Queue a prepared view function to be read in the batch
+
+        :param function_call: The uncalled and prepared contract method (e.g. contract.functions.balanceOf(addr))
+        :param allow_failure: If True, a revert only yields None for this call instead of reverting the whole batch
+        :return: The index of the call's result in the list returned by self.aggregate()
+        """
+        self._calls.append((function_call.address, allow_failure,
+                            bytes(HexBytes(function_call._encode_transaction_data())), function_call))
+        return len(self._calls) - 1
+
+    def add_raw(self, target: str, calldata: bytes, output_types: list[str], allow_failure: bool = False) -> int:
+        """
+        Queue an already ABI-encoded call. Skips web3's per-call argument validation and encoding, which dominates
+        the cost of batches of thousands of calls.
+
+        :param target: The checksum address of the contract to call
+        :param calldata: The 4-byte selector followed by the encoded arguments
+        :param output_types: The ABI types of the return values (e.g. ["uint256"])
+        :param allow_failure: If True, a revert only yields None for this call instead of reverting the whole batch
+        :return: The index of the call's result in the list returned by self.aggregate()
+        """
+        self._calls.append((target, allow_failure, calldata, output_types))
+        return len(self._calls) - 1
+
+    def aggregate(self, block_identifier: Union[int, str] = "latest") -> tuple[int, list]:
+        """
+        Execute all queued calls in a single eth_call pinned to one block
+
+        :param block_identifier: The block to read from (block number, "latest", "pending", ...)
+        :return: (
+            block number the results were read at,
+            decoded results in the order they were added (single values are unwrapped like ContractFunction.call())
+        )
+        """
+        # The aggregate3 calldata is encoded here with eth_abi, instead of by a validated ContractFunction call
+        calldata = AGGREGATE3_SELECTOR + encode_abi(["(address,bool,bytes)[]"], [self._aggregate3_calls()])
+        data = self.contract.web3.eth.call({"to": MULTICALL3_ADDRESS, "data": "0x" + calldata.hex()}, block_identifier)
+        return self.decode(decode_abi(["(bool,bytes)[]"], data)[0])
+
+    def prepare(self) -> web3.contract.ContractFunction:
+        """Returns the uncalled aggregate3 ContractFunction for all queued calls (prefixed by getBlockNumber)"""
+        return self.contract.functions.aggregate3(self._aggregate3_calls())
+
+    def decode(self, response: list) -> tuple[int, list]:
+        """Decode the (success, returnData) list returned by the aggregate3 ContractFunction from self.prepare()"""
+        block_number = decode_abi(["uint256"], response[0][1])[0]
+        # A call allowed to fail that returned nothing (e.g. to an address without code) failed as well
+        return block_number, [_decode_output(decoder, data) if success and (data or not allow_failure) else None
+                              for (_, allow_failure, _, decoder), (success, data) in zip(self._calls, response[1:])]
+
+    def _aggregate3_calls(self) -> list[tuple]:
+        calls = [(MULTICALL3_ADDRESS, False, GET_BLOCK_NUMBER_CALLDATA)]
+        calls += [(target, allow_failure, calldata) for target, allow_failure, calldata, _ in self._calls]
+        return calls
+
+
+def _decode_output(decoder: Union[web3.contract.ContractFunction, list[str]], data: bytes):
+    if isinstance(decoder, list):
+        decoded = decode_abi(decoder, data)
+        return decoded[0] if len(decoded) == 1 else list(decoded)
+    return decode_function_output(decoder, data)
+
+
+def decode_function_output(function_call: web3.contract.ContractFunction, data: bytes):
+    """Decode raw eth_call return data the same way ContractFunction.call() does"""
+    output_types = get_abi_output_types(function_call.abi)
+    decoded = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decode_abi(output_types, data))
+
+    return decoded[0] if len(decoded) == 1 else list(decoded)
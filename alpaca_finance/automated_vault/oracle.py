@@ -1,6 +1,17 @@
-import requests
+from .. import transport
+
+import aiohttp
+
+
+ETH_PRICE_URL = "https://api.binance.com/api/v3/avgPrice?symbol=ETHUSDT"
 
 
 def get_eth_price() -> float:
     """Returns the realtime price of ETH in USD"""
-    return float(requests.get("https://api.binance.com/api/v3/avgPrice?symbol=ETHUSDT").json()["price"])
\ No newline at end of file
+    return float(transport.get_json(ETH_PRICE_URL)["price"])
+
+
+async def get_eth_price_async(session: aiohttp.ClientSession) -> float:
+    """Async counterpart of get_eth_price() using the given aiohttp session"""
+    async with session.get(ETH_PRICE_URL) as r:
+        return float((await r.json(content_type=None))["price"])
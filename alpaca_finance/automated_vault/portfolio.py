@@ -0,0 +1,191 @@
+from dataclasses import dataclass, asdict
+from math import log10
+from typing import Optional, Union
+
+from ..util import get_bsc_contract_instance, get_entry_prices, get_strategy_pools, get_web3_provider, checksum
+from ..instrumentation import ContextThreadPoolExecutor, instrumented
+from ._config import DEFAULT_BSC_RPC_URL, DELTA_NEUTRAL_ORACLE_ADDRESS
+from .multicall import Multicall
+from .snapshot import PositionSnapshot, SHARE_VALUE_UNIT
+
+from web3 import Web3
+
+
+@dataclass
+class PositionRow:
+    """Dataclass to model a single (wallet, vault) row of a PositionScanner.scan() result"""
+    wallet: str
+    key: str
+    address: str
+    blockNumber: int
+    shares_int: int
+    shares: float
+    shares_usd: float
+    avgEntryPrice: Optional[int]
+    cost_basis: Optional[float]
+    pnl: Optional[float]
+
+
+class PositionScanner:
+    def __init__(self, wallet_addresses: list[str], position_keys: list[str] = None, w3_provider: Web3 = None,
+                 max_workers: int = 16, batch_size: int = 250):
+        """
+        Refreshes many wallets across many Automated Vaults at once.
+        All (wallet, vault) pairs share one provider and one set of contract objects, on-chain reads are packed into
+        Multicall3 batches pinned to the same block, and the batches and entry price requests run in a thread pool.
+
+        :param wallet_addresses: The public wallet addresses to scan
+        :param position_keys: The vault keys to scan (e.g. "n3x-BNBBUSD-PCS1"), default = all summary.json strategyPools
+        :param w3_provider: Web3 provider (optional)
+        :param max_workers: The maximum amount of concurrent RPC/REST requests
+        :param batch_size: The maximum amount of balanceOf calls per Multicall3 batch
+        """
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+        self.wallets = [checksum(wallet) for wallet in wallet_addresses]
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        pools = get_strategy_pools()
+        if position_keys is None:
+            self.vaults = {pool['key']: pool['address'] for pool in pools}
+        else:
+            pools = {pool['key'].lower(): pool for pool in pools}
+            try:
+                self.vaults = {pools[key.lower()]['key']: pools[key.lower()]['address'] for key in position_keys}
+            except KeyError as exc:
+                raise ValueError(f"Could not locate a vault with the key {exc}")
+
+        self.oracle = get_bsc_contract_instance(contract_address=DELTA_NEUTRAL_ORACLE_ADDRESS,
+                                                abi_filename="DeltaNeutralOracle.json", w3_provider=self.w3_provider)
+        self.contracts = {key: get_bsc_contract_instance(contract_address=address, abi_filename="DeltaNeutralVault.json",
+                                                         w3_provider=self.w3_provider)
+                          for key, address in self.vaults.items()}
+        self.failed_vaults = []  # Keys of the vaults left out of the last scan because their reads reverted
+
+    @instrumented("scan")
+    def scan(self, block_identifier: Union[int, str] = "latest", include_entry_price: bool = True) -> list[PositionRow]:
+        """
+        Fetch the balances, share values and entry prices for every (wallet, vault) pair
+
+        :param block_identifier: The block to read the positions at (default = latest)
+        :param include_entry_price: If True, also fetch each wallet's avgEntryPrices from the Alpaca API
+
+        :return: List of PositionRow objects (one row per wallet per vault)
+        """
+        columns = self.scan_raw(block_identifier, include_entry_price)
+
+        rows = []
+        for i, (wallet, key) in enumerate(zip(columns['wallet'], columns['key'])):
+            snapshot = PositionSnapshot(blockNumber=columns['blockNumber'][i],
+                                        shares_int=columns['shares_int'][i],
+                                        vault_token_decimals=columns['vault_token_decimals'][i],
+                                        unit_share_value=columns['unit_share_value'][i],
+                                        stable_token_decimals=columns['stable_token_decimals'][i],
+                                        stable_token_price=columns['stable_token_price'][i],
+                                        avgEntryPrice=columns['avgEntryPrice'][i])
+            rows.append(PositionRow(wallet=wallet, key=key, address=self.vaults[key], blockNumber=snapshot.blockNumber,
+                                    shares_int=snapshot.shares_int, shares=snapshot.shares,
+                                    shares_usd=snapshot.shares_usd, avgEntryPrice=snapshot.avgEntryPrice,
+                                    cost_basis=snapshot.cost_basis, pnl=snapshot.pnl))
+
+        return rows
+
+    @instrumented("scan_raw")
+    def scan_raw(self, block_identifier: Union[int, str] = "latest", include_entry_price: bool = True) -> dict[str, list]:
+        """
+        Fetch the raw on-chain integers of every (wallet, vault) pair, without computing any metric
+        (See alpaca_finance.automated_vault.analytics.position_metrics() to compute them in batch)
+
+        :param block_identifier: The block to read the positions at (default = latest)
+        :param include_entry_price: If True, also fetch each wallet's avgEntryPrices from the Alpaca API
+
+        :return: Column oriented dict (one entry per wallet per vault) with the keys:
+                 wallet, key, blockNumber, shares_int, vault_token_decimals, unit_share_value,
+                 stable_token_decimals, stable_token_price, avgEntryPrice (None if unknown).
+                 Vaults whose reads reverted (e.g. retired vaults) are left out, see self.failed_vaults.
+        """
+        block_number, vaults = self._vault_data(block_identifier)
+        pairs = [(wallet, key) for wallet in self.wallets for key in vaults]
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            entry_prices = executor.map(self._entry_prices, self.wallets) if include_entry_price else None
+            balances = executor.map(lambda chunk: self._balances(chunk, block_number),
+                                    [pairs[i:i + self.batch_size] for i in range(0, len(pairs), self.batch_size)])
+
+            balances = [balance for chunk in balances for balance in chunk]
+            entry_prices = dict(zip(self.wallets, entry_prices)) if include_entry_price else {}
+
+        return {"wallet": [wallet for wallet, _ in pairs],
+                "key": [key for _, key in pairs],
+                "blockNumber": [block_number] * len(pairs),
+                "shares_int": balances,
+                "vault_token_decimals": [vaults[key]['decimals'] for _, key in pairs],
+                "unit_share_value": [vaults[key]['unit_share_value'] for _, key in pairs],
+                "stable_token_decimals": [vaults[key]['stable_token_decimals'] for _, key in pairs],
+                "stable_token_price": [vaults[key]['stable_token_price'] for _, key in pairs],
+                "avgEntryPrice": [entry_prices.get(wallet, {}).get(self.vaults[key].lower()) for wallet, key in pairs]}
+
+    @staticmethod
+    def to_columns(rows: list[PositionRow]) -> dict[str, list]:
+        """Convert the rows returned by self.scan() to a column oriented dict (e.g. for pandas.DataFrame(...))"""
+        columns = {name: [] for name in PositionRow.__dataclass_fields__}
+        for row in rows:
+            for name, value in asdict(row).items():
+                columns[name].append(value)
+
+        return columns
+
+    def _vault_data(self, block_identifier: Union[int, str]) -> tuple[int, dict]:
+        """Read the per-vault values shared by all wallets, and resolve the block every other batch is pinned to"""
+        # Every read may fail on its own, so that one retired or incompatible vault does not revert the whole batch
+        multicall = Multicall(self.w3_provider)
+        for contract in self.contracts.values():
+            multicall.add(contract.functions.decimals(), allow_failure=True)
+            multicall.add(contract.functions.shareToValue(SHARE_VALUE_UNIT), allow_failure=True)
+            multicall.add(contract.functions.stableToken(), allow_failure=True)
+            multicall.add(contract.functions.stableTo18ConversionFactor(), allow_failure=True)
+        block_number, results = multicall.aggregate(block_identifier)
+
+        vaults = {}
+        for i, key in enumerate(self.contracts):
+            decimals, unit_share_value, stable_token, conversion_factor = results[i * 4:i * 4 + 4]
+            if None in (decimals, unit_share_value, stable_token) or not conversion_factor:
+                continue
+            vaults[key] = {"decimals": decimals,
+                           "unit_share_value": unit_share_value,
+                           "stable_token": stable_token,
+                           "stable_token_decimals": 18 - round(log10(conversion_factor))}
+
+        # Price each distinct stable token once:
+        stable_tokens = list({vault['stable_token'] for vault in vaults.values()})
+        multicall = Multicall(self.w3_provider)
+        for token in stable_tokens:
+            multicall.add(self.oracle.functions.getTokenPrice(token), allow_failure=True)
+        _, prices = multicall.aggregate(block_number)
+
+        prices = {token: price[0] for token, price in zip(stable_tokens, prices) if price is not None}
+        for key in list(vaults):
+            if vaults[key]['stable_token'] not in prices:
+                del vaults[key]
+            else:
+                vaults[key]['stable_token_price'] = prices[vaults[key]['stable_token']]
+
+        failed_vaults = [key for key in self.contracts if key not in vaults]
+        if failed_vaults != self.failed_vaults:
+            for key in set(failed_vaults) - set(self.failed_vaults):
+                print(f"COULD NOT READ VAULT {key} ({self.vaults[key]}) - SKIPPED")
+            self.failed_vaults = failed_vaults
+
+        return block_number, vaults
+
+    def _balances(self, pairs: list[tuple[str, str]], block_number: int) -> list[int]:
+        multicall = Multicall(self.w3_provider)
+        for wallet, key in pairs:
+            multicall.add(self.contracts[key].functions.balanceOf(wallet))
+
+        return multicall.aggregate(block_number)[1]
+
+    @staticmethod
+    def _entry_prices(wallet_address: str) -> dict[str, int]:
+        return {data['strategyPoolAddress'].lower(): int(data['avgEntryPrice'])
+                for data in get_entry_prices(wallet_address)}
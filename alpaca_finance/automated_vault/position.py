@@ -1,13 +1,22 @@
 from typing import Union, Optional
+from functools import cached_property
 from math import floor
 
-from ..util import get_entry_prices, get_web3_provider, get_vault_addresses, checksum
+from ..util import get_entry_prices, get_web3_provider, get_vault_addresses, get_chain_id, checksum
+from ..registry import get_registry, VaultSummary
+from ..instrumentation import instrumented
 from ._config import DEFAULT_BSC_RPC_URL
-from .receipt import TransactionReceipt, build_receipt
+from .receipt import TransactionReceipt
+from .price_feed import OnChainPriceFeed, get_gas_price_feed
+from .transactions import NonceManager, PendingTransaction, get_nonce_manager
+from .gas import GasPriceStrategy, get_gas_estimate_cache
+from .preflight import PreflightResult, preflight
+from .multicall import Multicall
+from .snapshot import PositionSnapshot, SHARE_VALUE_UNIT
+from .rebalance import RebalanceHistory, get_rebalance_history
 from .contracts import DeltaNeutralVault, DeltaNeutralOracle, AutomatedVaultController, DeltaNeutralVaultGateway
 
 from eth_abi import decode_abi
-import requests
 import web3.contract
 from web3 import Web3
 from web3.constants import MAX_INT
@@ -21,134 +30,193 @@ class AutomatedVaultPosition:
             self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL)
         else:
             self.w3_provider = w3_provider
-        if self.w3_provider.eth.chainId != 56:
-            raise ValueError("This package currently supports positions on the Binance Smart Chain (BSC - 56) network only")
 
-        summary = self.get_vault_summary(position_key.lower())
+        summary = self.vault_summary(position_key.lower())
 
         self.owner_address = owner_wallet_address
         self.owner_key = owner_wallet_key
 
         # Store position metadata
-        self.key = summary['key']
-        self.name = summary['name']
-        self.address = summary['address'].lower()
+        self.key = summary.key
+        self.name = summary.name
+        self.address = summary.address.lower()
         self.vault_type = "neutral" if self.key.startswith("n") else "long/savings"
-        self.bep20_vault_token = BEP20Token(self.address, self.w3_provider)
-
-        # Relevant contracts to control the vault and get data
-        self.oracle = DeltaNeutralOracle(self.w3_provider)
-        self.vault = DeltaNeutralVault(self.address, self.w3_provider)
-        self.controller = AutomatedVaultController(self.w3_provider)
-        self.gateway = DeltaNeutralVaultGateway(get_vault_addresses(self.address)['gateway'], self.w3_provider)
 
-        # Set the vault tokens for reference
-        self.stable_token = BEP20Token(self.vault.stableTokenAddress(), self.w3_provider)
-        self.asset_token = BEP20Token(self.vault.assetTokenAddress(), self.w3_provider)
+        # Contract addresses (gateway, stableToken, assetToken, ...) from .mainnet.json
+        self.addresses = get_vault_addresses(self.address)
 
         # If True, enables the allowance verification and automatic approval of tokens before transactions
         self.auto_token_approval = False
 
         # Specify custom web3 transaction gasPrice parameter for the BSC transactions
         self.gasPrice = 5000000000
+        # (Optional) Sample the gasPrice instead, e.g. NodeGasPrice() or FeeHistoryGasPrice() from .gas
+        self.gas_price_strategy: Optional[GasPriceStrategy] = None
+
+        # If True, deposits and withdrawals are simulated (eth_call at the pending block) together with the balance
+        # and allowance checks before being sent, and TransactionRevert is raised instead of broadcasting a revert
+        self.preflight = False
+
+        # Gas limit of a deposit/withdraw sent right after an approval that is not mined yet
+        # (gas cannot be estimated until the allowance exists on-chain)
+        self.pipelinedGasLimit = 4000000
+
+    """ ------------- Relevant contracts to control the vault and get data (built on first access) ------------- """
+
+    @cached_property
+    def nonce_manager(self) -> NonceManager:
+        """Local nonce counter of the owner wallet (shared by all positions of the wallet on this provider)"""
+        return get_nonce_manager(self.w3_provider, self.owner_address)
+
+    @cached_property
+    def bep20_vault_token(self) -> BEP20Token:
+        return BEP20Token(self.address, self.w3_provider)
+
+    @cached_property
+    def oracle(self) -> DeltaNeutralOracle:
+        return DeltaNeutralOracle(self.w3_provider)
+
+    @cached_property
+    def vault(self) -> DeltaNeutralVault:
+        return DeltaNeutralVault(self.address, self.w3_provider)
+
+    @cached_property
+    def controller(self) -> AutomatedVaultController:
+        return AutomatedVaultController(self.w3_provider)
+
+    @cached_property
+    def gateway(self) -> DeltaNeutralVaultGateway:
+        return DeltaNeutralVaultGateway(self.addresses['gateway'], self.w3_provider)
+
+    @cached_property
+    def stable_token(self) -> BEP20Token:
+        """The vault stable token (for reference)"""
+        return BEP20Token(checksum(self.addresses['stableToken']), self.w3_provider)
+
+    @cached_property
+    def asset_token(self) -> BEP20Token:
+        """The vault asset token (for reference)"""
+        return BEP20Token(checksum(self.addresses['assetToken']), self.w3_provider)
 
     """ ------------------ Transactional Methods (Requires private wallet key) ------------------ """
 
-    def do_invest(self, stable_token_amt: int = 0, asset_token_amt: int = 0) -> TransactionReceipt:
+    @instrumented("do_invest")
+    def do_invest(self, stable_token_amt: int = 0, asset_token_amt: int = 0,
+                  wait: bool = True) -> Union[TransactionReceipt, PendingTransaction]:
         """
         Invest the specified amount of each token into the Automated Vault.
         Use self.asset_token and self.stable_token to identify the underlying assets.
+        Token approvals (if self.auto_token_approval) are sent back-to-back with the deposit, without waiting for them to be mined.
 
         :param stable_token_amt: The amount of stable token to deposit
         :param asset_token_amt: The amount of asset token to deposit
+        :param wait: If False, return a PendingTransaction handle as soon as the deposit is broadcast
 
-        :return: TransactionReceipt object
+        :return: TransactionReceipt object (PendingTransaction if wait is False)
         """
         assert stable_token_amt > 0 or asset_token_amt > 0, \
             "Please provide an investment value for either the stable or asset tokens"
 
-        txn_nonce = self._get_nonce()
+        deposit = self.vault.invest(stable_token_amt, asset_token_amt, shareReceiver=self.owner_address)
+        tokens = [(token, amount) for token, amount in ((self.stable_token, stable_token_amt),
+                                                        (self.asset_token, asset_token_amt)) if amount > 0]
+
+        check = None
+        if self.preflight:
+            # Balances and allowances are read in the same round-trip as the deposit simulation
+            reads = Multicall(self.w3_provider)
+            for token, _ in tokens:
+                reads.add(token.contract.functions.balanceOf(checksum(self.owner_address)))
+                reads.add(token.contract.functions.allowance(checksum(self.owner_address), checksum(self.address)))
+            check = preflight(self.w3_provider, deposit, self.owner_address, reads, get_gas_estimate_cache())
+            balances, allowances = check.reads[0::2], check.reads[1::2]
+        else:
+            balances = [token.balanceOf(self.owner_address) for token, _ in tokens]
+            allowances = [None] * len(tokens)
 
         # Ensure that allowances match desired investment amount
-        if stable_token_amt > 0:
-            token_bal = self.stable_token.balanceOf(self.owner_address)
-            assert token_bal >= stable_token_amt, \
-                f"Insufficient funds to invest {stable_token_amt} {self.stable_token.symbol()} ({token_bal} Owned)"
+        approvals = []
+        for (token, amount), token_bal, allowance in zip(tokens, balances, allowances):
+            assert token_bal >= amount, \
+                f"Insufficient funds to invest {amount} {token.symbol()} ({token_bal} Owned)"
             if self.auto_token_approval:
-                if self.do_approve_token(self.stable_token) is not None:
-                    txn_nonce += 1
-        if asset_token_amt > 0:
-            token_bal = self.asset_token.balanceOf(self.owner_address)
-            assert token_bal >= asset_token_amt, \
-                f"Insufficient funds to invest {asset_token_amt} {self.asset_token.symbol()} ({token_bal} Owned)"
-            if self.auto_token_approval:
-                if self.do_approve_token(self.asset_token) is not None:
-                    txn_nonce += 1
+                approvals.append(self._approve_if_needed(token, self.address, amount, allowance))
 
-        return self._execute(self.vault.invest(stable_token_amt, asset_token_amt, shareReceiver=self.owner_address),
-                             _nonce=txn_nonce)
+        return self._execute(deposit, gas=self._transaction_gas(deposit, check, any(approvals)), wait=wait)
 
-    def do_withdraw(self, shares: int, pct_stable: float = None, strategy: str = "Minimize Trading") -> TransactionReceipt:
+    @instrumented("do_withdraw")
+    def do_withdraw(self, shares: int, pct_stable: float = None, strategy: str = "Minimize Trading",
+                    wait: bool = True) -> Union[TransactionReceipt, PendingTransaction]:
         """
         Withdraws the specified amount of shares from the automated vault position.
 
         :param shares: The amount of share to withdraw from the vault (in share tokens) (self.shares()[0] = close position)
         :param pct_stable: The percentage of stable token returned to the owner (.50 = 50% stable and 50% asset returned)
         :param strategy: The strategy to use to withdraw, as shown on the webapp (Minimize Trading, Convert All)
+        :param wait: If False, return a PendingTransaction handle as soon as the withdrawal is broadcast
         (NOT IN USE) :param _approve: If True, force approves the vault token to be spent by either the gateway or the vault contract
         """
-        assert self.shares()[0] >= shares, f"Shares owned insufficient to withdraw {shares} " \
-                                           f"({self.from_wei(shares, self.bep20_vault_token.decimals())}) shares"
-
-        txn_nonce = self._get_nonce()
-
         # Process withdraw functions according to the strategy passed:
         if strategy.lower() == "minimize trading":
-            if self.auto_token_approval:
-                if self.do_approve_token(self.bep20_vault_token, _spender=self.vault.address, _min_amount=shares) is not None:
-                    txn_nonce += 1
-            else:
-                assert self.bep20_vault_token.allowance(self.owner_address, self.vault.address) >= shares, \
-                    f"Insufficient approval amount - Spender ({self.vault.address}) requires an allowance of {shares} " \
-                    f"{self.bep20_vault_token.symbol()} ({self.bep20_vault_token.address})"
-
-            return self._execute(self.vault.withdraw(shares), _nonce=txn_nonce)
+            spender = self.vault.address
+            withdrawal = self.vault.withdraw(shares)
 
         elif strategy.lower() == "convert all":
             assert pct_stable is not None, "Please provide a stable token percentage to determine token swap"
-
-            if self.auto_token_approval:
-                if self.do_approve_token(self.bep20_vault_token, _spender=self.gateway.address, _min_amount=shares) is not None:
-                    txn_nonce += 1
-            else:
-                assert self.bep20_vault_token.allowance(self.owner_address, self.gateway.address) >= shares, \
-                    f"Insufficient approval amount - Spender ({self.gateway.address}) requires an allowance of {shares} " \
-                    f"{self.bep20_vault_token.symbol()} ({self.bep20_vault_token.address})"
-
             assert 0.0 <= pct_stable <= 1.0, "Invalid value for pct_stable parameter, must follow 0.0 <= pct_stable <= 1.0"
 
             stable_return_bps = floor(pct_stable * 10000)
 
-            return self._execute(self.gateway.withdraw(shares, stableReturnBps=stable_return_bps), _nonce=txn_nonce)
+            spender = self.gateway.address
+            withdrawal = self.gateway.withdraw(shares, stableReturnBps=stable_return_bps)
 
         else:
             raise ValueError("Invalid strategy - Options are 'Minimize Trading' or 'Convert All'")
 
-    def do_close(self, pct_stable: float = None, strategy: str = "Minimize Trading") -> TransactionReceipt:
+        check, allowance = None, None
+        if self.preflight:
+            # Shares and allowance are read in the same round-trip as the withdraw simulation
+            reads = Multicall(self.w3_provider)
+            reads.add(self.vault.contract.functions.balanceOf(checksum(self.owner_address)))
+            reads.add(self.vault.contract.functions.allowance(checksum(self.owner_address), checksum(spender)))
+            check = preflight(self.w3_provider, withdrawal, self.owner_address, reads, get_gas_estimate_cache())
+            shares_owned, allowance = check.reads
+        else:
+            shares_owned = self.shares()[0]
+
+        assert shares_owned >= shares, f"Shares owned insufficient to withdraw {shares} " \
+                                       f"({self.from_wei(shares, self.bep20_vault_token.decimals())}) shares"
+
+        approval = None
+        if self.auto_token_approval:
+            approval = self._approve_if_needed(self.bep20_vault_token, spender, shares, allowance)
+        else:
+            allowance = self.bep20_vault_token.allowance(self.owner_address, spender) if allowance is None else allowance
+            assert allowance >= shares, \
+                f"Insufficient approval amount - Spender ({spender}) requires an allowance of {shares} " \
+                f"{self.bep20_vault_token.symbol()} ({self.bep20_vault_token.address})"
+
+        return self._execute(withdrawal, gas=self._transaction_gas(withdrawal, check, approval is not None), wait=wait)
+
+    @instrumented("do_close")
+    def do_close(self, pct_stable: float = None, strategy: str = "Minimize Trading",
+                 wait: bool = True) -> Union[TransactionReceipt, PendingTransaction]:
         """
         Withdraws all outstanding shares from the pool and closes position.
 
         :param pct_stable: See self.do_withdraw()
         :param strategy: See self.do_withdraw()
+        :param wait: See self.do_withdraw()
         """
         shares = self.shares()[0]
 
         assert shares > 0, f"Cannot close position with a balance of {shares} shares."
 
-        return self.do_withdraw(shares=shares, pct_stable=pct_stable, strategy=strategy)
+        return self.do_withdraw(shares=shares, pct_stable=pct_stable, strategy=strategy, wait=wait)
 
+    @instrumented("do_approve_token")
     def do_approve_token(self, token: Union[BEP20Token, str], amount: int = None, _min_amount: int = None,
-                         _spender: str = None) -> Union[TransactionReceipt, None]:
+                         _spender: str = None, wait: bool = True) -> Union[TransactionReceipt, PendingTransaction, None]:
         """
         Approves the given token for usage by the Automated Vault.
 
@@ -156,12 +224,13 @@ class AutomatedVaultPosition:
         :param amount: The amount of token to approve, default = maximum
         :param _spender: (Should not be changed by the caller) The address to give token spending access to
         :param _min_amount: Used for internal functions when checking to see if a token has the minimum approval requirement
+        :param wait: If False, return a PendingTransaction handle as soon as the approval is broadcast
 
         :return:
             If the current token allowance already meets or exceeds the given amount:
                 - None
             Else if the current token allowance does not meet the given amount:
-                - TransactionReceipt object
+                - TransactionReceipt object (PendingTransaction if wait is False)
         """
         if type(token) != BEP20Token:
             token = BEP20Token(token)
@@ -179,9 +248,9 @@ class AutomatedVaultPosition:
             print("Approval canceled - allowance already exceeds amount")
             return None
 
-        txn = self._execute(token.prepare_approve(checksum(_spender), amount))
+        txn = self._execute(token.prepare_approve(checksum(_spender), amount), wait=wait)
 
-        print(f"Approved {'MAX' if amount == (2 ** 256 - 1) else amount} {token.symbol()} for contract {_spender}.")
+        print(f"{'Approved' if wait else 'Sent approval of'} {'MAX' if amount == (2 ** 256 - 1) else amount} {token.symbol()} for contract {_spender}.")
 
         return txn
 
@@ -225,27 +294,40 @@ class AutomatedVaultPosition:
             except AttributeError:
                 raise ValueError("Could not fetch vault summary -> position key not supplied")
 
-        r = requests.get("https://alpaca-static-api.alpacafinance.org/bsc/v1/landing/summary.json")
-        if r.status_code != 200:
-            raise Exception(f"{r.status_code}: {r.text}")
-
-        for vault in r.json()["data"]["strategyPools"]:
-            if vault["key"].lower() == position_key:
-                return AttrDict(vault)
-            else:
-                try:
-                    if vault["iuToken"]["symbol"].lower() == position_key:
-                        print(f"Warning: Had to use iuToken to match vault data instead of key (Key = {vault['key']})")
-                        return AttrDict(vault)
-                except KeyError:
-                    # In the event that the vault data did not have an iuToken key for some reason
-                    pass
-        else:
-            raise ValueError(f"Could not locate a vault with the key {self.key}")
+        try:
+            return AttrDict(get_registry().strategy_pool(position_key))
+        except KeyError:
+            raise ValueError(f"Could not locate a vault with the key {position_key}")
+
+    def vault_summary(self, position_key: str = None) -> VaultSummary:
+        """
+        Typed counterpart of self.get_vault_summary(): numeric fields are floats, converted once per summary.json
+        version and shared by every caller (do not mutate)
+        """
+        try:
+            return get_registry().vault_summary(self.key if position_key is None else position_key)
+        except KeyError:
+            raise ValueError(f"Could not locate a vault with the key {position_key}")
+
+    @instrumented("rebalance_history")
+    def rebalance_history(self, start: int = None, end: int = None, history: RebalanceHistory = None) -> dict[str, list]:
+        """
+        Returns the rebalance logs of the vault, oldest first.
+        Logs are stored locally and only the logs newer than the last stored one are fetched from the subgraph.
+
+        :param start: (Optional) Only return rebalances with a blockTime >= start (unix timestamp)
+        :param end: (Optional) Only return rebalances with a blockTime < end (unix timestamp)
+        :param history: (Optional) RebalanceHistory store to use, e.g. RebalanceHistory("rebalances.sqlite")
+                        (default = process-wide store persisted in the package cache directory)
 
-    def rebalance_history(self):
-        pass
+        :return: Dict of columns:
+            * id: list[str]
+            * blockTime: list[int] (unix timestamps)
+        """
+        history = get_rebalance_history() if history is None else history
+        return history.history(self.address, start=start, end=end)
 
+    @instrumented("yields")
     def yields(self) -> list[float, float, float, float]:
         """
         :return:
@@ -254,32 +336,34 @@ class AutomatedVaultPosition:
             - current APR
             - current APY
         """
-        summary = self.get_vault_summary()
-        return [float(summary[key]) for key in ["aprTradingFeeExcluded", "apyTradingFeeExcluded", "apr", "apy"]]
+        summary = self.vault_summary()
+        return [summary.aprTradingFeeExcluded, summary.apyTradingFeeExcluded, summary.apr, summary.apy]
 
+    @instrumented("tvl")
     def tvl(self) -> list[float, float]:
         """
         :return:
             - TVL (total value locked)
             - TVL Including Debt
         """
-        summary = self.get_vault_summary()
-        return [float(summary[key]) for key in ["tvl", "tvlIncludingDebt"]]
+        summary = self.vault_summary()
+        return [summary.tvl, summary.tvlIncludingDebt]
 
+    @instrumented("capacity")
     def capacity(self) -> float:
-        return float(self.get_vault_summary().capacity)
+        return self.vault_summary().capacity
 
+    @instrumented("current_value")
     def current_value(self) -> float:
         """Returns the current position value in USD"""
-        return self.shares()[-1]
+        return self.snapshot(include_entry_price=False).shares_usd
 
+    @instrumented("pnl")
     def pnl(self) -> float:
         """Returns the pnl for the current position in USD value"""
-        shares_vault_int, shares_vault, shares_usd = self.shares()
-        entry_value = self.cost_basis() * shares_vault
-
-        return shares_usd - entry_value
+        return self.snapshot().pnl
 
+    @instrumented("shares")
     def shares(self) -> tuple[int, float, float]:
         """
         Returns the amount of vault shares held in the position, and the value of the shares in USD
@@ -287,11 +371,11 @@ class AutomatedVaultPosition:
 
         :return: (vault_shares, vault_shares_usd)
         """
-        shares_int = self.vault.shares(self.owner_address)
-        shares_usd = self.vault.sharesToUSD(shares_int) / 10 ** 18
+        snapshot = self.snapshot(include_entry_price=False)
 
-        return shares_int, shares_int / 10 ** self.bep20_vault_token.decimals(), shares_usd
+        return snapshot.shares_int, snapshot.shares, snapshot.shares_usd
 
+    @instrumented("cost_basis")
     def cost_basis(self) -> float:  # tuple[float, float]
         """CURRENTLY - Returns the entry share price (single share) in USD
         To get current share price, use self.get_vault_summary()['shareTokenprice']
@@ -302,50 +386,133 @@ class AutomatedVaultPosition:
         For Neutral AV (prefixed with n3x or n8x), "avgEntryPrice" will be denominated in USD.
         For Long AV or Savings AV (prefixed with L3x or L8x), "avgEntryPrice" will be denominated in the Savings Asset (e.g. BTCB or ETH).
         """
-        try:
-            for data in get_entry_prices(self.owner_address):
-                if data['strategyPoolAddress'].lower() == self.address.lower():
-                    entry_share_price = float(data['avgEntryPrice']) / 10 ** self.stable_token.decimals()
-                    entry_share_price_usd = self.oracle.getTokenPrice(self.stable_token.address) * entry_share_price
+        return self.snapshot().cost_basis
+
+    @instrumented("snapshot")
+    def snapshot(self, block_identifier: Union[int, str] = "latest", include_entry_price: bool = True) -> PositionSnapshot:
+        """
+        Read every on-chain value used by the informational methods in a single Multicall3 round-trip
+        pinned to one block, so that shares(), pnl(), cost_basis() and current_value() are consistent.
 
-                    return entry_share_price_usd * self.shares()[1]
-        except Exception as exc:
-            raise Exception(f"An error occurred when attempting to fetch entry price for position {self.name} - {exc}")
+        :param block_identifier: The block to read the position at (default = latest)
+        :param include_entry_price: If True, also fetch the position's avgEntryPrice from the Alpaca API
+
+        :return: PositionSnapshot object
+        """
+        self._check_chain()
+
+        multicall = Multicall(self.w3_provider)
+        multicall.add(self.vault.contract.functions.balanceOf(checksum(self.owner_address)))
+        multicall.add(self.vault.contract.functions.decimals())
+        multicall.add(self.vault.contract.functions.shareToValue(SHARE_VALUE_UNIT))
+        multicall.add(self.stable_token.contract.functions.decimals())
+        multicall.add(self.oracle.contract.functions.getTokenPrice(checksum(self.stable_token.address)))
+
+        # Piggyback a refresh of the gas price feed on this round-trip when it is stale
+        gas_price_feed = get_gas_price_feed()
+        refresh_gas_price = isinstance(gas_price_feed, OnChainPriceFeed) and gas_price_feed.stale \
+            and block_identifier == "latest"
+        if refresh_gas_price:
+            multicall.add(gas_price_feed.price_call(self.oracle))
+
+        block_number, (shares_int, vault_decimals, unit_share_value, stable_decimals, stable_price, *extra) = \
+            multicall.aggregate(block_identifier)
+        if refresh_gas_price:
+            gas_price_feed.update_from_result(extra[0])
+
+        snapshot = PositionSnapshot(blockNumber=block_number,
+                                    shares_int=shares_int,
+                                    vault_token_decimals=vault_decimals,
+                                    unit_share_value=unit_share_value,
+                                    stable_token_decimals=stable_decimals,
+                                    stable_token_price=stable_price[0])
+
+        if include_entry_price:
+            try:
+                for data in get_entry_prices(self.owner_address):
+                    if data['strategyPoolAddress'].lower() == self.address.lower():
+                        snapshot.avgEntryPrice = int(data['avgEntryPrice'])
+            except Exception as exc:
+                raise Exception(f"An error occurred when attempting to fetch entry price for position {self.name} - {exc}")
+
+        return snapshot
 
     """ -------------------------------- Utility Methods -------------------------------- """
 
-    def _execute(self, function_call: web3.contract.ContractFunction, _nonce: int = None) -> Union[TransactionReceipt, AttrDict]:
+    def _execute(self, function_call: web3.contract.ContractFunction, gas: int = None,
+                 wait: bool = True) -> Union[TransactionReceipt, AttrDict, PendingTransaction]:
         """
         :param function_call: The uncalled and prepared contract method to sign and send
+        :param gas: (Optional) Gas limit - default = estimated by the node (the transaction is not sent if it reverts)
+        :param wait: If False, return a PendingTransaction as soon as the transaction is broadcast
         """
         if self.owner_key is None:
             raise ValueError("Private key is required to sign transactions")
+        self._check_chain()
 
-        txn = function_call.buildTransaction({
+        # Refresh the gas price feed in the background while the transaction is pending,
+        # so that building the receipt does not wait on a price request
+        price_feed = get_gas_price_feed()
+        price_feed.peek()
+
+        txn_params = {
             "from": self.owner_address,
             'chainId': 56,  # 56: BSC mainnet
-            # 'gas': 76335152,
-            'gasPrice': self.gasPrice,  # 5000000000
-            'nonce': self._get_nonce() if _nonce is None else _nonce,
-        })
-        # print(txn)
-
-        signed_txn = self.w3_provider.eth.account.sign_transaction(
-            txn, private_key=self.owner_key
-        )
-        tx_hash = self.w3_provider.eth.send_raw_transaction(signed_txn.rawTransaction)
-
-        receipt = dict(self.w3_provider.eth.wait_for_transaction_receipt(tx_hash))
-
+            'gasPrice': self.gasPrice if self.gas_price_strategy is None
+                        else self.gas_price_strategy.gas_price(self.w3_provider),
+        }
+        if gas is not None:
+            txn_params['gas'] = gas
+        txn = function_call.buildTransaction(txn_params)
+        if gas is None:
+            get_gas_estimate_cache().put(function_call, txn['gas'])
+
+        # The nonce is only reserved once the transaction was built (gas estimation can revert)
+        txn['nonce'] = self.nonce_manager.allocate()
         try:
-            return build_receipt(receipt)
-        except Exception as exc:
-            print(f"COULD NOT BUILD TRANSACTION RECEIPT OBJECT - {exc}")
-            # Catch case to prevent receipt from being lost if TransactionReceipt object somehow can't be built
-            return AttrDict(receipt)
-
-    def _get_nonce(self) -> int:
-        return self.w3_provider.eth.get_transaction_count(self.owner_address)
+            signed_txn = self.w3_provider.eth.account.sign_transaction(
+                txn, private_key=self.owner_key
+            )
+            tx_hash = self.w3_provider.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception:
+            # The nonce may or may not have been consumed - reload it from the node on the next transaction
+            self.nonce_manager.resync()
+            raise
+
+        pending = PendingTransaction(self.w3_provider, tx_hash, nonce=txn['nonce'], gas_price=txn['gasPrice'],
+                                     price_feed=price_feed,
+                                     contract_addresses=(self.address, self.addresses['gateway']))
+        return pending.result() if wait else pending
+
+    def _approve_if_needed(self, token: BEP20Token, spender: str, amount: int,
+                           allowance: int = None) -> Optional[PendingTransaction]:
+        """Send (without waiting) a max approval of the token if needed - the allowance is read if not already known"""
+        if allowance is None:
+            return self.do_approve_token(token, _spender=spender, _min_amount=amount, wait=False)
+        if allowance >= amount:
+            return None
+        return self._execute(token.prepare_approve(checksum(spender)), wait=False)
+
+    def _transaction_gas(self, function_call: web3.contract.ContractFunction, check: Optional[PreflightResult],
+                         approval_pending: bool) -> Optional[int]:
+        """
+        Gas limit of a deposit/withdraw transaction:
+            * after a preflight check: the estimate (cached or not) of the simulated call
+              (raises TransactionRevert if the simulation reverted, unless an approval is pending)
+            * after an unmined approval: self.pipelinedGasLimit (the call cannot be simulated before the approval)
+            * otherwise None (estimated when the transaction is built, which fails if it would revert)
+        Cached estimates are only used for a call that was just simulated successfully.
+        """
+        if approval_pending:
+            return check.gas if check is not None and check.ok else self.pipelinedGasLimit
+        if check is not None:
+            check.raise_for_revert()
+            return check.gas
+        return None
+
+    def _check_chain(self) -> None:
+        if get_chain_id(self.w3_provider) != 56:
+            raise ValueError("This package currently supports positions on the Binance Smart Chain (BSC - 56) network only")
 
     @staticmethod
     def to_wei(amt: float, decimals: int) -> int:
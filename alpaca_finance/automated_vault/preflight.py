@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from .. import transport
+from ..util import load_abi, checksum
+from .gas import GasEstimateCache
+from .multicall import Multicall, decode_function_output
+
+import web3.contract
+from web3 import Web3
+from eth_abi import decode_abi
+from eth_utils import function_signature_to_4byte_selector
+from hexbytes import HexBytes
+from web3._utils.abi import collapse_if_tuple
+
+
+# Solidity builtin revert payloads: Error(string) and Panic(uint256)
+ERROR_SELECTOR = function_signature_to_4byte_selector("Error(string)")
+PANIC_SELECTOR = function_signature_to_4byte_selector("Panic(uint256)")
+PANIC_CODES = {0x01: "assertion failed", 0x11: "arithmetic overflow or underflow", 0x12: "division by zero",
+               0x21: "invalid enum value", 0x22: "invalid storage byte array", 0x31: "pop on empty array",
+               0x32: "array index out of bounds", 0x41: "out of memory", 0x51: "call to an invalid function"}
+
+
+class TransactionRevert(Exception):
+    def __init__(self, reason: str, data: bytes = None):
+        """Raised when a transaction simulation reverts, instead of broadcasting it"""
+        super().__init__(f"Transaction would revert - {reason}")
+        self.reason = reason
+        self.data = data
+
+
+class RevertDecoder:
+    def __init__(self, abi_filenames: list[str] = ("DeltaNeutralVault.json", "DeltaNeutralVaultGateway.json",
+                                                   "AutomatedVaultController.json")):
+        """
+        Decodes revert data into a readable reason: Error(string), Panic(uint256), and the custom errors
+        declared in the bundled ABIs (e.g. DeltaNeutralVault_UnsafeDebtRatio()).
+
+        :param abi_filenames: The ABIs (from automated_vault/abi) to read custom errors from
+        """
+        self.errors = {}  # selector (bytes) -> (name, [input types])
+        for abi_filename in abi_filenames:
+            for item in load_abi(abi_filename):
+                if item["type"] == "error":
+                    types = [collapse_if_tuple(i) for i in item["inputs"]]
+                    selector = function_signature_to_4byte_selector(f"{item['name']}({','.join(types)})")
+                    self.errors[bytes(selector)] = (item["name"], types)
+
+    def decode(self, data: Union[bytes, str]) -> str:
+        data = bytes(HexBytes(data))
+        selector, payload = data[:4], data[4:]
+        try:
+            if selector == ERROR_SELECTOR:
+                return decode_abi(["string"], payload)[0]
+            if selector == PANIC_SELECTOR:
+                code = decode_abi(["uint256"], payload)[0]
+                return f"Panic(0x{code:02x}): {PANIC_CODES.get(code, 'unknown panic code')}"
+            if selector in self.errors:
+                name, types = self.errors[selector]
+                return f"{name}({', '.join(str(arg) for arg in decode_abi(types, payload))})"
+        except Exception:
+            pass
+        return f"unknown revert data 0x{data.hex()}" if data else "reverted without a reason"
+
+
+_revert_decoder = None
+
+
+def decode_revert_reason(data: Union[bytes, str]) -> str:
+    """Returns the readable reason of the given revert data (See RevertDecoder)"""
+    global _revert_decoder
+    if _revert_decoder is None:
+        _revert_decoder = RevertDecoder()
+    return _revert_decoder.decode(data)
+
+
+@dataclass
+class PreflightResult:
+    """Dataclass to model the outcome of preflight()"""
+    blockNumber: Optional[int]  # Block of the batched reads (None if there were no reads)
+    reads: list  # Decoded results of the batched reads, in the order they were added to the Multicall
+    gas: Optional[int]  # Gas estimate (from the cache if available), None if the simulation reverted
+    revert_reason: Optional[str]  # None if the simulation succeeded
+    revert_data: Optional[bytes] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.revert_reason is None
+
+    def raise_for_revert(self) -> None:
+        if self.revert_reason is not None:
+            raise TransactionRevert(self.revert_reason, self.revert_data)
+
+
+def preflight(w3_provider: Web3, function_call: web3.contract.ContractFunction, from_address: str,
+              reads: Multicall = None, gas_cache: GasEstimateCache = None,
+              block_identifier: Union[int, str] = "pending") -> PreflightResult:
+    """
+    Simulate a prepared transaction with eth_call and estimate its gas, together with the given reads
+    (e.g. balances and allowances), in a single JSON-RPC batch.
+
+    :param w3_provider: Web3 provider
+    :param function_call: The uncalled and prepared contract method (e.g. DeltaNeutralVault.withdraw(shares))
+    :param from_address: The address that would send the transaction
+    :param reads: (Optional) Multicall of view calls to read in the same round-trip
+    :param gas_cache: (Optional) GasEstimateCache - eth_estimateGas is skipped on a hit and the cache is filled on a miss
+    :param block_identifier: The block to simulate at (default = pending)
+    :return: PreflightResult object
+    """
+    txn = {"from": checksum(from_address), "to": function_call.address,
+           "data": function_call._encode_transaction_data()}
+    cached_gas = gas_cache.get(function_call) if gas_cache is not None else None
+    block = block_identifier if isinstance(block_identifier, str) else hex(block_identifier)
+
+    requests = [("eth_call", [txn, block])]
+    if cached_gas is None:
+        requests.append(("eth_estimateGas", [txn]))
+    if reads is not None and len(reads):
+        aggregate = reads.prepare()
+        requests.append(("eth_call", [{"to": aggregate.address, "data": aggregate._encode_transaction_data()}, block]))
+
+    responses = transport.rpc_batch(w3_provider, requests)
+    simulation = responses[0]
+
+    block_number, results = None, []
+    if reads is not None and len(reads):
+        block_number, results = reads.decode(decode_function_output(aggregate, HexBytes(_result(responses[-1]))))
+
+    if "error" in simulation:
+        error = simulation["error"]
+        data = error.get("data")
+        if isinstance(data, dict):  # Some clients nest the revert data
+            data = data.get("data")
+        if isinstance(data, str) and data.startswith("0x"):
+            reason = decode_revert_reason(data)
+        else:
+            reason = error.get("message", "execution reverted")
+        return PreflightResult(blockNumber=block_number, reads=results, gas=None, revert_reason=reason,
+                               revert_data=bytes(HexBytes(data)) if isinstance(data, str) else None)
+
+    gas = cached_gas
+    if gas is None:
+        gas = int(_result(responses[1]), 16)
+        if gas_cache is not None:
+            gas_cache.put(function_call, gas)
+            gas = int(gas * gas_cache.margin)
+
+    return PreflightResult(blockNumber=block_number, reads=results, gas=gas, revert_reason=None)
+
+
+def _result(response: dict):
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["result"]
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+from threading import Lock, Thread, Event
+from time import monotonic
+from typing import Optional
+
+from .. import transport
+from ..util import get_web3_provider, checksum
+from ._config import DEFAULT_BSC_RPC_URL, WBNB_ADDRESS
+from .contracts import DeltaNeutralOracle
+
+import web3.contract
+from web3 import Web3
+
+
+class PriceFeed(ABC):
+    def __init__(self, ttl: float = 60):
+        """
+        Base class of a TTL-cached USD price. Subclasses implement fetch().
+
+        peek() never touches the network: it returns the cached price and, once the price is older than the TTL,
+        schedules a refresh on a background thread. price() refreshes synchronously when needed.
+        start() keeps the price fresh from a daemon thread.
+
+        :param ttl: Seconds after which the cached price is considered stale
+        """
+        self.ttl = ttl
+        self._price = None
+        self._updated_at = None
+        self._lock = Lock()
+        self._refreshing = False
+        self._stop = None
+
+    @abstractmethod
+    def fetch(self) -> float:
+        """Returns the realtime price in USD (network request)"""
+
+    def update(self, price: float) -> None:
+        """Store a price that was read elsewhere (e.g. batched in a Multicall)"""
+        with self._lock:
+            self._price = price
+            self._updated_at = monotonic()
+
+    @property
+    def stale(self) -> bool:
+        return self._updated_at is None or monotonic() - self._updated_at > self.ttl
+
+    def refresh(self) -> float:
+        """Fetch and store the price"""
+        price = self.fetch()
+        self.update(price)
+        return price
+
+    def refresh_in_background(self) -> None:
+        """Start a refresh on a daemon thread, unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        Thread(target=self._background_refresh, daemon=True).start()
+
+    def peek(self) -> Optional[float]:
+        """Returns the cached price (None if it was never fetched) without blocking, refreshing it in the background if stale"""
+        if self.stale:
+            self.refresh_in_background()
+        return self._price
+
+    def price(self) -> float:
+        """Returns the cached price, fetching it first if it is stale"""
+        if self.stale:
+            return self.refresh()
+        return self._price
+
+    def start(self) -> None:
+        """Refresh the price every `ttl` seconds from a daemon thread until stop() is called"""
+        if self._stop is not None:
+            return
+        self._stop = Event()
+        Thread(target=self._refresh_loop, args=(self._stop,), daemon=True).start()
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as exc:
+            print(f"COULD NOT REFRESH PRICE FEED {self} - {exc}")
+        finally:
+            self._refreshing = False
+
+    def _refresh_loop(self, stop: Event) -> None:
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception as exc:
+                print(f"COULD NOT REFRESH PRICE FEED {self} - {exc}")
+            stop.wait(self.ttl)
+
+
+class OnChainPriceFeed(PriceFeed):
+    def __init__(self, token_address: str = WBNB_ADDRESS, w3_provider: Web3 = None, ttl: float = 60):
+        """
+        Token price read from DeltaNeutralOracle.getTokenPrice (default = WBNB, used to price BSC gas).
+
+        :param token_address: The token to price
+        :param w3_provider: Web3 provider (optional)
+        :param ttl: Seconds after which the cached price is considered stale
+        """
+        super().__init__(ttl)
+        self.token_address = checksum(token_address)
+        self.w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL) if w3_provider is None else w3_provider
+
+    def __str__(self) -> str:
+        return f"on-chain {self.token_address}"
+
+    def price_call(self, oracle: DeltaNeutralOracle = None) -> web3.contract.ContractFunction:
+        """
+        Prepared getTokenPrice call, so the price can be batched with other reads.
+        Pass the decoded result to update_from_result().
+        """
+        oracle = DeltaNeutralOracle(self.w3_provider) if oracle is None else oracle
+        return oracle.contract.functions.getTokenPrice(self.token_address)
+
+    def update_from_result(self, result: list) -> None:
+        """Store the decoded output of price_call() - (price, lastUpdate) with an 18 decimals price"""
+        self.update(result[0] / 10 ** 18)
+
+    def fetch(self) -> float:
+        return DeltaNeutralOracle(self.w3_provider).getTokenPrice(self.token_address)
+
+
+class BinancePriceFeed(PriceFeed):
+    def __init__(self, symbol: str = "BNBUSDT", ttl: float = 60):
+        """
+        Average price of a Binance spot market (default = BNBUSDT)
+
+        :param symbol: The Binance market symbol
+        :param ttl: Seconds after which the cached price is considered stale
+        """
+        super().__init__(ttl)
+        self.symbol = symbol
+
+    def __str__(self) -> str:
+        return f"binance {self.symbol}"
+
+    def fetch(self) -> float:
+        return float(transport.get_json(f"https://api.binance.com/api/v3/avgPrice?symbol={self.symbol}")["price"])
+
+
+_gas_price_feed = None
+
+
+def get_gas_price_feed() -> PriceFeed:
+    """Returns the feed used to price transaction gas in USD (default = on-chain WBNB price)"""
+    global _gas_price_feed
+    if _gas_price_feed is None:
+        _gas_price_feed = OnChainPriceFeed()
+    return _gas_price_feed
+
+
+def set_gas_price_feed(feed: PriceFeed) -> None:
+    """Replace the feed used to price transaction gas in USD (e.g. BinancePriceFeed() or a custom PriceFeed)"""
+    global _gas_price_feed
+    _gas_price_feed = feed
@@ -0,0 +1,192 @@
+from os import makedirs
+from os.path import dirname, expanduser, join
+from threading import Lock
+from typing import Iterator
+import sqlite3
+
+from .. import transport
+from ._config import AUTOMATED_VAULT_SUBGRAPH_URL, DEFAULT_CACHE_DIR
+
+
+DEFAULT_REBALANCE_DB_PATH = join(DEFAULT_CACHE_DIR, "rebalances.sqlite3")
+
+
+# The logs after a blockTime, and the logs of one blockTime after an id: paging on (blockTime, id) never skips logs
+# sharing a blockTime, however many there are
+REBALANCE_LOGS_QUERY = """
+query rebalanceLogs($vaultAddress: String, $blockTime: BigInt, $first: Int) {
+  rebalanceLogs(
+    where: {vaultAddress: $vaultAddress, blockTime_gt: $blockTime}
+    orderBy: blockTime
+    orderDirection: asc
+    first: $first
+  ) {
+    id
+    vaultAddress
+    blockTime
+  }
+}
+"""
+
+REBALANCE_LOGS_AT_QUERY = """
+query rebalanceLogsAt($vaultAddress: String, $blockTime: BigInt, $id: ID, $first: Int) {
+  rebalanceLogs(
+    where: {vaultAddress: $vaultAddress, blockTime: $blockTime, id_gt: $id}
+    orderBy: id
+    orderDirection: asc
+    first: $first
+  ) {
+    id
+    vaultAddress
+    blockTime
+  }
+}
+"""
+
+
+def fetch_rebalance_logs(vault_address: str, since: int = 0, page_size: int = 1000,
+                         subgraph_url: str = AUTOMATED_VAULT_SUBGRAPH_URL) -> Iterator[list[dict]]:
+    """
+    Page through the rebalance logs of a vault on the automated-vault subgraph, oldest first
+
+    :param vault_address: The vault address
+    :param since: Only fetch logs with a blockTime >= since (unix timestamp)
+    :param page_size: Amount of logs per subgraph request (max 1000)
+    :param subgraph_url: The automated-vault subgraph URL
+    :return: Generator of pages, each a list of dicts containing:
+                * id: str
+                * vaultAddress: str
+                * blockTime: str (unix timestamp)
+    """
+    def query(operation_name: str, query: str, **variables) -> list[dict]:
+        r = transport.post(subgraph_url, json={"operationName": operation_name, "query": query,
+                                               "variables": {"vaultAddress": vault_address.lower(),
+                                                             "first": page_size, **variables}})
+        r.raise_for_status()
+        response = r.json()
+        if "errors" in response:
+            raise Exception(f"Subgraph query failed - {response['errors']}")
+        return response["data"]["rebalanceLogs"]
+
+    block_time = since
+    while True:
+        # Every log of block_time, by id
+        last_id = ""
+        while True:
+            page = query("rebalanceLogsAt", REBALANCE_LOGS_AT_QUERY, blockTime=str(block_time), id=last_id)
+            if page:
+                yield page
+                last_id = page[-1]["id"]
+            if len(page) < page_size:
+                break
+
+        # The logs after block_time: a full page may end in the middle of its last blockTime, whose logs are left
+        # to the next round
+        page = query("rebalanceLogs", REBALANCE_LOGS_QUERY, blockTime=str(block_time))
+        if len(page) < page_size:
+            if page:
+                yield page
+            return
+
+        block_time = int(page[-1]["blockTime"])
+        page = [log for log in page if int(log["blockTime"]) < block_time]
+        if page:
+            yield page
+
+
+class RebalanceHistory:
+    def __init__(self, db_path: str = DEFAULT_REBALANCE_DB_PATH, subgraph_url: str = AUTOMATED_VAULT_SUBGRAPH_URL):
+        """
+        Local SQLite store of vault rebalance logs, updated incrementally from the automated-vault subgraph.
+        Each update only requests the logs at or after the newest stored blockTime of the vault,
+        so a new process resumes from the logs stored by the previous ones.
+
+        :param db_path: Path of the SQLite database file (default = in the package cache directory,
+                        ":memory:" = not persisted)
+        :param subgraph_url: The automated-vault subgraph URL
+        """
+        self.subgraph_url = subgraph_url
+        self._lock = Lock()
+        if db_path != ":memory:":
+            db_path = expanduser(db_path)
+            if dirname(db_path):
+                makedirs(dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS rebalance_logs (
+                id TEXT PRIMARY KEY,
+                vault_address TEXT NOT NULL,
+                block_time INTEGER NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rebalance_logs_vault_time "
+                         "ON rebalance_logs (vault_address, block_time)")
+        self._db.commit()
+
+    def update(self, vault_address: str) -> int:
+        """
+        Fetch and store the rebalance logs newer than the last stored one
+
+        :return: The amount of new logs stored
+        """
+        vault_address = vault_address.lower()
+        with self._lock:
+            since = self._db.execute("SELECT COALESCE(MAX(block_time), 0) FROM rebalance_logs WHERE vault_address = ?",
+                                     (vault_address,)).fetchone()[0]
+
+            stored = 0
+            for page in fetch_rebalance_logs(vault_address, since=since, subgraph_url=self.subgraph_url):
+                cursor = self._db.executemany(
+                    "INSERT OR IGNORE INTO rebalance_logs (id, vault_address, block_time) VALUES (?, ?, ?)",
+                    [(log["id"], log["vaultAddress"].lower(), int(log["blockTime"])) for log in page])
+                stored += cursor.rowcount
+                self._db.commit()
+
+            return stored
+
+    def history(self, vault_address: str, start: int = None, end: int = None, update: bool = True) -> dict[str, list]:
+        """
+        Return the rebalance logs of the vault in column format, oldest first
+
+        :param vault_address: The vault address
+        :param start: (Optional) Only return logs with a blockTime >= start (unix timestamp)
+        :param end: (Optional) Only return logs with a blockTime < end (unix timestamp)
+        :param update: If True, fetch the new logs from the subgraph first
+        :return: Dict of columns:
+                    * id: list[str]
+                    * blockTime: list[int] (unix timestamps)
+        """
+        if update:
+            self.update(vault_address)
+
+        with self._lock:
+            rows = self._db.execute("SELECT id, block_time FROM rebalance_logs "
+                                    "WHERE vault_address = ? AND block_time >= ? AND block_time < ? "
+                                    "ORDER BY block_time, id",
+                                    (vault_address.lower(), 0 if start is None else start,
+                                     2 ** 63 - 1 if end is None else end)).fetchall()
+
+        ids, block_times = (list(column) for column in zip(*rows)) if rows else ([], [])
+        return {"id": ids, "blockTime": block_times}
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_default_history = None
+_default_history_lock = Lock()
+
+
+def get_rebalance_history() -> RebalanceHistory:
+    """
+    Returns the process-wide RebalanceHistory used by AutomatedVaultPosition.rebalance_history(),
+    stored at DEFAULT_REBALANCE_DB_PATH (in memory if the cache directory is not writable)
+    """
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            try:
+                _default_history = RebalanceHistory()
+            except (OSError, sqlite3.Error) as exc:
+                print(f"COULD NOT OPEN THE REBALANCE HISTORY AT {DEFAULT_REBALANCE_DB_PATH} - {exc}")
+                _default_history = RebalanceHistory(":memory:")
+        return _default_history
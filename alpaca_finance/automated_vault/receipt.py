@@ -1,6 +1,8 @@
-from .oracle import get_eth_price
+from .events import DecodedEvent, EventDecoder
+from .price_feed import PriceFeed, get_gas_price_feed
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
 from hexbytes import HexBytes
 
 @dataclass
@@ -14,20 +16,40 @@ class TransactionReceipt:
     blockNumber: int
     contractAddress: str
     cumulativeGasUsed: int
-    gasSpendUSD: str
+    gasSpendUSD: Optional[float]  # None if no BNB price was cached yet when the receipt was built
     fromAddress: str
     toAddress: str
     status: int
     transactionIndex: int
     type: str
     effectiveGasPrice: int = None
+    gasUsed: int = None
+    events: list[DecodedEvent] = field(default_factory=list)  # Decoded logs of the vault and its gateway
 
 
-def build_receipt(d: dict) -> TransactionReceipt:
+_event_decoder = None
+
+
+def _get_event_decoder() -> EventDecoder:
+    global _event_decoder
+    if _event_decoder is None:
+        _event_decoder = EventDecoder()
+    return _event_decoder
+
+
+def build_receipt(d: dict, gas_price: int = None, price_feed: PriceFeed = None,
+                  contract_addresses: Iterable[str] = None) -> TransactionReceipt:
     """
-    Prepare the Web3 transaction receipt dictionary to map to the TransactionReceipt class
+    Prepare the Web3 transaction receipt dictionary to map to the TransactionReceipt class.
+    Does not make any network request: gas is priced with the cached BNB price of the price feed.
+
     :param d: Transaction receipt JSON data as returned by Web3.eth.wait_for_transaction_receipt():
               https://web3py.readthedocs.io/en/stable/web3.eth.html#web3.eth.Eth.wait_for_transaction_receipt
+    :param gas_price: The gasPrice (wei) the transaction was sent with, used if the receipt has no effectiveGasPrice
+    :param price_feed: (Optional) The BNB/USD price feed - default = get_gas_price_feed()
+    :param contract_addresses: (Optional) Only decode the logs emitted by these contracts (e.g. the vault and its
+                               gateway), default = every log matching a vault or gateway event, including the
+                               Transfer/Approval logs of any token
     :return: TransactionReceipt class to model the transaction
     """
     # Account for "from" being unable to map:
@@ -36,15 +58,24 @@ def build_receipt(d: dict) -> TransactionReceipt:
     if "to" in d.keys():
         d['toAddress'] = d.pop("to")
 
-    # Calculate gas price in USD
-    if "gasUsed" in d.keys():
-        #                  Convert from GWEI to ETH, then mutliply by ETH price:
-        d['gasSpendUSD'] = (d.pop('gasUsed') * 0.000000001) * get_eth_price()
+    # Calculate gas spend in USD: gasUsed * gas price (wei) -> BNB, then multiply by the cached BNB price
+    bnb_price = (get_gas_price_feed() if price_feed is None else price_feed).peek()
+    price_wei = d.get('effectiveGasPrice', gas_price)
+    if "gasUsed" in d.keys() and price_wei is not None and bnb_price is not None:
+        d['gasSpendUSD'] = d['gasUsed'] * price_wei / 10 ** 18 * bnb_price
+    else:
+        d['gasSpendUSD'] = None
+
+    # Decode the logs emitted by the vault contracts (logs of other contracts and unknown logs are skipped):
+    decoder = _get_event_decoder()
+    logs = d.get('logs', [])
+    if contract_addresses is not None:
+        contract_addresses = {address.lower() for address in contract_addresses}
+        logs = [log for log in logs if log['address'].lower() in contract_addresses]
+    d['events'] = [event for event in map(decoder.decode, logs) if event is not None]
 
-    # Clean logs - will not be used:
     for key in d.copy().keys():
         if key.startswith("logs"):
             d.pop(key)
 
     return TransactionReceipt(**d)
-
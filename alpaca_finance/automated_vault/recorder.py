@@ -0,0 +1,207 @@
+from os import makedirs
+from os.path import dirname, expanduser, join
+from threading import Event, Lock, Thread
+from time import time
+from typing import Optional
+import sqlite3
+
+from ..registry import get_registry
+from ._config import DEFAULT_CACHE_DIR
+from .portfolio import PositionScanner
+
+from web3 import Web3
+
+
+# Columns of the recorded time series (in addition to the timestamp)
+VAULT_METRICS = ("tvl", "tvl_including_debt", "capacity", "apr", "apy")
+POSITION_METRICS = ("block_number", "shares", "value", "cost_basis", "pnl")
+
+DEFAULT_SNAPSHOT_DB_PATH = join(DEFAULT_CACHE_DIR, "snapshots.sqlite3")
+DEFAULT_SNAPSHOT_RETENTION = 90 * 86400  # Seconds
+
+
+class SnapshotRecorder:
+    def __init__(self, wallet_addresses: list[str], position_keys: list[str] = None, w3_provider: Web3 = None,
+                 db_path: str = DEFAULT_SNAPSHOT_DB_PATH, retention: Optional[float] = DEFAULT_SNAPSHOT_RETENTION):
+        """
+        Periodically records the vault metrics (TVL, capacity, APR/APY from summary.json) and the position metrics
+        (shares, current value, cost basis, PnL) of the given wallets into SQLite, to query their history locally.
+
+        Samples are appended to WITHOUT ROWID tables clustered on (series, timestamp), with integer series ids
+        instead of repeated addresses, so range queries read one contiguous slice of the table.
+
+        :param wallet_addresses: The public wallet addresses to record
+        :param position_keys: The vault keys to record (e.g. "n3x-BNBBUSD-PCS1"), default = all summary.json strategyPools
+        :param w3_provider: Web3 provider (optional)
+        :param db_path: Path of the SQLite database file (default = in the package cache directory,
+                        ":memory:" to keep the history in memory only)
+        :param retention: Seconds of history to keep - older samples are deleted after every record()
+                          (default = 90 days, None to keep every sample)
+        """
+        self.scanner = PositionScanner(wallet_addresses, position_keys, w3_provider=w3_provider)
+        self.retention = retention
+
+        self._series = {}  # (vault key, wallet) -> series id, wallet = "" for the vault metrics
+        self._lock = Lock()
+        self._stop = None
+        if db_path != ":memory:":
+            db_path = expanduser(db_path)
+            if dirname(db_path):
+                makedirs(dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY,
+                vault TEXT NOT NULL,
+                wallet TEXT NOT NULL,
+                UNIQUE (vault, wallet)
+            );
+            CREATE TABLE IF NOT EXISTS vault_samples (
+                series INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                {", ".join(f"{column} REAL" for column in VAULT_METRICS)},
+                PRIMARY KEY (series, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS position_samples (
+                series INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                block_number INTEGER NOT NULL,
+                {", ".join(f"{column} REAL" for column in POSITION_METRICS[1:])},
+                PRIMARY KEY (series, ts)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS vault_samples_ts ON vault_samples (ts);
+            CREATE INDEX IF NOT EXISTS position_samples_ts ON position_samples (ts);""")
+        self._db.commit()
+
+        for series_id, vault, wallet in self._db.execute("SELECT id, vault, wallet FROM series"):
+            self._series[(vault, wallet)] = series_id
+
+    def record(self, timestamp: int = None) -> int:
+        """
+        Take one snapshot of every vault and position (one summary.json lookup and one PositionScanner.scan())
+
+        :param timestamp: (Optional) Unix timestamp of the samples, default = now
+        :return: The amount of samples stored
+        """
+        timestamp = int(time()) if timestamp is None else timestamp
+        rows = self.scanner.scan()
+        registry = get_registry()
+        summaries = [registry.vault_summary(key) for key in self.scanner.vaults]
+
+        with self._lock:
+            vault_samples = [(self._series_id(summary.key, ""), timestamp, summary.tvl, summary.tvlIncludingDebt,
+                              summary.capacity, summary.apr, summary.apy) for summary in summaries]
+            position_samples = [(self._series_id(row.key, row.wallet.lower()), timestamp, row.blockNumber,
+                                 row.shares, row.shares_usd, row.cost_basis, row.pnl) for row in rows]
+
+            self._db.executemany(f"INSERT OR REPLACE INTO vault_samples VALUES ({', '.join('?' * 7)})", vault_samples)
+            self._db.executemany(f"INSERT OR REPLACE INTO position_samples VALUES ({', '.join('?' * 7)})",
+                                 position_samples)
+            if self.retention is not None:
+                self._prune(timestamp - self.retention)
+            self._db.commit()
+
+        return len(vault_samples) + len(position_samples)
+
+    def start(self, interval: float = 300) -> None:
+        """Call self.record() every `interval` seconds from a daemon thread"""
+        if self._stop is not None:
+            return
+        self._stop = Event()
+        Thread(target=self._record_loop, args=(self._stop, interval), daemon=True).start()
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def vault_history(self, position_key: str, start: int = None, end: int = None,
+                      interval: int = None) -> dict[str, list]:
+        """
+        Return the recorded metrics of the vault, oldest first
+
+        :param position_key: The vault key (e.g. "n3x-BNBBUSD-PCS1")
+        :param start: (Optional) First unix timestamp to include
+        :param end: (Optional) Last unix timestamp to include
+        :param interval: (Optional) Downsample to one row per `interval` seconds (averages, timestamp = bucket start)
+        :return: Column oriented dict with the keys ts, tvl, tvl_including_debt, capacity, apr, apy
+        """
+        return self._history("vault_samples", VAULT_METRICS, self._find_series(position_key, ""), start, end, interval)
+
+    def position_history(self, wallet_address: str, position_key: str, start: int = None, end: int = None,
+                         interval: int = None) -> dict[str, list]:
+        """
+        Return the recorded metrics of the position, oldest first
+
+        :param wallet_address: The public wallet address
+        :param position_key: The vault key (e.g. "n3x-BNBBUSD-PCS1")
+        :param start: (Optional) First unix timestamp to include
+        :param end: (Optional) Last unix timestamp to include
+        :param interval: (Optional) Downsample to one row per `interval` seconds (averages, last block number,
+                         timestamp = bucket start)
+        :return: Column oriented dict with the keys ts, block_number, shares, value, cost_basis, pnl
+        """
+        return self._history("position_samples", POSITION_METRICS,
+                             self._find_series(position_key, wallet_address.lower()), start, end, interval)
+
+    def prune(self, before: int) -> int:
+        """Delete the samples older than the given unix timestamp and return the amount deleted"""
+        with self._lock:
+            deleted = self._prune(before)
+            self._db.commit()
+        return deleted
+
+    def close(self) -> None:
+        self.stop()
+        self._db.close()
+
+    def _series_id(self, key: str, wallet: str) -> int:
+        series_id = self._series.get((key, wallet))
+        if series_id is None:
+            series_id = self._db.execute("INSERT INTO series (vault, wallet) VALUES (?, ?)", (key, wallet)).lastrowid
+            self._series[(key, wallet)] = series_id
+        return series_id
+
+    def _find_series(self, key: str, wallet: str) -> Optional[int]:
+        for (vault, series_wallet), series_id in self._series.items():
+            if vault.lower() == key.lower() and series_wallet == wallet:
+                return series_id
+        return None
+
+    def _history(self, table: str, metrics: tuple, series_id: Optional[int], start: Optional[int], end: Optional[int],
+                 interval: Optional[int]) -> dict[str, list]:
+        columns = {name: [] for name in ("ts",) + metrics}
+        if series_id is None:
+            return columns
+
+        if interval is None:
+            select = f"SELECT ts, {', '.join(metrics)}"
+            group = ""
+        else:
+            aggregates = [f"MAX({m})" if m == "block_number" else f"AVG({m})" for m in metrics]
+            select = f"SELECT (ts / {int(interval)}) * {int(interval)} AS bucket, {', '.join(aggregates)}"
+            group = " GROUP BY bucket"
+
+        query = f"{select} FROM {table} WHERE series = ? AND ts >= ? AND ts <= ?{group} ORDER BY 1"
+        params = (series_id, 0 if start is None else start, 2 ** 62 if end is None else end)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        for row in rows:
+            for name, value in zip(columns, row):
+                columns[name].append(value)
+        return columns
+
+    def _prune(self, before: float) -> int:
+        deleted = 0
+        for table in ("vault_samples", "position_samples"):
+            deleted += self._db.execute(f"DELETE FROM {table} WHERE ts < ?", (int(before),)).rowcount
+        return deleted
+
+    def _record_loop(self, stop: Event, interval: float) -> None:
+        while not stop.is_set():
+            try:
+                self.record()
+            except Exception as exc:
+                print(f"COULD NOT RECORD SNAPSHOT - {exc}")
+            stop.wait(interval)
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+# Unit used to read the per-share value with shareToValue() in the same batch as balanceOf()
+SHARE_VALUE_UNIT = 10 ** 36
+
+
+@dataclass
+class PositionSnapshot:
+    """
+    Dataclass to model every on-chain value backing the AutomatedVaultPosition informational methods,
+    read together from a single block with one Multicall3.aggregate3() call.
+    """
+    blockNumber: int
+    shares_int: int  # Vault shares owned (in share token units)
+    vault_token_decimals: int
+    unit_share_value: int  # shareToValue(SHARE_VALUE_UNIT) (18 decimals)
+    stable_token_decimals: int
+    stable_token_price: int  # DeltaNeutralOracle.getTokenPrice(stable_token) (18 decimals)
+    avgEntryPrice: Optional[int] = None  # From the avg-entry-prices API (in stable token units)
+
+    @property
+    def shares(self) -> float:
+        """Vault shares owned in decimal format"""
+        return self.shares_int / 10 ** self.vault_token_decimals
+
+    @property
+    def shares_usd(self) -> float:
+        """The value of the shares owned in USD (shareToValue is linear in the share amount)"""
+        return (self.shares_int * self.unit_share_value // SHARE_VALUE_UNIT) / 10 ** 18
+
+    @property
+    def cost_basis(self) -> Optional[float]:
+        """See AutomatedVaultPosition.cost_basis()"""
+        if self.avgEntryPrice is None:
+            return None
+
+        entry_share_price = self.avgEntryPrice / 10 ** self.stable_token_decimals
+        entry_share_price_usd = (self.stable_token_price / 10 ** 18) * entry_share_price
+
+        return entry_share_price_usd * self.shares
+
+    @property
+    def pnl(self) -> Optional[float]:
+        """See AutomatedVaultPosition.pnl() - the value of the shares owned minus what they cost (USD)"""
+        cost_basis = self.cost_basis
+        if cost_basis is None:
+            return None
+
+        return self.shares_usd - cost_basis
@@ -0,0 +1,132 @@
+from threading import Lock
+from time import monotonic, sleep
+from typing import Iterable, Optional, Union
+from weakref import WeakKeyDictionary
+
+from .receipt import TransactionReceipt, build_receipt
+from .price_feed import PriceFeed
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from attrdict import AttrDict
+
+
+class NonceManager:
+    def __init__(self, w3_provider: Web3, address: str):
+        """
+        Allocates transaction nonces for one account locally, so consecutive transactions can be signed and sent
+        without waiting for the previous ones to be mined or asking the node for the transaction count each time.
+
+        The counter is loaded from eth_getTransactionCount (pending) on first use and after resync().
+
+        :param w3_provider: Web3 provider
+        :param address: The account address
+        """
+        self.w3_provider = w3_provider
+        self.address = Web3.toChecksumAddress(address)
+        self._next = None
+        self._lock = Lock()
+
+    def allocate(self) -> int:
+        """Returns the next nonce of the account and reserves it"""
+        with self._lock:
+            if self._next is None:
+                self._next = self.w3_provider.eth.get_transaction_count(self.address, "pending")
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def resync(self) -> None:
+        """Forget the local counter - the next allocation reloads it from the node (call after a failed send)"""
+        with self._lock:
+            self._next = None
+
+
+_nonce_managers = WeakKeyDictionary()  # Web3 -> {address (lowercase): NonceManager}
+_nonce_managers_lock = Lock()
+
+
+def get_nonce_manager(w3_provider: Web3, address: str) -> NonceManager:
+    """Returns the NonceManager shared by every position of the given account on the given provider"""
+    with _nonce_managers_lock:
+        managers = _nonce_managers.setdefault(w3_provider, {})
+        if address.lower() not in managers:
+            managers[address.lower()] = NonceManager(w3_provider, address)
+        return managers[address.lower()]
+
+
+class PendingTransaction:
+    def __init__(self, w3_provider: Web3, transaction_hash: Union[HexBytes, str], nonce: int, gas_price: int = None,
+                 price_feed: PriceFeed = None, contract_addresses: Iterable[str] = None):
+        """
+        Handle of a transaction that was broadcast but not necessarily mined yet
+
+        :param w3_provider: Web3 provider the transaction was sent with
+        :param transaction_hash: The transaction hash
+        :param nonce: The nonce the transaction was signed with
+        :param gas_price: The gasPrice (wei) the transaction was sent with (used to price the gas spend)
+        :param price_feed: (Optional) The BNB/USD price feed used to build the receipt
+        :param contract_addresses: (Optional) The contracts whose logs are decoded in the receipt (See build_receipt())
+        """
+        self.w3_provider = w3_provider
+        self.transactionHash = HexBytes(transaction_hash)
+        self.nonce = nonce
+        self.gas_price = gas_price
+        self.price_feed = price_feed
+        self.contract_addresses = contract_addresses
+        self._receipt = None
+
+    def __repr__(self) -> str:
+        return f"PendingTransaction({self.transactionHash.hex()}, nonce={self.nonce})"
+
+    def done(self) -> bool:
+        """Returns True once the transaction was mined (single non-blocking receipt request)"""
+        if self._receipt is None:
+            try:
+                self._set_receipt(self.w3_provider.eth.get_transaction_receipt(self.transactionHash))
+            except TransactionNotFound:
+                return False
+        return True
+
+    def result(self, timeout: float = 120, poll_latency: float = 0.5) -> Union[TransactionReceipt, AttrDict]:
+        """
+        Wait for the transaction to be mined and return its receipt
+
+        :param timeout: Seconds to wait before raising web3.exceptions.TimeExhausted
+        :param poll_latency: Seconds between receipt requests
+        :return: TransactionReceipt object
+        """
+        if self._receipt is None:
+            self._set_receipt(self.w3_provider.eth.wait_for_transaction_receipt(self.transactionHash, timeout=timeout,
+                                                                                poll_latency=poll_latency))
+        return self._receipt
+
+    def _set_receipt(self, receipt) -> None:
+        receipt = dict(receipt)
+        try:
+            self._receipt = build_receipt(receipt, gas_price=self.gas_price, price_feed=self.price_feed,
+                                          contract_addresses=self.contract_addresses)
+        except Exception as exc:
+            print(f"COULD NOT BUILD TRANSACTION RECEIPT OBJECT - {exc}")
+            # Catch case to prevent receipt from being lost if TransactionReceipt object somehow can't be built
+            self._receipt = AttrDict(receipt)
+
+
+def wait_for_all(pending: list[PendingTransaction], timeout: float = 120,
+                 poll_latency: float = 0.5) -> list[Union[TransactionReceipt, AttrDict]]:
+    """
+    Wait for several broadcast transactions at once, polling every unconfirmed one per round
+
+    :param pending: The PendingTransaction handles
+    :param timeout: Seconds to wait for all of them before raising TimeoutError
+    :param poll_latency: Seconds between polling rounds
+    :return: The receipts, in the order of the given handles
+    """
+    deadline = monotonic() + timeout
+    while not all([transaction.done() for transaction in pending]):
+        if monotonic() > deadline:
+            raise TimeoutError(f"Transactions not mined after {timeout} seconds: "
+                               f"{[transaction for transaction in pending if not transaction.done()]}")
+        sleep(poll_latency)
+    return [transaction.result() for transaction in pending]
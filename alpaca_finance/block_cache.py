@@ -0,0 +1,221 @@
+"""
+Block-aware eth_call cache: reads at "latest" are pinned to the current block and answered from memory until a new
+block arrives, and the results of immutable view functions (decimals(), stableToken(), ...) are kept until evicted.
+
+    cache = enable_block_cache(w3_provider, interval=3.0)
+    position.shares()  # eth_call
+    position.shares()  # Same block - served from memory
+"""
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from alpaca_finance import instrumentation
+
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+
+# View functions whose result never changes for a given contract, cached regardless of the block
+IMMUTABLE_FUNCTIONS = ("decimals()", "symbol()", "name()", "stableToken()", "assetToken()", "token0()", "token1()",
+                       "stableTo18ConversionFactor()", "assetTo18ConversionFactor()", "lpToken()")
+IMMUTABLE_SELECTORS = frozenset("0x" + function_signature_to_4byte_selector(signature).hex()
+                                for signature in IMMUTABLE_FUNCTIONS)
+
+
+class BlockTracker:
+    def __init__(self, w3_provider: Web3, interval: float = 3.0):
+        """
+        Keeps track of the latest block number.
+        By default the head is polled lazily (eth_blockNumber at most once per interval, when a read needs it).
+        Call start() to poll from a background thread instead, or feed it with set_block() from a newHeads
+        subscription.
+
+        :param w3_provider: Web3 provider to poll
+        :param interval: Seconds between two eth_blockNumber polls (BSC produces a block every ~3 seconds)
+        """
+        self.w3_provider = w3_provider
+        self.interval = interval
+        self.block_number = None
+        self._polled_at = None
+        self._listeners = []
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def current(self) -> int:
+        """Returns the latest known block number, polling the node first if the last poll is older than the interval"""
+        with self._lock:
+            stale = self._polled_at is None or monotonic() - self._polled_at >= self.interval
+        return self.poll() if stale and self._thread is None else self.block_number
+
+    def poll(self) -> int:
+        """Request the latest block number from the node (eth_blockNumber)"""
+        block_number = self.w3_provider.eth.block_number
+        with self._lock:
+            self._polled_at = monotonic()
+        self.set_block(block_number)
+        return self.block_number
+
+    def set_block(self, block_number: int) -> None:
+        """Advance to the given head (e.g. from a newHeads subscription) - older heads are ignored"""
+        with self._lock:
+            if self.block_number is not None and block_number <= self.block_number:
+                return
+            self.block_number = block_number
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(block_number)
+
+    def add_listener(self, listener: Callable[[int], Any]) -> None:
+        """Register a callable receiving every new block number"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def start(self) -> "BlockTracker":
+        """Poll the head from a daemon thread, so that reads never wait for eth_blockNumber"""
+        if self._thread is None:
+            self.poll()
+            self._stop.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as exc:
+                print(f"COULD NOT POLL THE LATEST BLOCK - {exc}")
+
+
+class BlockCache:
+    def __init__(self, tracker: BlockTracker, max_entries: int = 4096, max_immutable_entries: int = 1024):
+        """
+        eth_call responses keyed on (contract, sender, calldata, block number), plus the responses of
+        IMMUTABLE_SELECTORS keyed on (contract, calldata) only. Least recently used entries are evicted first.
+        Reads at other block tags (earliest, safe, finalized) or at a block hash are not cached.
+
+        :param tracker: BlockTracker that "latest" reads are pinned to
+        :param max_entries: Maximum amount of cached (contract, calldata, block) responses
+        :param max_immutable_entries: Maximum amount of cached immutable (contract, calldata) responses
+        """
+        self.tracker = tracker
+        self.max_entries = max_entries
+        self.max_immutable_entries = max_immutable_entries
+        self.hits = 0
+        self.misses = 0
+        self._responses = OrderedDict()
+        self._immutable = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._responses) + len(self._immutable)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._responses.clear()
+            self._immutable.clear()
+
+    def call(self, params: list, make_request: Callable[[RPCEndpoint, Any], RPCResponse]) -> RPCResponse:
+        """Answer the eth_call from the cache, or send it (pinned to the current block if it reads "latest")"""
+        key, params, response = self.lookup(params)
+        if response is None:
+            response = make_request(RPCEndpoint("eth_call"), params)
+            if key is not None:
+                self.store(key, response)
+        return response
+
+    def lookup(self, params: list) -> tuple[Optional[tuple], list, Optional[RPCResponse]]:
+        """
+        Look the eth_call up without sending it
+
+        :return: (cache key - None if the call is not cacheable, the params pinned to the current block if they read
+                 "latest", the cached response - None on a miss)
+        """
+        transaction, block = params[0], params[1] if len(params) > 1 else "latest"
+        if len(params) > 2 or block == "pending":  # State overrides, simulations
+            return None, params, None
+
+        to, data = transaction.get("to", "").lower(), transaction.get("data", transaction.get("input", ""))
+        sender = transaction.get("from", "").lower()
+        if data[:10] in IMMUTABLE_SELECTORS:
+            key = ("immutable", to, data)
+        else:
+            if block == "latest":
+                block = hex(self.tracker.current())
+                params = [transaction, block]
+            elif not isinstance(block, int) and not (isinstance(block, str) and block.startswith("0x")):
+                return None, params, None  # Other tags, EIP-1898 block hashes
+            key = ("block", to, sender, data, int(block, 16) if isinstance(block, str) else block)
+
+        store = self._immutable if key[0] == "immutable" else self._responses
+        with self._lock:
+            response = store.get(key)
+            if response is not None:
+                store.move_to_end(key)
+        instrumentation.record_cache("block_cache", response is not None)
+        if response is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, params, response
+
+    def store(self, key: tuple, response: RPCResponse) -> None:
+        """Cache the response of a call looked up with self.lookup() (error responses are not cached)"""
+        if "error" in response:
+            return
+        store, max_entries = ((self._immutable, self.max_immutable_entries) if key[0] == "immutable"
+                              else (self._responses, self.max_entries))
+        with self._lock:
+            store[key] = response
+            if len(store) > max_entries:
+                store.popitem(last=False)
+
+    def middleware(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3):
+        """Web3 middleware answering eth_call requests through this cache"""
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            if method != "eth_call":
+                return make_request(method, params)
+            return self.call(params, make_request)
+
+        return middleware
+
+
+def enable_block_cache(w3_provider: Web3, interval: float = 3.0, max_entries: int = 4096,
+                       max_immutable_entries: int = 1024, background: bool = False) -> BlockCache:
+    """
+    Cache the eth_call requests of the provider per block (See BlockCache). Enabling it twice returns the same cache.
+    The cache sits outside the instrumentation and cassette middlewares, so that its hits are not counted as requests.
+
+    :param w3_provider: Web3 provider
+    :param interval: Seconds between two eth_blockNumber polls
+    :param max_entries: Maximum amount of cached (contract, calldata, block) responses
+    :param max_immutable_entries: Maximum amount of cached immutable (contract, calldata) responses
+    :param background: If True, poll the head from a daemon thread instead of lazily
+    :return: The BlockCache (its tracker can be fed by a newHeads subscription with cache.tracker.set_block())
+    """
+    onion = w3_provider.middleware_onion
+    if "block_cache" in onion:
+        return onion["block_cache"].__self__
+
+    cache = BlockCache(BlockTracker(w3_provider, interval), max_entries, max_immutable_entries)
+    onion.inject(cache.middleware, "block_cache", layer=0)
+    # Only the innermost and outermost layers can be injected to, so move the request-level middlewares back inside
+    for name in ("instrumentation", "cassette"):
+        if name in onion:
+            middleware = onion[name]
+            onion.remove(name)
+            onion.inject(middleware, name, layer=0)
+
+    if background:
+        cache.tracker.start()
+    return cache
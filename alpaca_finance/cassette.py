@@ -0,0 +1,266 @@
+"""
+Record/replay of the JSON-RPC and REST exchanges made by the package, for deterministic runs without network access
+(backtests against a frozen chain snapshot, CI, fixtures of performance regression tests).
+
+    with use_cassette("snapshot.json.gz", mode="record"):
+        position.pnl()      # Network requests are recorded
+
+    with use_cassette("snapshot.json.gz", mode="replay"):
+        position.pnl()      # Served from memory, CassetteMiss if the request was never recorded
+
+JSON-RPC requests are keyed by (method, params) - the block identifier is part of the params - and REST requests
+by (HTTP method, URL, query params, body). Headers are not part of the key, and 304 Not Modified responses are not
+recorded, so revalidations replay the last full response.
+
+In auto mode only the requests whose response cannot change are replayed and recorded: JSON-RPC calls pinned to a
+block number or hash (See is_block_pinned()) with a successful non-null result, and non-error REST responses.
+Head-dependent requests (eth_blockNumber, receipts, nonces, calls at "latest" / "pending") always go to the network.
+"""
+from base64 import b64decode, b64encode
+from os import makedirs, replace
+from os.path import dirname, exists, expanduser
+from threading import Lock
+from typing import Any, Callable, Optional
+import gzip
+import json
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+
+MODES = ("record", "replay", "auto")
+
+# Response headers worth keeping for the package's REST clients
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+# JSON-RPC methods whose response never changes
+CONSTANT_RPC_METHODS = ("eth_chainId", "net_version", "eth_getBlockByHash")
+
+# Position of the block identifier in the params of the JSON-RPC methods reading the chain at a block
+BLOCK_PARAM_POSITIONS = {"eth_call": 1, "eth_getBalance": 1, "eth_getCode": 1, "eth_getStorageAt": 2,
+                         "eth_getBlockByNumber": 0}
+
+
+class CassetteMiss(Exception):
+    def __init__(self, key: str):
+        """Raised in replay mode when a request was never recorded"""
+        super().__init__(f"Request not found in the cassette: {key}")
+        self.key = key
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "auto"):
+        """
+        On-disk store of recorded exchanges (gzip-compressed JSON), indexed in memory.
+
+        :param path: The cassette file (loaded if it exists)
+        :param mode: * record: Every request goes to the network and is recorded (overwriting previous recordings)
+                     * replay: Requests are served from the cassette only - unknown requests raise CassetteMiss
+                     * auto: Recorded requests are replayed, the others go to the network and are recorded
+                             (block pinned requests and successful responses only)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode} - must be one of {MODES}")
+
+        self.path = expanduser(path)
+        self.mode = mode
+        self.interactions = {}  # key -> JSON-encoded response
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+        self._lock = Lock()
+
+        if exists(self.path):
+            self.load()
+        elif mode == "replay":
+            raise FileNotFoundError(f"No cassette at {self.path}")
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def __enter__(self) -> "Cassette":
+        set_cassette(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        set_cassette(None)
+        if self.modified:
+            self.save()
+
+    def load(self) -> None:
+        with gzip.open(self.path, "rt") as infile:
+            cassette = json.load(infile)
+        self.interactions = {interaction["key"]: json.dumps(interaction["response"])
+                             for interaction in cassette["interactions"]}
+
+    def save(self) -> None:
+        """Write the cassette to disk (done automatically when leaving use_cassette())"""
+        with self._lock:
+            interactions = [{"key": key, "response": json.loads(response)}
+                            for key, response in self.interactions.items()]
+            self.modified = False
+
+        if dirname(self.path):
+            makedirs(dirname(self.path), exist_ok=True)
+        # Write then rename so that an interrupted run never leaves a truncated cassette
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt") as outfile:
+            json.dump({"version": 1, "interactions": interactions}, outfile, separators=(",", ":"))
+        replace(tmp_path, self.path)
+
+    def lookup(self, key: str) -> Optional[Any]:
+        """Returns the recorded response of the key (a fresh copy), None if it must go to the network"""
+        if self.mode != "record":
+            response = self.interactions.get(key)
+            if response is not None:
+                self.hits += 1
+                return json.loads(response)
+            if self.mode == "replay":
+                raise CassetteMiss(key)
+        self.misses += 1
+        return None
+
+    def record(self, key: str, response: Any) -> None:
+        with self._lock:
+            self.interactions[key] = json.dumps(response, default=_hex)
+            self.modified = True
+
+    """ ------------------------------ JSON-RPC ------------------------------ """
+
+    @staticmethod
+    def rpc_key(method: str, params: Any) -> str:
+        return _key("rpc", method, params)
+
+    def rpc_lookup(self, method: str, params: Any) -> Optional[RPCResponse]:
+        """Returns the recorded JSON-RPC response, None if the request must go to the network"""
+        if self.mode == "auto" and not is_block_pinned(method, params):
+            return None
+        return self.lookup(self.rpc_key(method, params))
+
+    def rpc_record(self, method: str, params: Any, response: RPCResponse) -> None:
+        """Record the JSON-RPC response (in auto mode: only successful non-null results of block pinned requests)"""
+        if self.mode == "auto" and (response.get("result") is None or not is_block_pinned(method, params)):
+            return
+        self.record(self.rpc_key(method, params), {k: v for k, v in response.items() if k != "id"})
+
+    def rpc(self, method: str, params: Any, send: Callable[[], RPCResponse]) -> RPCResponse:
+        """Replay the JSON-RPC response, or send the request and record its response (See rpc_record())"""
+        response = self.rpc_lookup(method, params)
+        if response is None:
+            response = send()
+            self.rpc_record(method, params, response)
+        return response
+
+    """ -------------------------------- REST -------------------------------- """
+
+    @staticmethod
+    def rest_key(method: str, url: str, params: Any = None, json: Any = None, data: Any = None) -> str:
+        return _key("rest", method, url, params, json, data.decode() if isinstance(data, bytes) else data)
+
+    def rest(self, method: str, url: str, send: Callable[[], requests.Response], **kwargs) -> requests.Response:
+        """
+        Replay the REST response, or send the request and record its response
+        (unless 304 Not Modified, or an error status in auto mode)
+        """
+        request = {k: kwargs.get(k) for k in ("params", "json", "data")}
+        key = self.rest_key(method, url, **request)
+        stored = self.lookup(key)
+        if stored is None:
+            response = send()
+            if response.status_code != 304 and not (self.mode == "auto" and response.status_code >= 400):
+                self.record(key, _dump_response(response))
+            return response
+
+        response = requests.Response()
+        response.status_code = stored["status"]
+        response.headers = CaseInsensitiveDict(stored["headers"])
+        response.encoding = "utf-8"
+        response.url = url
+        response.request = requests.Request(method, url, **request).prepare()
+        response._content = b64decode(stored["body"]) if stored.get("base64") else stored["body"].encode()
+        return response
+
+
+def is_block_pinned(method: str, params: Any) -> bool:
+    """
+    True if the JSON-RPC response cannot change with the chain head: constant methods, and reads at a block number
+    or hash (eth_call, eth_getBalance, eth_getCode, eth_getStorageAt, eth_getBlockByNumber, eth_getLogs)
+    """
+    if method in CONSTANT_RPC_METHODS:
+        return True
+    if method == "eth_getLogs":
+        log_filter = params[0] if params else {}
+        return "blockHash" in log_filter or all(_is_pinned_block(log_filter.get(k)) for k in ("fromBlock", "toBlock"))
+    position = BLOCK_PARAM_POSITIONS.get(method)
+    return position is not None and len(params) > position and _is_pinned_block(params[position])
+
+
+def _is_pinned_block(block: Any) -> bool:
+    if isinstance(block, dict):  # EIP-1898 block parameter
+        return "blockHash" in block or _is_pinned_block(block.get("blockNumber"))
+    if isinstance(block, int):
+        return not isinstance(block, bool)
+    return isinstance(block, str) and block.startswith("0x")  # Not a tag (latest, pending, safe, ...)
+
+
+def _key(*parts) -> str:
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=_hex)
+
+
+def _hex(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dump_response(response: requests.Response) -> dict:
+    stored = {"status": response.status_code,
+              "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}}
+    try:
+        stored["body"] = response.content.decode("utf-8")
+    except UnicodeDecodeError:
+        stored["body"] = b64encode(response.content).decode()
+        stored["base64"] = True
+    return stored
+
+
+_cassette = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Returns the active cassette (None when recording/replaying is off)"""
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """Activate the cassette for every thread of the process (None to go back to the network)"""
+    global _cassette
+    _cassette = cassette
+
+
+def use_cassette(path: str, mode: str = "auto") -> Cassette:
+    """
+    Context manager recording/replaying every JSON-RPC and REST request made inside it (See Cassette).
+    The cassette is saved when leaving the block if new requests were recorded.
+    """
+    return Cassette(path, mode)
+
+
+def cassette_middleware(make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3):
+    """Web3 middleware routing the requests through the active cassette (inject it innermost)"""
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        cassette = _cassette
+        if cassette is None:
+            return make_request(method, params)
+        return cassette.rpc(method, params, lambda: make_request(method, params))
+
+    return middleware
+
+
+def install_cassette_middleware(w3_provider: Web3) -> Web3:
+    """Add the cassette middleware to a Web3 instance that was not created by alpaca_finance.util"""
+    if "cassette" not in w3_provider.middleware_onion:
+        w3_provider.middleware_onion.inject(cassette_middleware, "cassette", layer=0)
+    return w3_provider
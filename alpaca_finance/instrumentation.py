@@ -0,0 +1,306 @@
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Optional
+import json
+
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+
+@dataclass
+class Event:
+    """Dataclass to model one instrumented request, cache lookup or retry"""
+    kind: str  # rpc, rest, cache or retry
+    name: str  # JSON-RPC method, REST host + path, or cache name
+    operation: Optional[str] = None  # The outermost high-level operation in progress (e.g. pnl)
+    duration: float = 0.0  # Seconds
+    request_bytes: int = 0
+    response_bytes: int = 0
+    error: Optional[str] = None
+    hit: Optional[bool] = None  # For cache events
+
+
+_observers = []  # Callables receiving every Event - instrumentation is disabled while empty
+_observers_lock = Lock()
+_operation = ContextVar("alpaca_finance_operation", default=None)
+
+
+def add_observer(observer: Callable[[Event], Any]) -> None:
+    """Register a callable that receives every Event (called synchronously, in the thread making the request)"""
+    global _observers
+    with _observers_lock:
+        _observers = _observers + [observer]
+
+
+def remove_observer(observer: Callable[[Event], Any]) -> None:
+    global _observers
+    with _observers_lock:
+        _observers = [o for o in _observers if o is not observer]
+
+
+def enabled() -> bool:
+    return bool(_observers)
+
+
+def emit(event: Event) -> None:
+    """Send the event to every observer (tagged with the current operation)"""
+    if event.operation is None:
+        event.operation = _operation.get()
+    for observer in _observers:
+        observer(event)
+
+
+def record_cache(name: str, hit: bool) -> None:
+    """Record a lookup of one of the package caches"""
+    if _observers:
+        emit(Event(kind="cache", name=name, hit=hit))
+
+
+def record_retry(name: str, error: str = None) -> None:
+    """Record that a request is retried"""
+    if _observers:
+        emit(Event(kind="retry", name=name, error=error))
+
+
+class operation:
+    def __init__(self, name: str):
+        """
+        Context manager tagging every event emitted inside it with the operation name.
+        Nested operations keep the outermost name, so that e.g. pnl() accounts for the requests of snapshot().
+        """
+        self.name = name
+        self._token = None
+
+    def __enter__(self):
+        if _operation.get() is None:
+            self._token = _operation.set(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if self._token is not None:
+            _operation.reset(self._token)
+            self._token = None
+
+
+def instrumented(name: str):
+    """Decorator running the function inside operation(name) while instrumentation is enabled"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _observers:
+                return fn(*args, **kwargs)
+            with operation(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor running every task in a copy of the context it was submitted from,
+    so that the requests made by the workers are tagged with the operation in progress
+    """
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(copy_context().run, fn, *args, **kwargs)
+
+
+def instrumentation_middleware(make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3):
+    """
+    Web3 middleware emitting an rpc Event per request (inject it innermost, so cached responses are not counted).
+    Payload sizes are the JSON sizes of the params and the response.
+    """
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if not _observers:
+            return make_request(method, params)
+
+        started = perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception as exc:
+            emit(Event(kind="rpc", name=method, duration=perf_counter() - started, error=type(exc).__name__))
+            raise
+        record_rpc(method, params, response, perf_counter() - started)
+        return response
+
+    return middleware
+
+
+def record_rpc(method: str, params: Any, response: RPCResponse, duration: float) -> None:
+    """Emit the rpc Event of a JSON-RPC exchange (payload sizes are the JSON sizes of the params and the response)"""
+    emit(Event(kind="rpc", name=method, duration=duration,
+               request_bytes=_json_size(params), response_bytes=_json_size(response),
+               error=str(response["error"].get("code")) if "error" in response else None))
+
+
+def instrument_web3(w3_provider: Web3) -> Web3:
+    """Add the instrumentation middleware to a Web3 instance that was not created by alpaca_finance.util"""
+    if "instrumentation" not in w3_provider.middleware_onion:
+        w3_provider.middleware_onion.inject(instrumentation_middleware, "instrumentation", layer=0)
+    return w3_provider
+
+
+def _json_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+# Latency histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class MetricsCollector:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+        Observer aggregating the events into metrics:
+            * latency histograms and payload sizes per (kind, name)
+            * request counts per (operation, kind, name)
+            * cache hits/misses per cache
+            * retries per name
+
+        Register it with add_observer(collector) or use it as a context manager.
+        """
+        self.buckets = buckets
+        self._lock = Lock()
+        self.reset()
+
+    def __call__(self, event: Event) -> None:
+        with self._lock:
+            if event.kind == "cache":
+                self.cache[event.name][0 if event.hit else 1] += 1
+                return
+            if event.kind == "retry":
+                self.retries[event.name] += 1
+                return
+
+            key = (event.kind, event.name)
+            self.histograms[key][bisect_left(self.buckets, event.duration)] += 1
+            self.durations[key] += event.duration
+            self.request_bytes[key] += event.request_bytes
+            self.response_bytes[key] += event.response_bytes
+            self.calls[(event.operation or "", event.kind, event.name)] += 1
+            if event.error is not None:
+                self.errors[key] += 1
+
+    def __enter__(self) -> "MetricsCollector":
+        add_observer(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        remove_observer(self)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = defaultdict(lambda: [0] * len(self.buckets))
+            self.durations = defaultdict(float)
+            self.request_bytes = defaultdict(int)
+            self.response_bytes = defaultdict(int)
+            self.calls = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.cache = defaultdict(lambda: [0, 0])  # name -> [hits, misses]
+            self.retries = defaultdict(int)
+
+    def calls_per_operation(self) -> dict[str, dict[str, int]]:
+        """Returns {operation: {"kind:name": count}} - e.g. {"pnl": {"rpc:eth_call": 1, "rest:api...": 1}}"""
+        with self._lock:
+            result = defaultdict(dict)
+            for (op, kind, name), count in self.calls.items():
+                result[op or "(none)"][f"{kind}:{name}"] = count
+            return dict(result)
+
+    def cache_hit_rates(self) -> dict[str, float]:
+        with self._lock:
+            return {name: hits / (hits + misses) for name, (hits, misses) in self.cache.items() if hits + misses}
+
+    def summary(self) -> dict[str, dict]:
+        """Returns {"kind:name": {count, total_seconds, mean_seconds, request_bytes, response_bytes, errors}}"""
+        with self._lock:
+            result = {}
+            for key, histogram in self.histograms.items():
+                count = sum(histogram)
+                result[f"{key[0]}:{key[1]}"] = {"count": count,
+                                                "total_seconds": self.durations[key],
+                                                "mean_seconds": self.durations[key] / count if count else 0.0,
+                                                "request_bytes": self.request_bytes[key],
+                                                "response_bytes": self.response_bytes[key],
+                                                "errors": self.errors[key]}
+            return result
+
+    def to_openmetrics(self) -> str:
+        """Returns the metrics in the Prometheus/OpenMetrics text exposition format"""
+        lines = ["# TYPE alpaca_request_duration_seconds histogram"]
+        with self._lock:
+            for (kind, name), histogram in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",name="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'alpaca_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"alpaca_request_duration_seconds_count{{{labels}}} {cumulative}")
+                lines.append(f"alpaca_request_duration_seconds_sum{{{labels}}} {self.durations[(kind, name)]}")
+
+            lines.append("# TYPE alpaca_request_bytes counter")
+            for (kind, name), size in sorted(self.request_bytes.items()):
+                lines.append(f'alpaca_request_bytes_total{{kind="{kind}",name="{_escape(name)}"}} {size}')
+            lines.append("# TYPE alpaca_response_bytes counter")
+            for (kind, name), size in sorted(self.response_bytes.items()):
+                lines.append(f'alpaca_response_bytes_total{{kind="{kind}",name="{_escape(name)}"}} {size}')
+            lines.append("# TYPE alpaca_request_errors counter")
+            for (kind, name), count in sorted(self.errors.items()):
+                lines.append(f'alpaca_request_errors_total{{kind="{kind}",name="{_escape(name)}"}} {count}')
+
+            lines.append("# TYPE alpaca_operation_requests counter")
+            for (op, kind, name), count in sorted(self.calls.items()):
+                lines.append(f'alpaca_operation_requests_total{{operation="{_escape(op)}",kind="{kind}",'
+                             f'name="{_escape(name)}"}} {count}')
+
+            lines.append("# TYPE alpaca_cache_lookups counter")
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'alpaca_cache_lookups_total{{cache="{_escape(name)}",result="hit"}} {hits}')
+                lines.append(f'alpaca_cache_lookups_total{{cache="{_escape(name)}",result="miss"}} {misses}')
+
+            lines.append("# TYPE alpaca_retries counter")
+            for name, count in sorted(self.retries.items()):
+                lines.append(f'alpaca_retries_total{{name="{_escape(name)}"}} {count}')
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Expose self.to_openmetrics() for Prometheus scraping on http://host:port/metrics (daemon thread).
+        Only reachable from this machine by default: pass host="0.0.0.0" to listen on every interface.
+
+        :return: The HTTP server (call .shutdown() to stop it)
+        """
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = collector.to_openmetrics().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
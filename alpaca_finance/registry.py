@@ -0,0 +1,360 @@
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha1
+from os import makedirs, replace
+from os.path import join, exists, dirname, expanduser
+from threading import Lock
+from time import time
+from typing import Optional
+import asyncio
+import json
+
+from alpaca_finance import transport, instrumentation
+
+import aiohttp
+
+
+VAULT_SUMMARY_URL = "https://alpaca-static-api.alpacafinance.org/bsc/v1/landing/summary.json"
+MAINNET_CONFIG_URL = "https://raw.githubusercontent.com/alpaca-finance/bsc-alpaca-contract/main/.mainnet.json"
+
+
+@dataclass
+class Token:
+    """Dataclass to model a token reference of summary.json"""
+    __slots__ = ("address", "symbol")
+    address: str
+    symbol: str
+
+
+@dataclass
+class VaultSummary:
+    """Dataclass to model a summary.json strategyPools entry, with the numeric fields converted once"""
+    __slots__ = ("key", "name", "address", "apr", "apy", "aprTradingFeeExcluded", "apyTradingFeeExcluded", "tvl",
+                 "tvlIncludingDebt", "shareTokenPrice", "capacity", "inceptionDate", "iuToken", "workingToken",
+                 "tokenA", "tokenB")
+    key: str
+    name: str
+    address: str
+    apr: float  # In % form
+    apy: float  # In % form
+    aprTradingFeeExcluded: float
+    apyTradingFeeExcluded: float
+    tvl: float
+    tvlIncludingDebt: float
+    shareTokenPrice: float
+    capacity: float
+    inceptionDate: Optional[datetime]
+    iuToken: Optional[Token]
+    workingToken: Optional[Token]
+    tokenA: Optional[Token]  # The stable token of neutral vaults
+    tokenB: Optional[Token]
+
+    @classmethod
+    def from_pool(cls, pool: dict) -> "VaultSummary":
+        def number(field: str) -> float:
+            return float(pool[field]) if pool.get(field) is not None else float("nan")
+
+        def token(data: Optional[dict]) -> Optional[Token]:
+            return None if data is None else Token(data['address'], data['symbol'])
+
+        working_token = pool.get('workingToken') or {}
+        inception_date = pool.get('inceptionDate')
+        if inception_date is not None:
+            inception_date = datetime.fromisoformat(inception_date.replace("Z", "+00:00"))
+        return cls(key=pool['key'], name=pool['name'], address=pool['address'],
+                   apr=number('apr'), apy=number('apy'),
+                   aprTradingFeeExcluded=number('aprTradingFeeExcluded'),
+                   apyTradingFeeExcluded=number('apyTradingFeeExcluded'),
+                   tvl=number('tvl'), tvlIncludingDebt=number('tvlIncludingDebt'),
+                   shareTokenPrice=number('shareTokenPrice'), capacity=number('capacity'),
+                   inceptionDate=inception_date,
+                   iuToken=token(pool.get('iuToken')), workingToken=token(working_token or None),
+                   tokenA=token(working_token.get('tokenA')), tokenB=token(working_token.get('tokenB')))
+
+
+class CachedDocument:
+    def __init__(self, url: str, ttl: float = 300, cache_dir: str = None, select: tuple = None):
+        """
+        A remote JSON document that is downloaded at most once per TTL.
+        Stale documents are revalidated with ETag/If-Modified-Since, so an unchanged document costs a 304 only.
+
+        :param url: The URL of the JSON document
+        :param ttl: Seconds before the document is considered stale and revalidated
+        :param cache_dir: (Optional) Directory to persist the document to, so that new processes can start warm
+        :param select: (Optional) Key path of the only value to keep, returned nested under the same keys
+                       (e.g. ("data", "strategyPools") -> {"data": {"strategyPools": [...]}})
+        """
+        self.url = url
+        self.ttl = ttl
+        self.select = select
+        self.cache_path = None if cache_dir is None else join(expanduser(cache_dir), sha1(url.encode()).hexdigest() + ".json")
+
+        self.data = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0
+        self.version = 0  # Incremented every time the content changes
+
+        self._lock = Lock()
+
+        if self.cache_path is not None and exists(self.cache_path):
+            self._load()
+
+    def get(self) -> dict:
+        """Return the document, revalidating it first if it is older than the TTL"""
+        with self._lock:
+            fresh = self.data is not None and time() - self.fetched_at < self.ttl
+            if not fresh:
+                self._refresh()
+            instrumentation.record_cache(self.url, fresh)
+            return self.data
+
+    def invalidate(self) -> None:
+        """Force the next self.get() to revalidate the document"""
+        with self._lock:
+            self.fetched_at = 0.0
+
+    async def aget(self, session: aiohttp.ClientSession) -> dict:
+        """Async counterpart of self.get() using the given aiohttp session"""
+        if self.data is None or time() - self.fetched_at >= self.ttl:
+            async with session.get(self.url, headers=self._conditional_headers()) as r:
+                body = (await r.read()).decode()
+                with self._lock:
+                    self._update(r.status, r.headers, self._parse(body) if r.status == 200 else None, body)
+        return self.data
+
+    def _refresh(self) -> None:
+        r = transport.get(self.url, headers=self._conditional_headers())
+        body = r.content.decode()
+        self._update(r.status_code, r.headers, self._parse(body) if r.status_code == 200 else None, body)
+
+    def _parse(self, text: str) -> dict:
+        # The whole document is decoded (the C decoder is faster than skipping the other keys in Python),
+        # but only the selected value is kept
+        data = json.loads(text)
+        if self.select is None:
+            return data
+        for key in self.select:
+            data = data[key]
+        for key in reversed(self.select):
+            data = {key: data}
+        return data
+
+    def _conditional_headers(self) -> dict:
+        headers = {}
+        if self.data is not None:
+            if self.etag is not None:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified is not None:
+                headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def _update(self, status_code: int, headers, data: Optional[dict], text: str = None) -> None:
+        if status_code == 304:
+            self.fetched_at = time()
+        elif status_code == 200:
+            self.data = data
+            self.etag = headers.get('ETag')
+            self.last_modified = headers.get('Last-Modified')
+            self.fetched_at = time()
+            self.version += 1
+        else:
+            raise Exception(f"{status_code}: {text}")
+
+        if self.cache_path is not None:
+            self._store()
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_path) as infile:
+                cached = json.load(infile)
+        except (OSError, ValueError):
+            return
+
+        self.data = cached['data']
+        self.etag = cached.get('etag')
+        self.last_modified = cached.get('last_modified')
+        self.fetched_at = cached.get('fetched_at', 0.0)
+        self.version += 1
+
+    def _store(self) -> None:
+        makedirs(dirname(self.cache_path), exist_ok=True)
+        # Write then rename so that concurrent processes never read a partial file
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump({"etag": self.etag, "last_modified": self.last_modified,
+                       "fetched_at": self.fetched_at, "data": self.data}, outfile)
+        replace(tmp_path, self.cache_path)
+
+
+class VaultRegistry:
+    def __init__(self, ttl: float = 300, cache_dir: str = None, summary_url: str = VAULT_SUMMARY_URL,
+                 mainnet_url: str = MAINNET_CONFIG_URL):
+        """
+        Process-wide cache of the Alpaca Finance vault metadata:
+            * landing/summary.json (strategyPools) - APY, TVL, capacity, ...
+            * bsc-alpaca-contract/.mainnet.json (DeltaNeutralVaults) - gateway, tokens, deployedBlock, ...
+
+        Lookups are indexed by vault key, iuToken symbol and address.
+
+        :param ttl: Seconds before a document is revalidated
+        :param cache_dir: (Optional) Directory used to persist the documents between processes
+        :param summary_url: The URL of summary.json (e.g. a local mirror)
+        :param mainnet_url: The URL of .mainnet.json (e.g. a local mirror)
+        """
+        # Only strategyPools is decoded and kept out of summary.json (it also lists the lending/farming pools)
+        self.summary = CachedDocument(summary_url, ttl=ttl, cache_dir=cache_dir, select=("data", "strategyPools"))
+        self.mainnet = CachedDocument(mainnet_url, ttl=ttl, cache_dir=cache_dir)
+
+        self._summary_index = (None, {}, {}, {})  # (version, by key, by iuToken symbol, by address)
+        self._summaries = (None, {})  # (version, vault key -> VaultSummary)
+        self._mainnet_index = (None, {}, {})  # (version, by address, by symbol)
+
+    def strategy_pools(self) -> list[dict]:
+        """Return all vaults under the "strategyPools" key of summary.json"""
+        return self._index_summary(self.summary.get())
+
+    def _index_summary(self, document: dict) -> list[dict]:
+        pools = document["data"]["strategyPools"]
+
+        if self._summary_index[0] != self.summary.version:
+            by_key, by_symbol, by_address = {}, {}, {}
+            for pool in pools:
+                by_key[pool['key'].lower()] = pool
+                by_address[pool['address'].lower()] = pool
+                if "iuToken" in pool:
+                    by_symbol.setdefault(pool['iuToken']['symbol'].lower(), pool)
+            self._summary_index = (self.summary.version, by_key, by_symbol, by_address)
+
+        return pools
+
+    def strategy_pool(self, key: str) -> dict:
+        """
+        Return the summary.json data for the given vault
+
+        :param key: The vault key (e.g. n3x-BNBBUSD-PCS1), iuToken symbol, or vault address
+        :raises KeyError: If no vault matches the key
+        """
+        self.strategy_pools()
+        return self._find_pool(key)
+
+    async def astrategy_pool(self, key: str, session: aiohttp.ClientSession) -> dict:
+        """Async counterpart of self.strategy_pool() (summary.json is revalidated with the given aiohttp session)"""
+        self._index_summary(await self.summary.aget(session))
+        return self._find_pool(key)
+
+    def _find_pool(self, key: str) -> dict:
+        _, by_key, by_symbol, by_address = self._summary_index
+        key = key.lower()
+
+        if key in by_key:
+            return by_key[key]
+        if key in by_symbol:
+            print(f"Warning: Had to use iuToken to match vault data instead of key (Key = {by_symbol[key]['key']})")
+            return by_symbol[key]
+        return by_address[key]
+
+    def vault_summary(self, key: str) -> VaultSummary:
+        """
+        Return the summary.json data for the given vault as a typed VaultSummary (built once per document version)
+
+        :param key: The vault key (e.g. n3x-BNBBUSD-PCS1), iuToken symbol, or vault address
+        :raises KeyError: If no vault matches the key
+        """
+        return self._summary_of(self.strategy_pool(key))
+
+    async def avault_summary(self, key: str, session: aiohttp.ClientSession) -> VaultSummary:
+        """Async counterpart of self.vault_summary() (summary.json is revalidated with the given aiohttp session)"""
+        return self._summary_of(await self.astrategy_pool(key, session))
+
+    def _summary_of(self, pool: dict) -> VaultSummary:
+        version, summaries = self._summaries
+        if version != self.summary.version:
+            summaries = {}
+            self._summaries = (self.summary.version, summaries)
+
+        summary = summaries.get(pool['key'])
+        if summary is None:
+            summary = summaries[pool['key']] = VaultSummary.from_pool(pool)
+        return summary
+
+    def vault_summaries(self) -> list[VaultSummary]:
+        """Return every strategyPools entry of summary.json as a typed VaultSummary"""
+        return [self.vault_summary(pool['key']) for pool in self.strategy_pools()]
+
+    def delta_neutral_vaults(self) -> list[dict]:
+        """Return all vaults under the "DeltaNeutralVaults" key of .mainnet.json"""
+        return self._index_mainnet(self.mainnet.get())
+
+    def _index_mainnet(self, document: dict) -> list[dict]:
+        vaults = document['DeltaNeutralVaults']
+
+        if self._mainnet_index[0] != self.mainnet.version:
+            self._mainnet_index = (self.mainnet.version,
+                                   {vault['address'].lower(): vault for vault in vaults},
+                                   {vault['symbol'].lower(): vault for vault in vaults if "symbol" in vault})
+
+        return vaults
+
+    def delta_neutral_vault(self, address: str) -> dict:
+        """
+        Return the .mainnet.json contract addresses for the given vault
+
+        :param address: The vault address or symbol (e.g. L3x-BUSDBTCB-PCS2)
+        :raises KeyError: If no vault matches the address
+        """
+        self.delta_neutral_vaults()
+        return self._find_vault(address)
+
+    async def adelta_neutral_vault(self, address: str, session: aiohttp.ClientSession) -> dict:
+        """Async counterpart of self.delta_neutral_vault() (.mainnet.json is revalidated with the given aiohttp session)"""
+        self._index_mainnet(await self.mainnet.aget(session))
+        return self._find_vault(address)
+
+    def _find_vault(self, address: str) -> dict:
+        _, by_address, by_symbol = self._mainnet_index
+        address = address.lower()
+
+        return by_address[address] if address in by_address else by_symbol[address]
+
+    def shared_strategies(self) -> dict:
+        """Return the "SharedStrategies" key of .mainnet.json"""
+        return self.mainnet.get()['SharedStrategies']
+
+    async def aload(self, session: aiohttp.ClientSession) -> None:
+        """Revalidate both documents with the given aiohttp session, so that the lookups that follow are free"""
+        await asyncio.gather(self.summary.aget(session), self.mainnet.aget(session))
+
+    def invalidate(self) -> None:
+        """Force both documents to be revalidated on the next lookup"""
+        self.summary.invalidate()
+        self.mainnet.invalidate()
+
+
+_registry = None
+_registry_lock = Lock()
+
+
+def get_registry() -> VaultRegistry:
+    """Return the process-wide VaultRegistry (created with the default TTL on first use)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = VaultRegistry()
+        return _registry
+
+
+def configure_registry(ttl: float = 300, cache_dir: str = None, summary_url: str = VAULT_SUMMARY_URL,
+                       mainnet_url: str = MAINNET_CONFIG_URL) -> VaultRegistry:
+    """
+    Replace the process-wide VaultRegistry
+
+    :param ttl: Seconds before a document is revalidated
+    :param cache_dir: (Optional) Directory used to persist the documents between processes
+    :param summary_url: The URL of summary.json (e.g. a local mirror)
+    :param mainnet_url: The URL of .mainnet.json (e.g. a local mirror)
+    """
+    global _registry
+    with _registry_lock:
+        _registry = VaultRegistry(ttl=ttl, cache_dir=cache_dir, summary_url=summary_url, mainnet_url=mainnet_url)
+        return _registry
@@ -0,0 +1,230 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Optional
+
+from alpaca_finance import transport
+
+import requests
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+
+# Methods that are routed to one node for as long as it stays healthy, so that a transaction, its nonce and its
+# receipt are all seen by the same node:
+STICKY_RPC_METHODS = frozenset({"eth_sendRawTransaction", "eth_sendTransaction", "eth_getTransactionCount",
+                                "eth_getTransactionReceipt", "eth_getTransactionByHash"})
+
+# JSON-RPC errors answered with HTTP 200 that are specific to the endpoint (rate limits, lagging or pruned nodes),
+# not to the request: the endpoint is put in cooldown and the request is sent to the next one
+RETRYABLE_RPC_ERROR_CODES = frozenset({-32005, -32098, -32099, 429})
+RETRYABLE_RPC_ERROR_MESSAGES = ("rate limit", "limit exceeded", "too many requests", "header not found",
+                                "missing trie node", "unknown block", "timeout")
+
+
+class EndpointRPCError(Exception):
+    def __init__(self, response: RPCResponse):
+        """Raised by RoutedHTTPProvider when an endpoint answered with a retryable JSON-RPC error"""
+        super().__init__(response["error"] if isinstance(response, dict) else response)
+        self.response = response
+
+
+def is_retryable_rpc_error(response: RPCResponse) -> bool:
+    """Returns True if the response (or a response of a batch) is a JSON-RPC error worth retrying on another endpoint"""
+    if isinstance(response, list):
+        return any(is_retryable_rpc_error(item) for item in response)
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in RETRYABLE_RPC_ERROR_CODES or any(m in message for m in RETRYABLE_RPC_ERROR_MESSAGES)
+
+
+class Endpoint:
+    def __init__(self, uri: str, rate_limit: float = None, window: int = 100):
+        """
+        Latency, error and rate limit bookkeeping for one RPC endpoint
+
+        :param uri: The RPC URL
+        :param rate_limit: Maximum requests per second sent to this endpoint (None = unlimited)
+        :param window: Amount of recent requests used for the latency percentiles and error rate
+        """
+        self.uri = uri
+        self.rate_limit = rate_limit
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+        self._tokens = rate_limit
+        self._refilled_at = monotonic()
+        self._lock = Lock()
+
+    def record(self, latency: Optional[float], error: bool) -> None:
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.errors.append(error)
+
+    def percentile(self, pct: float) -> float:
+        """Returns the latency percentile (seconds) of the recent requests, 0 if there is no data yet"""
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct))] if latencies else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+    def healthy(self, max_error_rate: float) -> bool:
+        return monotonic() >= self.cooldown_until and self.error_rate <= max_error_rate
+
+    def acquire(self) -> float:
+        """Take a rate limit token, returns 0 if one was available, otherwise the seconds until the next token"""
+        if self.rate_limit is None:
+            return 0.0
+
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_limit
+
+
+class RoutedHTTPProvider(JSONBaseProvider):
+    def __init__(self, endpoint_uris: list[str], rate_limit: float = None, hedge: bool = True,
+                 hedge_percentile: float = 0.95, max_error_rate: float = 0.25, cooldown: float = 30,
+                 window: int = 100, max_workers: int = 32):
+        """
+        Web3 provider spreading JSON-RPC requests over several endpoints.
+        Reads go to the fastest healthy endpoint, and a duplicate (hedged) request is sent to the next best endpoint
+        when the first one is slower than its usual p95 latency; the first response wins.
+        Transactions and related reads (see STICKY_RPC_METHODS) stick to a single endpoint.
+        HTTP errors and retryable JSON-RPC errors (See RETRYABLE_RPC_ERROR_CODES) count as endpoint failures.
+
+        :param endpoint_uris: The RPC URLs to route between
+        :param rate_limit: Maximum requests per second per endpoint (None = unlimited)
+        :param hedge: If True, send hedged requests for slow reads
+        :param hedge_percentile: Latency percentile of the primary endpoint after which a read is hedged
+        :param max_error_rate: Endpoints with a higher recent error rate are considered unhealthy
+        :param cooldown: Seconds an endpoint is skipped after it fails
+        :param window: Amount of recent requests used for the latency and error statistics
+        :param max_workers: Maximum amount of in-flight requests
+        """
+        super().__init__()
+        if not endpoint_uris:
+            raise ValueError("At least one RPC endpoint is required")
+
+        self.endpoints = [Endpoint(uri, rate_limit, window) for uri in endpoint_uris]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+
+        self._sticky = None
+        self._sticky_lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __str__(self) -> str:
+        return f"RPC router {[endpoint.uri for endpoint in self.endpoints]}"
+
+    def ranked_endpoints(self) -> list[Endpoint]:
+        """Endpoints ordered by preference: healthy first, then by median latency"""
+        return sorted(self.endpoints, key=lambda e: (not e.healthy(self.max_error_rate), e.percentile(0.5)))
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+
+        if method in STICKY_RPC_METHODS:
+            return self._send_sticky(method, request_data)
+
+        ranked = self.ranked_endpoints()
+        if not self.hedge or len(ranked) == 1:
+            return self._send_with_failover(ranked, method, request_data)
+
+        primary = self._executor.submit(self._send, ranked[0], request_data)
+        done, _ = wait([primary], timeout=ranked[0].percentile(self.hedge_percentile) or None)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        # Slow or failed primary: race it against the next best endpoint
+        pending = {primary, self._executor.submit(self._send, ranked[1], request_data)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+
+        return self._send_with_failover(ranked[2:] or ranked, method, request_data)
+
+    def make_batch_request(self, batch: list[tuple[str, Any]]) -> list[RPCResponse]:
+        """
+        Send the (idempotent) requests in one JSON-RPC batch to the best endpoint, failing over like a single read,
+        and return their responses in order. Batches rejected by the node are sent one request at a time.
+        """
+        responses = self._send_with_failover(self.ranked_endpoints(), RPCEndpoint("batch"),
+                                             transport.encode_rpc_batch(batch))
+        responses = transport.rpc_batch_responses(responses, len(batch))
+        if responses is None:
+            return [self.make_request(RPCEndpoint(method), params) for method, params in batch]
+        return responses
+
+    def isConnected(self) -> bool:
+        try:
+            response = self.make_request(RPCEndpoint("web3_clientVersion"), [])
+        except (requests.RequestException, OSError):
+            return False
+        return "error" not in response
+
+    def _send_sticky(self, method: RPCEndpoint, request_data: bytes) -> RPCResponse:
+        with self._sticky_lock:
+            if self._sticky is None or not self._sticky.healthy(self.max_error_rate):
+                self._sticky = self.ranked_endpoints()[0]
+            endpoint = self._sticky
+
+        if method in transport.NON_IDEMPOTENT_RPC_METHODS:
+            try:
+                return self._send(endpoint, request_data)
+            except EndpointRPCError as exc:
+                return exc.response
+        return self._send_with_failover([endpoint] + [e for e in self.ranked_endpoints() if e is not endpoint],
+                                        method, request_data)
+
+    def _send_with_failover(self, endpoints: list[Endpoint], method: RPCEndpoint, request_data: bytes) -> RPCResponse:
+        for i, endpoint in enumerate(endpoints):
+            try:
+                return self._send(endpoint, request_data)
+            except EndpointRPCError as exc:
+                if i == len(endpoints) - 1:
+                    return exc.response
+            except (requests.RequestException, OSError):
+                if i == len(endpoints) - 1:
+                    raise
+
+    def _send(self, endpoint: Endpoint, request_data: bytes) -> RPCResponse:
+        wait_time = endpoint.acquire()
+        while wait_time > 0:
+            sleep(wait_time)
+            wait_time = endpoint.acquire()
+
+        started = monotonic()
+        try:
+            response = transport.get_session().post(endpoint.uri, data=request_data,
+                                                    headers={"Content-Type": "application/json"},
+                                                    timeout=transport.get_config().timeout)
+            response.raise_for_status()
+        except (requests.RequestException, OSError):
+            endpoint.record(None, error=True)
+            endpoint.cooldown_until = monotonic() + self.cooldown
+            raise
+
+        response = self.decode_rpc_response(response.content)
+        if is_retryable_rpc_error(response):
+            endpoint.record(None, error=True)
+            endpoint.cooldown_until = monotonic() + self.cooldown
+            raise EndpointRPCError(response)
+
+        endpoint.record(monotonic() - started, error=False)
+        return response
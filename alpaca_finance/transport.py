@@ -0,0 +1,257 @@
+from dataclasses import dataclass, replace
+from random import uniform
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+import json
+
+from alpaca_finance import instrumentation, cassette
+from alpaca_finance.instrumentation import Event
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """Settings shared by every REST and JSON-RPC request made by the package"""
+    pool_connections: int = 16  # Amount of hosts to keep connection pools for
+    pool_maxsize: int = 32  # Maximum amount of keep-alive connections per host
+    connect_timeout: float = 5
+    read_timeout: float = 30
+    retries: int = 3  # Retries after the first attempt (connection errors, timeouts, 429 and 5xx responses)
+    backoff_factor: float = 0.25  # Base delay in seconds, doubled every retry
+    backoff_max: float = 10
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# JSON-RPC methods that must not be re-sent automatically
+NON_IDEMPOTENT_RPC_METHODS = frozenset({"eth_sendRawTransaction", "eth_sendTransaction"})
+
+_config = TransportConfig()
+_session = None
+_lock = Lock()
+
+
+def configure(**kwargs) -> TransportConfig:
+    """
+    Update the transport settings (See TransportConfig for the available keyword arguments).
+    The pooled session is rebuilt on the next request.
+    """
+    global _config, _session
+    with _lock:
+        _config = replace(_config, **kwargs)
+        _session = None
+        return _config
+
+
+def get_config() -> TransportConfig:
+    return _config
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide keep-alive session shared by all REST and JSON-RPC requests"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_config.pool_connections, pool_maxsize=_config.pool_maxsize)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Returns the jittered exponential backoff delay in seconds before retry number `attempt` (starting at 0)"""
+    return uniform(0, min(_config.backoff_max, _config.backoff_factor * 2 ** attempt))
+
+
+def with_retries(send: Callable[[], requests.Response], name: str = "") -> requests.Response:
+    """
+    Call `send` until it returns a response that is not a retryable status code, or until the retries run out.
+    Connection errors and timeouts are retried as well.
+
+    :param name: Request name reported to the instrumentation observers when retrying (e.g. the URL)
+    """
+    for attempt in range(_config.retries + 1):
+        last_attempt = attempt == _config.retries
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if last_attempt:
+                raise
+            instrumentation.record_retry(name, type(exc).__name__)
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            instrumentation.record_retry(name, str(response.status_code))
+
+        sleep(backoff_delay(attempt))
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """requests.get() through the pooled session, with the configured timeout and retries"""
+    kwargs.setdefault("timeout", _config.timeout)
+    return _instrumented(url, lambda: _request("GET", url, kwargs))
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """requests.post() through the pooled session, with the configured timeout and retries (idempotent requests only)"""
+    kwargs.setdefault("timeout", _config.timeout)
+    return _instrumented(url, lambda: _request("POST", url, kwargs))
+
+
+def _request(method: str, url: str, kwargs: dict) -> requests.Response:
+    """Send the request with retries, through the active cassette if one is recording/replaying"""
+    def send() -> requests.Response:
+        return with_retries(lambda: get_session().request(method, url, **kwargs), name=url)
+
+    active = cassette.get_cassette()
+    return send() if active is None else active.rest(method, url, send, **kwargs)
+
+
+def _instrumented(url: str, request: Callable[[], requests.Response]) -> requests.Response:
+    """Run the REST request, emitting a rest Event (host + path) if instrumentation is enabled"""
+    if not instrumentation.enabled():
+        return request()
+
+    parts = urlsplit(url)
+    started = perf_counter()
+    try:
+        response = request()
+    except requests.RequestException as exc:
+        instrumentation.emit(Event(kind="rest", name=parts.netloc + parts.path, duration=perf_counter() - started,
+                                   error=type(exc).__name__))
+        raise
+    body = response.request.body
+    instrumentation.emit(Event(kind="rest", name=parts.netloc + parts.path, duration=perf_counter() - started,
+                               request_bytes=len(body) if body else 0, response_bytes=len(response.content),
+                               error=str(response.status_code) if response.status_code >= 400 else None))
+    return response
+
+
+def encode_rpc_batch(batch: list[tuple[str, Any]]) -> bytes:
+    """JSON body of a JSON-RPC batch of (method, params) requests (ids = positions in the batch)"""
+    return json.dumps([{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+                       for i, (method, params) in enumerate(batch)]).encode()
+
+
+def rpc_batch_responses(responses: Any, count: int) -> Optional[list[RPCResponse]]:
+    """The decoded responses of a JSON-RPC batch in request order, None if the node rejected the batch"""
+    if not isinstance(responses, list) or len(responses) != count:
+        return None
+    return sorted(responses, key=lambda response: response["id"])
+
+
+def get_json(url: str, **kwargs) -> Any:
+    """GET the given URL and return the decoded JSON body (raises requests.HTTPError on an error status code)"""
+    r = get(url, **kwargs)
+    r.raise_for_status()
+    return r.json()
+
+
+class PooledHTTPProvider(Web3.HTTPProvider):
+    def __init__(self, endpoint_uri: str):
+        """
+        Web3 HTTPProvider that sends JSON-RPC requests through the shared keep-alive session,
+        with the configured timeout and jittered exponential backoff retries.
+        """
+        super().__init__(endpoint_uri, request_kwargs={"timeout": _config.timeout})
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+
+        def send() -> requests.Response:
+            return get_session().post(self.endpoint_uri, data=request_data, headers=self.get_request_headers(),
+                                      timeout=_config.timeout)
+
+        response = send() if method in NON_IDEMPOTENT_RPC_METHODS else with_retries(send, name=method)
+        response.raise_for_status()
+
+        return self.decode_rpc_response(response.content)
+
+    def make_batch_request(self, batch: list[tuple[str, Any]]) -> list[RPCResponse]:
+        """
+        Send the (idempotent) requests in one JSON-RPC batch and return their responses in order.
+        Nodes rejecting the batch (e.g. batch too large) get the requests one by one.
+        """
+        request_data = encode_rpc_batch(batch)
+
+        def send() -> requests.Response:
+            return get_session().post(self.endpoint_uri, data=request_data, headers=self.get_request_headers(),
+                                      timeout=_config.timeout)
+
+        response = with_retries(send, name="batch")
+        response.raise_for_status()
+
+        responses = rpc_batch_responses(self.decode_rpc_response(response.content), len(batch))
+        if responses is None:
+            return [self.make_request(RPCEndpoint(method), params) for method, params in batch]
+        return responses
+
+
+def rpc_batch(w3_provider: Web3, batch: list[tuple[str, Any]]) -> list[RPCResponse]:
+    """
+    Send (idempotent) JSON-RPC requests in one HTTP round-trip and return their raw responses in order.
+    The requests go through the same layers as single requests: eth_calls are answered by the block cache, recorded
+    requests by the active cassette, and the others emit their rpc Events. Providers without make_batch_request()
+    get the requests one by one.
+
+    :param w3_provider: Web3 provider
+    :param batch: (method, params) of the requests
+    """
+    onion = w3_provider.middleware_onion
+    block_cache = onion["block_cache"].__self__ if "block_cache" in onion else None
+    active_cassette = cassette.get_cassette() if "cassette" in onion else None
+    instrumented = "instrumentation" in onion and instrumentation.enabled()
+
+    batch = list(batch)  # eth_calls at "latest" get pinned to the block cache's block
+    responses, keys, pending = [None] * len(batch), [None] * len(batch), []
+    for i, (method, params) in enumerate(batch):
+        if method == "eth_call" and block_cache is not None:
+            keys[i], params, responses[i] = block_cache.lookup(params)
+            batch[i] = method, params
+            if responses[i] is not None:
+                continue
+        if active_cassette is not None:
+            responses[i] = active_cassette.rpc_lookup(method, params)
+            if responses[i] is not None:
+                if instrumented:
+                    instrumentation.record_rpc(method, params, responses[i], 0.0)
+                continue
+        pending.append(i)
+
+    if pending:
+        provider = w3_provider.provider
+        started = perf_counter()
+        try:
+            if hasattr(provider, "make_batch_request"):
+                sent = provider.make_batch_request([batch[i] for i in pending])
+            else:
+                sent = [provider.make_request(RPCEndpoint(batch[i][0]), batch[i][1]) for i in pending]
+        except Exception as exc:
+            if instrumented:
+                for i in pending:
+                    instrumentation.emit(Event(kind="rpc", name=batch[i][0], duration=perf_counter() - started,
+                                               error=type(exc).__name__))
+            raise
+        duration = perf_counter() - started
+
+        for i, response in zip(pending, sent):
+            method, params = batch[i]
+            responses[i] = response
+            if instrumented:
+                instrumentation.record_rpc(method, params, response, duration)
+            if active_cassette is not None:
+                active_cassette.rpc_record(method, params, response)
+            if keys[i] is not None:
+                block_cache.store(keys[i], response)
+    return responses
@@ -1,32 +1,94 @@
 from os.path import join, abspath, dirname
 from os import getcwd, pardir
+from functools import lru_cache
+from threading import Lock
+from weakref import WeakKeyDictionary
 import json
 
-from alpaca_finance.automated_vault._config import DEFAULT_BSC_RPC_URL
+from alpaca_finance.automated_vault._config import DEFAULT_BSC_RPC_URL, BSC_RPC_URLS
+from alpaca_finance.registry import get_registry
+from alpaca_finance.transport import PooledHTTPProvider
+from alpaca_finance.rpc_router import RoutedHTTPProvider
+from alpaca_finance import transport, instrumentation, cassette
 
-import requests
+import aiohttp
 from web3 import Web3
+from web3.middleware import simple_cache_middleware
 
 
-checksum = Web3.toChecksumAddress
+checksum = lru_cache(maxsize=4096)(Web3.toChecksumAddress)
 
+ENTRY_PRICES_URL = "https://api.alpacafinance.org/bsc/v1/delta-neutral/avg-entry-prices"
 
+ABI_STORAGE_PATH = join(abspath(dirname(__file__)), "automated_vault/abi")
+
+# Per-provider caches, released along with the provider:
+_contract_cache = WeakKeyDictionary()  # Web3 -> {abi_filename: contract factory, (abi_filename, address): contract}
+_chain_id_cache = WeakKeyDictionary()  # Web3 -> chainId
+_cache_lock = Lock()
+
+
+@lru_cache(maxsize=None)
 def get_web3_provider(network_rpc_url: str) -> Web3:
-    """Returns a Web3 connection provider object"""
-    return Web3(Web3.HTTPProvider(network_rpc_url))
+    """
+    Returns a Web3 connection provider object (shared by all callers using the same RPC URL).
+    Requests go through the pooled keep-alive session of alpaca_finance.transport.
+    """
+    w3_provider = Web3(PooledHTTPProvider(network_rpc_url))
+    # Answer eth_chainId (requested by the validation middleware before every eth_call) from cache:
+    w3_provider.middleware_onion.add(simple_cache_middleware, "simple_cache")
+    return cassette.install_cassette_middleware(instrumentation.instrument_web3(w3_provider))
+
+
+def get_routed_web3_provider(network_rpc_urls: list[str] = None, **kwargs) -> Web3:
+    """
+    Returns a Web3 connection provider object that routes requests between several RPC endpoints
+    (See alpaca_finance.rpc_router.RoutedHTTPProvider for the keyword arguments)
+
+    :param network_rpc_urls: The RPC URLs to route between, default = BSC_RPC_URLS
+    """
+    w3_provider = Web3(RoutedHTTPProvider(BSC_RPC_URLS if network_rpc_urls is None else network_rpc_urls, **kwargs))
+    w3_provider.middleware_onion.add(simple_cache_middleware, "simple_cache")
+    return cassette.install_cassette_middleware(instrumentation.instrument_web3(w3_provider))
+
+
+@lru_cache(maxsize=None)
+def load_abi(abi_filename: str) -> list:
+    """Returns the parsed ABI stored in automated_vault/abi (read from disk once per process, do not mutate)"""
+    with open(join(ABI_STORAGE_PATH, abi_filename)) as json_file:
+        return json.load(json_file)
 
 
 def get_bsc_contract_instance(contract_address: str, abi_filename: str, w3_provider: Web3 = None):
+    """
+    Returns the contract object for the given address and ABI.
+    Contract factories and instances are memoized per provider, so repeated calls are near-free.
+    """
     if w3_provider is None:
         w3_provider = get_web3_provider(DEFAULT_BSC_RPC_URL)
 
-    abi_storage_path = join(abspath(dirname(__file__)), "automated_vault/abi")
-    with open(join(abi_storage_path, abi_filename)) as json_file:
-        contract_abi = json.load(json_file)
+    contract_address = checksum(contract_address)
+
+    with _cache_lock:
+        contracts = _contract_cache.setdefault(w3_provider, {})
+        hit = (abi_filename, contract_address) in contracts
+        if not hit:
+            if abi_filename not in contracts:
+                contracts[abi_filename] = w3_provider.eth.contract(abi=load_abi(abi_filename))
+            contracts[(abi_filename, contract_address)] = contracts[abi_filename](address=contract_address)
+
+        contract = contracts[(abi_filename, contract_address)]
 
-    contract_address = Web3.toChecksumAddress(contract_address)
+    instrumentation.record_cache("contracts", hit)
+    return contract
 
-    return w3_provider.eth.contract(address=contract_address, abi=contract_abi)
+
+def get_chain_id(w3_provider: Web3) -> int:
+    """Returns the chainId of the provider's network (requested once per provider)"""
+    if w3_provider not in _chain_id_cache:
+        _chain_id_cache[w3_provider] = w3_provider.eth.chainId
+
+    return _chain_id_cache[w3_provider]
 
 
 def get_entry_prices(wallet_address: str) -> list[dict]:
@@ -39,10 +101,25 @@ def get_entry_prices(wallet_address: str) -> list[dict]:
                 * strategyPoolAddress: str
                 * avgEntryPrice: str (in integer format)
     """
-    r = requests.get(f"https://api.alpacafinance.org/bsc/v1/delta-neutral/avg-entry-prices?userAddress={wallet_address}")
+    r = transport.get(ENTRY_PRICES_URL, params={"userAddress": wallet_address})
     return r.json()["data"]["avgEntryPrices"]
 
 
+async def get_entry_prices_async(wallet_address: str, session: aiohttp.ClientSession) -> list[dict]:
+    """Async counterpart of get_entry_prices() using the given aiohttp session"""
+    async with session.get(ENTRY_PRICES_URL, params={"userAddress": wallet_address}) as r:
+        return (await r.json(content_type=None))["data"]["avgEntryPrices"]
+
+
+def get_strategy_pools() -> list[dict]:
+    """
+    Fetch the data for all Automated Vaults listed on the Alpaca Finance landing page
+
+    :return: List of dicts under the "strategyPools" key of summary.json (See AutomatedVaultPosition.get_vault_summary())
+    """
+    return get_registry().strategy_pools()
+
+
 def format_json_file(filepath: str) -> None:
     with open(filepath, 'r') as infile:
         data = json.load(infile)
@@ -58,7 +135,7 @@ def store_abi(abi_url: str, abi_filename: str, abi_path: str = None) -> None:
     :param abi_filename: The desired filename for local storage
     :param abi_path: The local path for the abi if one already exists and is being refactored
     """
-    contract_abi = requests.get(abi_url).json()
+    contract_abi = transport.get_json(abi_url)
 
     path = join(join(dirname(__file__)), "automated_vault/abi", abi_filename) if abi_path is None else abi_path
     with open(path, "w") as json_file:
@@ -66,6 +143,8 @@ def store_abi(abi_url: str, abi_filename: str, abi_path: str = None) -> None:
 
 
 def get_vault_addresses(vault_address: str) -> dict:
-    for r in requests.get("https://raw.githubusercontent.com/alpaca-finance/bsc-alpaca-contract/main/.mainnet.json").json()['DeltaNeutralVaults']:
-        if r['address'].lower() == vault_address.lower():
-            return r
+    """Return the .mainnet.json contract addresses for the given Delta Neutral Vault (None if not found)"""
+    try:
+        return get_registry().delta_neutral_vault(vault_address)
+    except KeyError:
+        return None
@@ -0,0 +1,152 @@
+"""
+Offline benchmarks of the informational API against the local stub server (benchmarks/stub_server.py).
+
+Measures wall time, JSON-RPC round-trips, REST requests and bytes transferred per operation, and scaling runs from
+1 to 1,000 positions. With --check, exits with status 1 if an operation needs more round-trips than its budget,
+so round-trip regressions are caught before they reach production.
+
+Usage:
+    python benchmarks/bench.py                         # no injected latency
+    python benchmarks/bench.py --latency 0.05 --sizes 1 10 100
+    python benchmarks/bench.py --check --json bench.json
+"""
+from math import ceil
+from os.path import abspath, dirname
+from statistics import median
+from time import perf_counter
+import argparse
+import json
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from alpaca_finance.automated_vault import AutomatedVaultPosition, PositionScanner  # noqa: E402
+from alpaca_finance.registry import configure_registry  # noqa: E402
+from alpaca_finance.util import get_web3_provider  # noqa: E402
+from alpaca_finance import util  # noqa: E402
+
+from stub_server import StubServer  # noqa: E402
+
+from eth_utils import keccak, to_checksum_address  # noqa: E402
+
+
+def wallet(i: int) -> str:
+    return to_checksum_address(keccak(text=f"wallet-{i}")[:20])
+
+
+class Bench:
+    def __init__(self, latency: float = 0.0, repeat: int = 20):
+        self.stub = StubServer(latency=latency).start()
+        self.repeat = repeat
+        self.results = []
+
+        # Point every endpoint of the package at the stub
+        configure_registry(summary_url=f"{self.stub.url}/summary.json", mainnet_url=f"{self.stub.url}/mainnet.json")
+        util.ENTRY_PRICES_URL = f"{self.stub.url}/avg-entry-prices"
+        self.w3_provider = get_web3_provider(self.stub.rpc_url)
+        self.keys = [pool["key"] for pool in json.loads(self.stub.documents["/summary.json"][0])["data"]["strategyPools"]]
+
+    def measure(self, name: str, operation, repeat: int = None, budget: dict = None, warmup: bool = False) -> dict:
+        """
+        Run the operation `repeat` times and record its timings and average network usage per run
+
+        :param budget: (Optional) Maximum rpc_requests / rest_requests per run, checked by --check
+        :param warmup: If True, run the operation once before measuring (e.g. to cache the chain id)
+        """
+        repeat = self.repeat if repeat is None else repeat
+        if warmup:
+            operation()
+
+        timings = []
+        self.stub.reset_stats()
+        for _ in range(repeat):
+            started = perf_counter()
+            operation()
+            timings.append(perf_counter() - started)
+        stats = self.stub.reset_stats()
+
+        timings.sort()
+        result = {"name": name,
+                  "runs": repeat,
+                  "median_ms": median(timings) * 1000,
+                  "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+                  "rpc_requests": stats["rpc_requests"] / repeat,
+                  "rpc_calls": stats["rpc_calls"] / repeat,
+                  "rest_requests": stats["rest_requests"] / repeat,
+                  "bytes": (stats["bytes_in"] + stats["bytes_out"]) / repeat,
+                  "budget": budget or {}}
+        result["over_budget"] = [key for key, limit in result["budget"].items() if result[key] > limit]
+        self.results.append(result)
+        return result
+
+    def run(self, sizes: list[int]) -> list[dict]:
+        key = self.keys[0]
+
+        # Warm the registry (summary.json + .mainnet.json), then construction must be network-free
+        self.measure("registry (cold)", lambda: AutomatedVaultPosition(key, wallet(0), w3_provider=self.w3_provider),
+                     repeat=1)
+        self.measure("construct position", lambda: AutomatedVaultPosition(key, wallet(0), w3_provider=self.w3_provider),
+                     budget={"rpc_requests": 0, "rest_requests": 0})
+
+        position = AutomatedVaultPosition(key, wallet(0), w3_provider=self.w3_provider)
+        self.measure("shares()", position.shares, budget={"rpc_requests": 1, "rest_requests": 0}, warmup=True)
+        self.measure("current_value()", position.current_value, budget={"rpc_requests": 1, "rest_requests": 0})
+        self.measure("pnl()", position.pnl, budget={"rpc_requests": 1, "rest_requests": 1})
+        self.measure("snapshot()", position.snapshot, budget={"rpc_requests": 1, "rest_requests": 1})
+
+        for size in sizes:
+            wallets = [wallet(i) for i in range(ceil(size / len(self.keys)))]
+            pairs = [(w, k) for w in wallets for k in self.keys][:size]
+
+            self.measure(f"construct x{size}", lambda: [AutomatedVaultPosition(k, w, w3_provider=self.w3_provider)
+                                                        for w, k in pairs],
+                         repeat=1, budget={"rpc_requests": 0, "rest_requests": 0})
+
+            positions = [AutomatedVaultPosition(k, w, w3_provider=self.w3_provider) for w, k in pairs]
+            self.measure(f"shares() x{size}", lambda: [p.shares() for p in positions],
+                         repeat=1, budget={"rpc_requests": size, "rest_requests": 0})
+
+            keys = sorted({k for _, k in pairs})
+            scanner = PositionScanner(wallets, keys, w3_provider=self.w3_provider)
+            batches = ceil(len(wallets) * len(keys) / scanner.batch_size)
+            self.measure(f"PositionScanner.scan() x{len(wallets) * len(keys)}", scanner.scan, repeat=1,
+                         budget={"rpc_requests": 2 + batches, "rest_requests": len(wallets)})
+
+        return self.results
+
+    def close(self) -> None:
+        self.stub.stop()
+
+
+def print_table(results: list[dict]) -> None:
+    columns = ["name", "runs", "median_ms", "p95_ms", "rpc_requests", "rpc_calls", "rest_requests", "bytes"]
+    rows = [[f"{r[c]:.2f}" if isinstance(r[c], float) else str(r[c]) for c in columns]
+            + ["OVER BUDGET: " + ", ".join(r["over_budget"]) if r["over_budget"] else ""] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)) + "  " + row[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds injected into every stub request")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per single-position operation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000], help="Position counts to scale to")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if any round-trip budget is exceeded")
+    args = parser.parse_args()
+
+    bench = Bench(latency=args.latency, repeat=args.repeat)
+    try:
+        results = bench.run(args.sizes)
+    finally:
+        bench.close()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+
+    if args.check and any(r["over_budget"] for r in results):
+        sys.exit(1)
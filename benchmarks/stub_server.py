@@ -0,0 +1,409 @@
+"""
+Local stand-in for the BSC JSON-RPC node and the Alpaca Finance REST endpoints, used by the benchmarks.
+
+JSON-RPC (POST /rpc, single and batch requests):
+    eth_call answers every function of the bundled ABIs (+ BEP20 and Multicall3.aggregate3) with deterministic values,
+    transactions are "mined" as soon as they are sent, add_transaction() fills the blocks of eth_getBlockByNumber.
+REST (GET):
+    /summary.json           dev_resources/summary.json
+    /mainnet.json           .mainnet.json DeltaNeutralVaults synthesized from the summary.json strategyPools
+    /avg-entry-prices       dev_resources/avg-entry-prices.json
+POST /subgraph:
+    rebalanceLogs queries of the automated-vault subgraph, answered from StubServer.rebalance_logs
+Every request waits `latency` seconds first, and is counted in StubServer.stats (requests, RPC calls, bytes).
+
+Run standalone with: python benchmarks/stub_server.py --port 8545 --latency 0.05
+"""
+from collections import Counter, defaultdict
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import abspath, dirname, join
+from threading import Lock, Thread
+from time import sleep, time
+from urllib.parse import urlparse
+import argparse
+import json
+
+from alpaca_finance.util import load_abi
+
+import bep20
+from eth_account import Account
+from eth_abi import decode_abi, encode_abi
+from eth_abi.grammar import TupleType, parse
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+from web3._utils.abi import collapse_if_tuple
+
+
+DEV_RESOURCES = join(dirname(dirname(abspath(__file__))), "dev_resources")
+ABI_FILENAMES = ["DeltaNeutralVault.json", "DeltaNeutralVaultGateway.json", "DeltaNeutralOracle.json",
+                 "AutomatedVaultController.json", "Multicall3.json"]
+
+CHAIN_ID = 56
+BLOCK_NUMBER = 20000000
+SHARES = 5 * 10 ** 18  # balanceOf() of every wallet
+SHARE_PRICE = 1.05  # shareToValue() per share
+
+
+def _selectors() -> dict:
+    """selector -> (function name, input types, output types) for every function the package can call"""
+    abis = [load_abi(filename) for filename in ABI_FILENAMES]
+    with open(join(dirname(bep20.__file__), "abi", "BEP20.json")) as infile:
+        abis.append(json.load(infile))
+
+    selectors = {}
+    for abi in abis:
+        for item in abi:
+            if item.get("type") == "function":
+                inputs = [collapse_if_tuple(i) for i in item["inputs"]]
+                outputs = [collapse_if_tuple(o) for o in item.get("outputs", [])]
+                selector = bytes(function_signature_to_4byte_selector(f"{item['name']}({','.join(inputs)})"))
+                selectors.setdefault(selector, (item["name"], inputs, outputs))
+    return selectors
+
+
+def _default(abi_type: str):
+    """A plausible value of the given ABI type"""
+    parsed = parse(abi_type)
+    if parsed.is_array:
+        return []
+    if isinstance(parsed, TupleType):
+        return tuple(_default(component.to_type_str()) for component in parsed.components)
+    base = parsed.base
+    if base == "uint":
+        return 10 ** 18
+    if base == "int":
+        return 0
+    if base == "address":
+        return "0x" + "00" * 20
+    if base == "bool":
+        return True
+    if base == "string":
+        return "STUB"
+    return b""
+
+
+class Revert(Exception):
+    """Raised by StubServer.call() for the addresses in StubServer.reverting"""
+
+
+class StubServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        :param host: Interface to listen on
+        :param port: Port to listen on (0 = any free port)
+        :param latency: Seconds every request waits before being answered
+        """
+        self.latency = latency
+        self.selectors = _selectors()
+        self.stats = Counter()
+        self._lock = Lock()
+        self.documents = self._load_documents()
+        self.transactions = {}  # hash -> transaction (See add_transaction())
+        self.reverting = set()  # Lowercase contract addresses every call to which reverts
+        self.failures = []  # HTTP status codes answered to the next JSON-RPC requests (See fail_requests())
+        self.rpc_errors = []  # JSON-RPC errors answered to the next JSON-RPC calls (See fail_calls())
+        self.nonces = Counter()  # Lowercase address -> transaction count (incremented by eth_sendRawTransaction)
+        self.auto_mine = True  # If False, sent transactions have no receipt until mine() is called
+        self.unmined = set()  # Hashes of the sent transactions without a receipt yet
+        self.blocks = defaultdict(list)  # block number -> [transaction hash]
+        self.rebalance_logs = []  # Subgraph rebalance logs ({"id", "vaultAddress", "blockTime"}), in insertion order
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def rpc_url(self) -> str:
+        return f"{self.url}/rpc"
+
+    @property
+    def subgraph_url(self) -> str:
+        return f"{self.url}/subgraph"
+
+    def start(self) -> "StubServer":
+        self._thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self) -> Counter:
+        """Reset the counters and return their previous values"""
+        with self._lock:
+            stats, self.stats = self.stats, Counter()
+        return stats
+
+    def add_transaction(self, block_number: int, to: str, data: bytes, sender: str = "0x" + "00" * 20,
+                        value: int = 0) -> str:
+        """Add a mined transaction, served by eth_getTransactionByHash and eth_getBlockByNumber - returns its hash"""
+        with self._lock:
+            index = len(self.blocks[block_number])
+            transaction_hash = "0x" + keccak(text=f"{block_number}:{index}").hex()
+            self.transactions[transaction_hash] = {
+                "hash": transaction_hash, "blockHash": "0x" + "11" * 32, "blockNumber": hex(block_number),
+                "transactionIndex": hex(index), "from": sender, "to": to, "value": hex(value), "gas": hex(300000),
+                "gasPrice": hex(5 * 10 ** 9), "nonce": hex(index), "input": "0x" + data.hex(), "type": "0x0",
+                "v": "0x94", "r": "0x" + "01" * 32, "s": "0x" + "02" * 32}
+            self.blocks[block_number].append(transaction_hash)
+        return transaction_hash
+
+    def mine(self, *transaction_hashes: str) -> None:
+        """Mine the given sent transactions (all of them if none is given)"""
+        with self._lock:
+            self.unmined.difference_update(transaction_hashes or set(self.unmined))
+
+    def fail_requests(self, count: int, status: int = 503) -> None:
+        """Answer the next `count` JSON-RPC requests with the given HTTP status code (and an empty body)"""
+        with self._lock:
+            self.failures.extend([status] * count)
+
+    def fail_calls(self, count: int, code: int = -32005, message: str = "limit exceeded") -> None:
+        """Answer the next `count` JSON-RPC calls with the given error (HTTP 200)"""
+        with self._lock:
+            self.rpc_errors.extend([{"code": code, "message": message}] * count)
+
+    def _count(self, **counts) -> None:
+        with self._lock:
+            self.stats.update(counts)
+
+    """ -------------------------------- REST -------------------------------- """
+
+    @staticmethod
+    def _load_documents() -> dict:
+        with open(join(DEV_RESOURCES, "summary.json")) as infile:
+            summary = json.load(infile)
+        with open(join(DEV_RESOURCES, "avg-entry-prices.json")) as infile:
+            entry_prices = json.load(infile)
+
+        def address(seed: str) -> str:
+            return to_checksum_address(keccak(text=seed)[:20])
+
+        vaults = [{"name": pool["name"],
+                   "symbol": pool["iuToken"]["symbol"],
+                   "address": pool["address"],
+                   "deployedBlock": BLOCK_NUMBER - 1000000,
+                   "config": address(pool["key"] + "config"),
+                   "stableToken": pool["workingToken"]["tokenA"]["address"],
+                   "assetToken": pool["workingToken"]["tokenB"]["address"],
+                   "gateway": address(pool["key"] + "gateway"),
+                   "oracle": address(pool["key"] + "oracle")}
+                  for pool in summary["data"]["strategyPools"]]
+        mainnet = {"DeltaNeutralVaults": vaults,
+                   "SharedStrategies": {exchange: {"StrategyPartialCloseMinimizeTrading": address(exchange)}
+                                        for exchange in ("Pancakeswap", "Biswap")}}
+
+        documents = {}
+        for path, document in (("/summary.json", summary), ("/mainnet.json", mainnet),
+                               ("/avg-entry-prices", entry_prices)):
+            body = json.dumps(document).encode()
+            documents[path] = (body, f'"{sha1(body).hexdigest()}"')
+        return documents
+
+    def subgraph(self, request: dict) -> dict:
+        """Answer a rebalanceLogs query (the filters and orderings used by alpaca_finance.automated_vault.rebalance)"""
+        variables = request["variables"]
+        logs = [log for log in self.rebalance_logs if log["vaultAddress"] == variables["vaultAddress"]]
+        if request["operationName"] == "rebalanceLogsAt":
+            logs = sorted((log for log in logs if log["blockTime"] == variables["blockTime"]
+                           and log["id"] > variables["id"]), key=lambda log: log["id"])
+        else:
+            logs = sorted((log for log in logs if int(log["blockTime"]) > int(variables["blockTime"])),
+                          key=lambda log: int(log["blockTime"]))
+        return {"data": {"rebalanceLogs": logs[:variables["first"]]}}
+
+    """ ------------------------------ JSON-RPC ------------------------------ """
+
+    def rpc(self, request: dict) -> dict:
+        """Answer a single JSON-RPC request"""
+        method, params = request.get("method"), request.get("params", [])
+        self._count(**{"rpc_calls": 1, f"rpc:{method}": 1})
+        with self._lock:
+            error = self.rpc_errors.pop(0) if self.rpc_errors else None
+        if error is not None:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": error}
+        handler = getattr(self, f"_{method}", None)
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32601, "message": f"the method {method} does not exist/is not available"}}
+        try:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": handler(*params)}
+        except Revert:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": 3, "message": "execution reverted"}}
+
+    def call(self, data: bytes, to: str = None) -> bytes:
+        """Return data of an eth_call with the given calldata (raises Revert if `to` is in self.reverting)"""
+        if to is not None and to.lower() in self.reverting:
+            raise Revert(to)
+        selector, args = data[:4], data[4:]
+        if selector not in self.selectors:
+            return b""
+        name, inputs, outputs = self.selectors[selector]
+        values = decode_abi(inputs, args)
+
+        if name == "aggregate3":
+            results = []
+            for target, allow_failure, calldata in values[0]:
+                try:
+                    results.append((True, self.call(bytes(calldata), target)))
+                except Revert:
+                    if not allow_failure:
+                        raise
+                    results.append((False, b""))
+            return encode_abi(outputs, [results])
+
+        named = {"decimals": [18],
+                 "balanceOf": [SHARES],
+                 "allowance": [2 ** 256 - 1],
+                 "stableTo18ConversionFactor": [1],
+                 "assetTo18ConversionFactor": [1],
+                 "getBlockNumber": [BLOCK_NUMBER],
+                 "getCurrentBlockTimestamp": [int(time())],
+                 "getTokenPrice": [10 ** 18, int(time())],
+                 "stableToken": ["0xe9e7cea3dedca5984780bafc599bd69add087d56"],
+                 "assetToken": ["0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"]}
+        if name == "shareToValue":
+            result = [int(values[0] * SHARE_PRICE)]
+        elif name in ("lpToDollar", "dollarToLp"):
+            result = [values[0], int(time())]
+        elif name in named:
+            result = named[name]
+        else:
+            result = [_default(o) for o in outputs]
+        return encode_abi(outputs, result)
+
+    def _eth_chainId(self) -> str:
+        return hex(CHAIN_ID)
+
+    def _net_version(self) -> str:
+        return str(CHAIN_ID)
+
+    def _web3_clientVersion(self) -> str:
+        return "alpaca-finance-stub/1.0"
+
+    def _eth_blockNumber(self) -> str:
+        return hex(BLOCK_NUMBER)
+
+    def _eth_gasPrice(self) -> str:
+        return hex(5 * 10 ** 9)
+
+    def _eth_call(self, transaction: dict, block_identifier: str = "latest", *_) -> str:
+        return "0x" + self.call(bytes.fromhex(transaction.get("data", transaction.get("input", "0x"))[2:]),
+                                transaction.get("to")).hex()
+
+    def _eth_estimateGas(self, transaction: dict, *_) -> str:
+        if (transaction.get("to") or "").lower() in self.reverting:
+            raise Revert(transaction["to"])
+        return hex(300000)
+
+    def _eth_getTransactionCount(self, address: str, block_identifier: str = "latest") -> str:
+        return hex(self.nonces[address.lower()])
+
+    def _eth_getLogs(self, log_filter: dict) -> list:
+        return []
+
+    def _eth_sendRawTransaction(self, raw_transaction: str) -> str:
+        transaction_hash = "0x" + keccak(hexstr=raw_transaction).hex()
+        try:
+            sender = Account.recover_transaction(raw_transaction)
+        except Exception:  # Not a signed transaction
+            sender = None
+        with self._lock:
+            if sender is not None:
+                self.nonces[sender.lower()] += 1
+            if not self.auto_mine:
+                self.unmined.add(transaction_hash)
+        return transaction_hash
+
+    def _eth_getTransactionReceipt(self, transaction_hash: str) -> dict:
+        if transaction_hash in self.unmined:
+            return None
+        return {"transactionHash": transaction_hash, "blockHash": "0x" + "11" * 32, "blockNumber": hex(BLOCK_NUMBER),
+                "contractAddress": None, "cumulativeGasUsed": hex(300000), "gasUsed": hex(300000),
+                "effectiveGasPrice": hex(5 * 10 ** 9), "from": "0x" + "00" * 20, "to": "0x" + "00" * 20,
+                "status": "0x1", "transactionIndex": "0x0", "type": "0x0", "logs": [], "logsBloom": "0x" + "00" * 256}
+
+    def _eth_getTransactionByHash(self, transaction_hash: str) -> dict:
+        return self.transactions.get(transaction_hash)
+
+    def _eth_getBlockByNumber(self, block_identifier: str, full_transactions: bool = False) -> dict:
+        number = BLOCK_NUMBER if block_identifier in ("latest", "pending") else int(block_identifier, 16)
+        if number > BLOCK_NUMBER:
+            return None
+        hashes = self.blocks.get(number, [])
+        return {"number": hex(number), "hash": "0x" + "11" * 32, "parentHash": "0x" + "22" * 32,
+                "timestamp": hex(int(time())), "baseFeePerGas": "0x0", "gasLimit": hex(140000000),
+                "gasUsed": "0x0", "miner": "0x" + "00" * 20, "extraData": "0x",
+                "difficulty": "0x2", "nonce": "0x" + "00" * 8, "logsBloom": "0x" + "00" * 256,
+                "transactions": [self.transactions[h] for h in hashes] if full_transactions else hashes}
+
+    """ -------------------------------- HTTP -------------------------------- """
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoints
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def do_GET(self):
+                sleep(server.latency)
+                path = urlparse(self.path).path
+                server._count(requests=1, rest_requests=1, **{f"rest:{path}": 1})
+                if path not in server.documents:
+                    return self._send(404, b"{}")
+                body, etag = server.documents[path]
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", {"ETag": etag})
+                self._send(200, body, {"ETag": etag})
+
+            def do_POST(self):
+                sleep(server.latency)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlparse(self.path).path == "/subgraph":
+                    server._count(requests=1, subgraph_requests=1, bytes_in=len(body))
+                    return self._send(200, json.dumps(server.subgraph(json.loads(body))).encode())
+                server._count(requests=1, rpc_requests=1, bytes_in=len(body))
+                with server._lock:
+                    status = server.failures.pop(0) if server.failures else None
+                if status is not None:
+                    return self._send(status, b"")
+                request = json.loads(body)
+                if isinstance(request, list):
+                    response = [server.rpc(r) for r in request]
+                else:
+                    response = server.rpc(request)
+                self._send(200, json.dumps(response).encode())
+
+            def _send(self, status: int, body: bytes, headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count(bytes_out=len(body))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    args = parser.parse_args()
+
+    stub = StubServer(args.host, args.port, args.latency)
+    print(f"Serving JSON-RPC on {stub.rpc_url} and REST on {stub.url} (latency {args.latency}s)")
+    stub.httpd.serve_forever()
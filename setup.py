@@ -25,4 +25,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[line.strip() for line in open('requirements.txt').readlines()],
+    entry_points={
+        "console_scripts": ["alpaca-collector=alpaca_finance.automated_vault.collector:main"],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+Shared fixtures: every test runs against the local JSON-RPC/REST stub of benchmarks/stub_server.py
+"""
+from os.path import abspath, dirname, join
+import sys
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "benchmarks"))
+
+import alpaca_finance.automated_vault  # Imported first: alpaca_finance.util imports automated_vault._config
+from alpaca_finance import transport, util
+from alpaca_finance.registry import configure_registry
+
+import pytest
+import stub_server
+from stub_server import StubServer
+
+
+@pytest.fixture
+def stub(monkeypatch) -> StubServer:
+    """A started StubServer, with the registry and the entry prices pointed at it and near-instant retry backoffs"""
+    server = StubServer().start()
+    configure_registry(summary_url=f"{server.url}/summary.json", mainnet_url=f"{server.url}/mainnet.json")
+    monkeypatch.setattr(util, "ENTRY_PRICES_URL", f"{server.url}/avg-entry-prices")
+    monkeypatch.setattr(stub_server, "BLOCK_NUMBER", stub_server.BLOCK_NUMBER)
+    config = transport.get_config()
+    transport.configure(backoff_factor=0.001)
+
+    yield server
+
+    transport.configure(**config.__dict__)
+    server.stop()
@@ -0,0 +1,111 @@
+import asyncio
+
+from alpaca_finance.cassette import use_cassette
+from alpaca_finance.registry import get_registry
+from alpaca_finance.automated_vault.aio import AsyncRPC, AsyncAutomatedVaultPosition, close_default_rpc
+
+import aiohttp
+import pytest
+import stub_server
+
+
+WALLET = "0x" + "12" * 20
+KEY = "n3x-BNBBUSD-PCS1"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_position_reads(stub):
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            position = await AsyncAutomatedVaultPosition.create(KEY, WALLET, rpc)
+            return position, await asyncio.gather(position.shares(), position.current_value(), position.yields())
+
+    position, (shares, value, yields) = run(main())
+    assert shares == (stub_server.SHARES, 5.0, pytest.approx(5 * stub_server.SHARE_PRICE))
+    assert value == pytest.approx(5 * stub_server.SHARE_PRICE)
+    assert len(yields) == 4
+    assert position.addresses == get_registry().delta_neutral_vault(position.address)
+
+
+def test_create_resolves_addresses_without_blocking(stub, monkeypatch):
+    def blocking_get():
+        raise AssertionError("blocking registry request inside the event loop")
+
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            return await AsyncAutomatedVaultPosition.create(KEY, WALLET, rpc)
+
+    registry = get_registry()
+    monkeypatch.setattr(registry.summary, "get", blocking_get)
+    monkeypatch.setattr(registry.mainnet, "get", blocking_get)
+    position = run(main())
+    assert position.addresses['address'].lower() == position.address
+
+
+def test_concurrent_requests_are_retried(stub):
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            return await asyncio.gather(*(rpc.request("eth_blockNumber", []) for _ in range(8)))
+
+    stub.fail_requests(3, status=503)
+    assert run(main()) == [hex(stub_server.BLOCK_NUMBER)] * 8
+    assert stub.reset_stats()["rpc_requests"] == 8 + 3
+
+
+def test_retries_run_out(stub):
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            return await rpc.request("eth_blockNumber", [])
+
+    stub.fail_requests(100, status=502)
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(main())
+
+
+def test_send_raw_transaction_is_not_retried(stub):
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            return await rpc.request("eth_sendRawTransaction", ["0x00"])
+
+    stub.fail_requests(1, status=503)
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(main())
+    assert stub.reset_stats()["rpc_requests"] == 1
+
+
+def test_cassette_record_and_replay(stub, tmp_path):
+    path = str(tmp_path / "aio.json.gz")
+
+    async def main():
+        async with AsyncRPC(stub.rpc_url) as rpc:
+            return await asyncio.gather(rpc.chain_id(),
+                                        *(rpc.request("eth_getBlockByNumber", [hex(n), False])
+                                          for n in range(stub_server.BLOCK_NUMBER - 5, stub_server.BLOCK_NUMBER)))
+
+    with use_cassette(path, mode="record"):
+        recorded = run(main())
+    stub.reset_stats()
+
+    with use_cassette(path, mode="replay") as cassette:
+        replayed = run(main())
+    assert [block["number"] for block in replayed[1:]] == [block["number"] for block in recorded[1:]]
+    assert replayed[0] == recorded[0] == stub_server.CHAIN_ID
+    assert cassette.hits == 6
+    assert stub.reset_stats()["rpc_requests"] == 0
+
+
+def test_positions_share_the_default_rpc(stub):
+    async def main():
+        try:
+            return await asyncio.gather(*(AsyncAutomatedVaultPosition.create(KEY, wallet, None)
+                                          for wallet in (WALLET, "0x" + "34" * 20)))
+        finally:
+            await close_default_rpc()
+
+    first, second = run(main())
+    assert first.rpc is second.rpc
+    assert first.rpc._session is None  # Closed with the default client
+    assert run(main())[0].rpc is not first.rpc  # One default client per event loop
@@ -0,0 +1,55 @@
+from alpaca_finance.automated_vault.alerts import AlertEngine, PnLDrawdown, RebalanceOccurred, rebalance_values
+
+
+WALLET = "0x" + "12" * 20
+KEY = "n3x-bnbbusd-pcs1"
+SUBJECT = f"{WALLET}/{KEY}"
+
+
+def position(shares: float, share_value: float) -> dict:
+    return {(SUBJECT, "shares"): shares, (SUBJECT, "value"): shares * share_value,
+            (SUBJECT, "share_value"): share_value}
+
+
+def test_drawdown_ignores_withdrawals():
+    engine = AlertEngine()
+    engine.add_rule(PnLDrawdown(WALLET, KEY, pct=0.05))
+
+    assert engine.observe(1, position(10, 1.00)) == []
+    assert engine.observe(2, position(10, 1.02)) == []
+    assert engine.observe(3, position(2, 1.02)) == []  # Withdrew 80% of the position
+    alerts = engine.observe(4, position(2, 0.95))
+    assert [alert.rule for alert in alerts] == ["PnLDrawdown"]
+    assert alerts[0].metric == "share_value"
+
+
+def test_drawdown_peak_is_reset_when_shares_change():
+    engine = AlertEngine()
+    engine.add_rule(PnLDrawdown(WALLET, KEY, pct=0.05))
+
+    engine.observe(1, position(10, 1.00))
+    assert engine.observe(2, position(20, 0.96)) == []  # Deposit: 0.96 is the new baseline
+    assert engine.observe(3, position(20, 0.92)) == []
+    assert len(engine.observe(4, position(20, 0.90))) == 1
+
+
+class StubIndexer:
+    def __init__(self):
+        self.rebalances = {}
+
+    def sync(self, vault_address: str) -> int:
+        return 0
+
+    def latest_block(self, vault_address: str, event: str):
+        return self.rebalances.get(vault_address)
+
+
+def test_first_rebalance_fires():
+    indexer, vaults = StubIndexer(), {KEY: "0x" + "ab" * 20}
+    engine = AlertEngine()
+    engine.add_rule(RebalanceOccurred(KEY))
+
+    assert engine.observe(1, rebalance_values(indexer, vaults)) == []
+    indexer.rebalances[vaults[KEY]] = 2
+    alerts = engine.observe(3, rebalance_values(indexer, vaults))
+    assert [alert.message for alert in alerts] == [f"{KEY} rebalanced at block 2"]
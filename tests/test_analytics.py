@@ -0,0 +1,25 @@
+from alpaca_finance.automated_vault.analytics import max_drawdown, position_metrics
+from alpaca_finance.automated_vault.snapshot import SHARE_VALUE_UNIT
+
+import numpy as np
+import pytest
+
+
+def test_pnl_and_roi_are_measured_against_the_cost_basis():
+    metrics = position_metrics({"shares_int": [2 * 10 ** 18, 10 ** 18], "vault_token_decimals": [18, 18],
+                                "unit_share_value": [SHARE_VALUE_UNIT * 3 // 2, SHARE_VALUE_UNIT],
+                                "stable_token_decimals": [18, 18], "stable_token_price": [10 ** 18, 10 ** 18],
+                                "avgEntryPrice": [10 ** 18, None]})
+
+    # 2 shares bought at $1, now worth $1.5 each
+    assert metrics["value"][0] == pytest.approx(3.0) and metrics["cost_basis"][0] == pytest.approx(2.0)
+    assert metrics["pnl"][0] == pytest.approx(1.0)
+    assert metrics["roi"][0] == pytest.approx(0.5)
+    assert np.isnan(metrics["pnl"][1]) and np.isnan(metrics["roi"][1]) and "invested" not in metrics
+
+
+def test_max_drawdown_of_unknown_series_is_nan():
+    result = max_drawdown([[4.0, 2.0, np.nan, 3.0], [np.nan] * 4])
+    assert result[0] == pytest.approx(0.5)
+    assert np.isnan(result[1])
+    assert np.isnan(max_drawdown([np.nan, np.nan]))
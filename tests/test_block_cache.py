@@ -0,0 +1,43 @@
+from alpaca_finance.block_cache import enable_block_cache
+from alpaca_finance.util import get_bsc_contract_instance, get_web3_provider
+
+import pytest
+
+
+@pytest.fixture
+def w3(stub):
+    return get_web3_provider(stub.rpc_url)
+
+
+def vault(w3, i: int):
+    return get_bsc_contract_instance(contract_address="0x" + f"{i:02x}" * 20, abi_filename="DeltaNeutralVault.json",
+                                     w3_provider=w3)
+
+
+def test_block_tags_are_not_cached(stub, w3):
+    enable_block_cache(w3)
+    balance_of = vault(w3, 1).functions.balanceOf("0x" + "12" * 20)
+    for block in ("latest", "latest", "finalized", "finalized", "earliest"):
+        balance_of.call(block_identifier=block)
+
+    assert stub.reset_stats()["rpc:eth_call"] == 4  # Only the second "latest" read is cached
+
+
+def test_config_is_not_immutable(stub, w3):
+    enable_block_cache(w3)
+    contract = vault(w3, 1)
+    contract.functions.config().call(block_identifier=1)
+    contract.functions.config().call(block_identifier=2)
+
+    assert stub.reset_stats()["rpc:eth_call"] == 2
+
+
+def test_immutable_entries_are_bounded(stub, w3):
+    cache = enable_block_cache(w3, max_immutable_entries=2)
+    for i in range(1, 4):
+        vault(w3, i).functions.decimals().call()
+    vault(w3, 3).functions.decimals().call()
+    vault(w3, 1).functions.decimals().call()
+
+    assert len(cache._immutable) == 2
+    assert stub.reset_stats()["rpc:eth_call"] == 4  # The first vault was evicted
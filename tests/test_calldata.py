@@ -0,0 +1,52 @@
+from alpaca_finance.automated_vault.calldata import CalldataDecoder, TransactionDecoder
+from alpaca_finance.util import get_bsc_contract_instance, get_web3_provider
+
+from eth_abi import encode_abi
+import pytest
+import stub_server
+
+
+VAULT = "0x" + "ab" * 20
+OTHER = "0x" + "cd" * 20
+
+
+@pytest.fixture
+def w3(stub):
+    return get_web3_provider(stub.rpc_url)
+
+
+def withdraw_data(w3, data: bytes) -> bytes:
+    vault = get_bsc_contract_instance(contract_address=VAULT, abi_filename="DeltaNeutralVault.json", w3_provider=w3)
+    return bytes.fromhex(vault.functions.withdraw(10 ** 18, 0, 0, data)._encode_transaction_data()[2:])
+
+
+def transaction(data: str) -> dict:
+    return {"hash": "0x" + "00" * 32, "blockNumber": "0x1", "transactionIndex": "0x0", "from": OTHER, "to": VAULT,
+            "value": "0x0", "input": data}
+
+
+def test_decode_blocks_keeps_the_vault_transactions(stub, w3):
+    first = stub_server.BLOCK_NUMBER - 3
+    stub.add_transaction(first, VAULT, withdraw_data(w3, encode_abi(["uint256", "uint256"], [1, 2])))
+    stub.add_transaction(first + 1, OTHER, b"\x12\x34\x56\x78")
+    stub.reset_stats()
+
+    decoder = TransactionDecoder(w3, contracts={VAULT: "DeltaNeutralVault"}, processes=0)
+    calls = list(decoder.decode_blocks(first, first + 2))
+    assert [(call.blockNumber, call.contract, call.function) for call in calls] == \
+           [(first, "DeltaNeutralVault", "withdraw")]
+    assert calls[0].args["_shareAmount"] == 10 ** 18 and calls[0].payload == (1, 2)
+    assert stub.reset_stats()["rpc_requests"] == 1  # The 3 blocks are fetched in one batch
+
+
+def test_invalid_calldata_is_recorded_per_transaction(w3):
+    decoder = CalldataDecoder(contracts={VAULT: "DeltaNeutralVault"})
+    valid = withdraw_data(w3, encode_abi(["uint256", "uint256"], [1, 2]))
+
+    for data in ("0x" + valid[:40].hex(),  # Truncated arguments
+                 "0x" + withdraw_data(w3, b"\x01").hex(),  # _data does not match its payload layout
+                 "0x" + valid.hex()[:-1]):  # Odd length
+        call = decoder.decode(transaction(data))
+        assert call.error is not None and call.payload is None
+
+    assert decoder.decode(transaction("0x" + valid.hex())).payload == (1, 2)
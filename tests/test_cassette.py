@@ -0,0 +1,54 @@
+from alpaca_finance.cassette import Cassette, is_block_pinned, use_cassette
+from alpaca_finance.util import get_web3_provider
+
+import pytest
+import stub_server
+
+
+VAULT = "0x" + "ab" * 20
+
+
+@pytest.fixture
+def w3(stub):
+    return get_web3_provider(stub.rpc_url)
+
+
+@pytest.mark.parametrize("method, params, pinned", [
+    ("eth_chainId", [], True),
+    ("eth_call", [{"to": VAULT}, "0x10"], True),
+    ("eth_call", [{"to": VAULT}, "latest"], False),
+    ("eth_call", [{"to": VAULT}, "pending"], False),
+    ("eth_call", [{"to": VAULT}], False),
+    ("eth_getBlockByNumber", ["finalized", False], False),
+    ("eth_getLogs", [{"fromBlock": "0x1", "toBlock": "0x10"}], True),
+    ("eth_getLogs", [{"fromBlock": "0x1", "toBlock": "latest"}], False),
+    ("eth_blockNumber", [], False),
+    ("eth_getTransactionCount", [VAULT, "0x10"], False),
+    ("eth_getTransactionReceipt", ["0x" + "00" * 32], False),
+])
+def test_is_block_pinned(method, params, pinned):
+    assert is_block_pinned(method, params) is pinned
+
+
+def test_auto_mode_records_block_pinned_results_only(stub, w3, tmp_path):
+    path = str(tmp_path / "auto.json.gz")
+    pinned = stub_server.BLOCK_NUMBER - 1
+
+    with use_cassette(path, mode="auto") as cassette:
+        w3.eth.get_block(pinned)
+        w3.eth.block_number
+        w3.eth.get_block("latest")
+        stub.fail_calls(1, code=-32000, message="header not found")
+        with pytest.raises(ValueError):
+            w3.eth.get_block(pinned - 1)
+    assert [key for key in cassette.interactions if "eth_getBlockByNumber" in key] == \
+           [Cassette.rpc_key("eth_getBlockByNumber", [hex(pinned), False])]
+    assert not any("eth_blockNumber" in key for key in cassette.interactions)
+    stub.reset_stats()
+
+    with use_cassette(path, mode="auto"):
+        assert w3.eth.get_block(pinned)["number"] == pinned
+        assert w3.eth.get_block(pinned - 1)["number"] == pinned - 1
+        w3.eth.block_number
+    stats = stub.reset_stats()
+    assert stats["rpc:eth_getBlockByNumber"] == 1 and stats["rpc:eth_blockNumber"] == 1
@@ -0,0 +1,50 @@
+from alpaca_finance.automated_vault.collector import CollectorClient, SnapshotCollector
+from alpaca_finance.util import get_web3_provider
+
+import pytest
+import requests
+import stub_server
+
+
+WALLET = "0x" + "12" * 20
+KEY = "n3x-BNBBUSD-PCS1"
+
+
+@pytest.fixture
+def collector(stub):
+    collector = SnapshotCollector([WALLET], [KEY], w3_provider=get_web3_provider(stub.rpc_url))
+    yield collector
+    collector.stop()
+
+
+def test_refresh_serves_one_document_per_position(stub, collector):
+    assert collector.refresh() == stub_server.BLOCK_NUMBER
+    body, etag = collector.document(f"/v1/positions/{WALLET}/{KEY}/")
+    assert f'"blockNumber":{stub_server.BLOCK_NUMBER}'.encode() in body
+    assert collector.document("/v1/status") is not None and collector.document("/v1/unknown") is None
+
+    # Unchanged positions keep their ETag, the snapshot of a new block does not
+    collector.refresh()
+    assert collector.document(f"/v1/positions/{WALLET}/{KEY}")[1] == etag
+    stub_server.BLOCK_NUMBER += 1
+    collector.refresh()
+    assert collector.document(f"/v1/positions/{WALLET}/{KEY}")[1] != etag
+
+
+def test_client_revalidates_with_etags(stub, collector):
+    host, port = collector.start(port=0).server_address[:2]
+    url = f"http://{host}:{port}"
+    client = CollectorClient(KEY, WALLET, url=url, ttl=0)
+
+    assert client.shares() == (stub_server.SHARES, 5.0, pytest.approx(5 * stub_server.SHARE_PRICE))
+    assert client.snapshot().blockNumber == stub_server.BLOCK_NUMBER
+    assert client.shares()[0] == stub_server.SHARES
+    assert client._position.version == 1  # Revalidated with a 304
+
+    r = requests.get(f"{url}/v1/vaults/{KEY.lower()}")
+    assert requests.get(r.url, headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+    stub_server.BLOCK_NUMBER += 1
+    collector.refresh()
+    assert client.snapshot().blockNumber == stub_server.BLOCK_NUMBER
+    assert client._position.version == 2
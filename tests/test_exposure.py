@@ -0,0 +1,39 @@
+from alpaca_finance.automated_vault.exposure import ExposureEngine
+from alpaca_finance.registry import get_registry
+from alpaca_finance.util import get_web3_provider
+
+import numpy as np
+import pytest
+import stub_server
+
+
+@pytest.fixture
+def engine(stub):
+    return ExposureEngine(get_web3_provider(stub.rpc_url))
+
+
+def test_every_vault_is_read_in_one_multicall_per_block(stub, engine):
+    exposure = engine.exposure()
+    assert exposure.blockNumber == stub_server.BLOCK_NUMBER
+    assert len(exposure) == len(get_registry().delta_neutral_vaults())
+    assert stub.reset_stats()["rpc:eth_call"] == 1
+
+    # positionInfo() answers 1.0 for every amount: equity 2, debt 2, LP worth 2
+    assert exposure.leverage == pytest.approx(np.full(len(exposure), 2.0))
+    assert exposure.debt_ratio == pytest.approx(np.full(len(exposure), 0.5))
+    assert exposure.net_delta == pytest.approx(np.zeros(len(exposure)))
+    assert exposure.lp_deviation == pytest.approx(np.full(len(exposure), -0.5))
+    assert exposure.at_risk(max_lp_deviation=0.6) == []
+
+    assert engine.exposure(stub_server.BLOCK_NUMBER) is exposure
+    assert stub.reset_stats()["rpc:eth_call"] == 0
+
+
+def test_failed_vault_reads_are_nan(stub, engine):
+    failed = engine.vaults[0][1].address
+    stub.reverting.add(failed.lower())
+
+    exposure = engine.exposure(stub_server.BLOCK_NUMBER - 1)
+    assert np.isnan(exposure.equity[0]) and np.isnan(exposure.leverage[0])
+    assert not np.isnan(exposure.equity[1:]).any()
+    assert exposure.to_columns()["address"][0] == failed.lower()
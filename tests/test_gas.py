@@ -0,0 +1,70 @@
+from alpaca_finance.util import get_bsc_contract_instance, get_web3_provider
+from alpaca_finance.automated_vault.batch import ActionResult, BatchExecutor, WithdrawAction
+from alpaca_finance.automated_vault.gas import GasEstimateCache
+from alpaca_finance.automated_vault.preflight import preflight
+from alpaca_finance.automated_vault.transactions import get_nonce_manager
+
+import pytest
+from eth_account import Account
+from web3.exceptions import ContractLogicError
+
+
+VAULT = "0x" + "ab" * 20
+WALLET = "0x" + "12" * 20
+
+
+@pytest.fixture
+def w3(stub):
+    return get_web3_provider(stub.rpc_url)
+
+
+@pytest.fixture
+def vault(w3):
+    return get_bsc_contract_instance(contract_address=VAULT, abi_filename="DeltaNeutralVault.json", w3_provider=w3)
+
+
+def test_key_buckets_amounts_only(vault):
+    approve = vault.functions.approve
+    spender, other = "0x" + "01" * 20, "0x" + "02" * 20
+
+    assert GasEstimateCache.key(approve(spender, 10 ** 18)) == GasEstimateCache.key(approve(spender, 10 ** 18 + 1))
+    assert GasEstimateCache.key(approve(spender, 10 ** 18)) != GasEstimateCache.key(approve(other, 10 ** 18))
+    assert GasEstimateCache.key(approve(spender, 10 ** 18)) != GasEstimateCache.key(approve(spender, 10 ** 30))
+
+
+def test_preflight_reuses_estimates_after_a_successful_simulation(stub, w3, vault):
+    cache = GasEstimateCache(margin=1.0)
+    withdrawal = vault.functions.withdraw(10 ** 18, 0, 0, b"")
+
+    assert preflight(w3, withdrawal, WALLET, gas_cache=cache).gas == 300000
+    assert preflight(w3, withdrawal, WALLET, gas_cache=cache).gas == 300000
+    assert stub.reset_stats()["rpc:eth_estimateGas"] == 1
+
+    stub.reverting.add(VAULT)
+    check = preflight(w3, withdrawal, WALLET, gas_cache=cache)
+    assert not check.ok and check.gas is None
+
+
+def test_batch_transactions_are_estimated_despite_a_cached_estimate(stub, w3, vault):
+    account = Account.create()
+    executor = BatchExecutor({account.address: account.key.hex()}, w3_provider=w3)
+    executor._gas_price = 5 * 10 ** 9
+    withdrawal = vault.functions.withdraw(10 ** 18, 0, 0, b"")
+
+    assert executor._build_transaction(withdrawal, account.address)["gas"] == 300000
+    stub.reverting.add(VAULT)
+    with pytest.raises((ContractLogicError, ValueError)):
+        executor._build_transaction(withdrawal, account.address)
+
+
+def test_transactions_after_a_signing_error_are_not_broadcast(stub, w3):
+    account = Account.create()
+    executor = BatchExecutor({account.address: "0x" + "00" * 32}, w3_provider=w3)  # Invalid private key
+    results = [ActionResult(WithdrawAction(account.address, "n3x-BNBBUSD-PCS1")) for _ in range(2)]
+    txn = {"to": VAULT, "value": 0, "gas": 300000, "gasPrice": 5 * 10 ** 9, "chainId": 56, "data": "0x"}
+
+    executor._send_wallet(account.address, [(result, "transaction", dict(txn)) for result in results], price_feed=None)
+    assert results[0].error.startswith("Could not sign transaction")
+    assert results[1].error.startswith("Not broadcast")
+    assert stub.reset_stats()["rpc:eth_sendRawTransaction"] == 0
+    assert get_nonce_manager(w3, account.address)._next is None  # Reloaded from the node on the next allocation
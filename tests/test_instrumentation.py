@@ -0,0 +1,21 @@
+from alpaca_finance.instrumentation import MetricsCollector
+from alpaca_finance.util import get_web3_provider
+from alpaca_finance.automated_vault import PositionScanner
+
+
+WALLETS = ["0x" + f"{i:02x}" * 20 for i in range(1, 5)]
+KEY = "n3x-BNBBUSD-PCS1"
+
+
+def test_worker_requests_are_tagged_with_the_operation(stub):
+    scanner = PositionScanner(WALLETS, [KEY], w3_provider=get_web3_provider(stub.rpc_url))
+    scanner.batch_size = 1  # One worker per (wallet, vault) pair
+
+    with MetricsCollector() as metrics:
+        scanner.scan_raw()
+        scanner.scan()
+
+    calls = metrics.calls_per_operation()
+    assert set(calls) == {"scan_raw", "scan"}
+    assert calls["scan_raw"]["rpc:eth_call"] == calls["scan"]["rpc:eth_call"]
+    assert calls["scan"]["rpc:eth_call"] > len(WALLETS)
@@ -0,0 +1,40 @@
+from alpaca_finance.automated_vault.rebalance import RebalanceHistory, fetch_rebalance_logs
+
+import pytest
+
+
+VAULT = "0x" + "ab" * 20
+
+
+def log(id: str, block_time: int, vault: str = VAULT) -> dict:
+    return {"id": id, "vaultAddress": vault, "blockTime": str(block_time)}
+
+
+@pytest.fixture
+def logs(stub):
+    # Three logs share blockTime 200 across the page boundaries (page size 2), listed out of id order
+    stub.rebalance_logs = [log("a", 100), log("f", 200), log("d", 200), log("e", 200), log("b", 300),
+                           log("c", 400), log("z", 100, vault="0x" + "cd" * 20)]
+    return stub.rebalance_logs
+
+
+def test_paging_never_skips_logs_sharing_a_block_time(stub, logs):
+    pages = list(fetch_rebalance_logs(VAULT, page_size=2, subgraph_url=stub.subgraph_url))
+    assert all(len(page) <= 2 for page in pages)
+    ids = [log["id"] for page in pages for log in page]
+    assert sorted(ids) == ["a", "b", "c", "d", "e", "f"]
+    assert len(ids) == len(set(ids))
+
+
+def test_updates_resume_from_the_last_stored_log(stub, logs):
+    history = RebalanceHistory(":memory:", subgraph_url=stub.subgraph_url)
+    assert history.update(VAULT) == 6
+    assert history.update(VAULT) == 0
+
+    logs.append(log("g", 400))
+    stub.reset_stats()
+    assert history.update(VAULT) == 1
+    assert stub.reset_stats()["subgraph_requests"] == 2  # The logs at the last blockTime, then the ones after it
+
+    assert history.history(VAULT, start=200, end=400, update=False) == {"id": ["d", "e", "f", "b"],
+                                                                        "blockTime": [200, 200, 200, 300]}
@@ -0,0 +1,33 @@
+from alpaca_finance.automated_vault.recorder import SnapshotRecorder
+from alpaca_finance.util import get_web3_provider
+
+import pytest
+import stub_server
+
+
+WALLET = "0x" + "12" * 20
+KEY = "n3x-BNBBUSD-PCS1"
+DAY = 86400
+
+
+@pytest.fixture
+def recorder(stub):
+    recorder = SnapshotRecorder([WALLET], [KEY], w3_provider=get_web3_provider(stub.rpc_url), db_path=":memory:",
+                                retention=7 * DAY)
+    yield recorder
+    recorder.close()
+
+
+def test_samples_older_than_the_retention_are_pruned(recorder):
+    start = 19674 * DAY  # Aligned on the 2 days buckets below
+    for day in range(10):
+        assert recorder.record(start + day * DAY) == 2  # The vault and the position
+
+    history = recorder.position_history(WALLET, KEY)
+    assert history["ts"] == [start + day * DAY for day in range(2, 10)]  # Within 7 days of the last record()
+    assert history["block_number"] == [stub_server.BLOCK_NUMBER] * 8
+    assert history["value"] == pytest.approx([5 * stub_server.SHARE_PRICE] * 8)
+    assert len(recorder.vault_history(KEY)["ts"]) == 8
+
+    assert recorder.prune(start + 5 * DAY) == 2 * 3
+    assert recorder.vault_history(KEY, interval=2 * DAY)["ts"] == [start + day * DAY for day in (4, 6, 8)]
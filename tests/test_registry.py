@@ -0,0 +1,8 @@
+from alpaca_finance.registry import get_registry
+
+
+def test_summary_keeps_only_the_strategy_pools(stub):
+    document = get_registry().summary.get()
+
+    assert list(document) == ["data"] and list(document["data"]) == ["strategyPools"]
+    assert get_registry().vault_summary("n3x-BNBBUSD-PCS1").key.lower() == "n3x-bnbbusd-pcs1"
@@ -0,0 +1,72 @@
+from alpaca_finance.util import get_routed_web3_provider
+
+import pytest
+import stub_server
+from stub_server import StubServer
+
+
+@pytest.fixture
+def backup():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def test_rate_limit_error_fails_over(stub, backup):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url], hedge=False)
+    primary, secondary = w3.provider.endpoints
+
+    stub.fail_calls(1, code=-32005, message="limit exceeded")
+    assert w3.eth.block_number == stub_server.BLOCK_NUMBER
+    assert backup.stats["rpc_calls"] == 1
+    assert primary.error_rate == 1.0 and not primary.healthy(w3.provider.max_error_rate)
+    assert secondary.error_rate == 0.0
+
+    # The rate limited endpoint is skipped until its cooldown ends
+    assert w3.eth.block_number == stub_server.BLOCK_NUMBER
+    assert backup.stats["rpc_calls"] == 2
+
+
+@pytest.mark.parametrize("message", ["header not found", "missing trie node 0x1234 (path )"])
+def test_lagging_node_error_fails_over(stub, backup, message):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url])
+
+    stub.fail_calls(1, code=-32000, message=message)
+    assert w3.eth.get_block(stub_server.BLOCK_NUMBER - 1)["number"] == stub_server.BLOCK_NUMBER - 1
+    assert w3.provider.endpoints[0].errors[-1] is True
+
+
+def test_http_error_fails_over(stub, backup):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url], hedge=False)
+
+    stub.fail_requests(1, status=503)
+    assert w3.eth.block_number == stub_server.BLOCK_NUMBER
+    assert backup.stats["rpc_calls"] == 1
+
+
+def test_request_error_is_not_failed_over(stub, backup):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url], hedge=False)
+
+    stub.fail_calls(1, code=-32602, message="invalid argument 0: hex string without 0x prefix")
+    with pytest.raises(ValueError):
+        w3.eth.block_number
+    assert backup.stats["rpc_calls"] == 0
+    assert w3.provider.endpoints[0].error_rate == 0.0
+
+
+def test_every_endpoint_rate_limited(stub, backup):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url], hedge=False)
+
+    stub.fail_calls(1)
+    backup.fail_calls(1)
+    with pytest.raises(ValueError, match="limit exceeded"):
+        w3.eth.block_number
+
+
+def test_send_raw_transaction_is_not_failed_over(stub, backup):
+    w3 = get_routed_web3_provider([stub.rpc_url, backup.rpc_url], hedge=False)
+
+    stub.fail_calls(1)
+    with pytest.raises(ValueError, match="limit exceeded"):
+        w3.eth.send_raw_transaction("0x00")
+    assert backup.stats["rpc_calls"] == 0
@@ -0,0 +1,21 @@
+from alpaca_finance.automated_vault.snapshot import PositionSnapshot, SHARE_VALUE_UNIT
+
+import pytest
+
+
+def snapshot(avg_entry_price=10 ** 18) -> PositionSnapshot:
+    # 2 shares bought at $1, now worth $1.5 each
+    return PositionSnapshot(blockNumber=1, shares_int=2 * 10 ** 18, vault_token_decimals=18,
+                            unit_share_value=SHARE_VALUE_UNIT * 3 // 2, stable_token_decimals=18,
+                            stable_token_price=10 ** 18, avgEntryPrice=avg_entry_price)
+
+
+def test_pnl_is_value_minus_cost_basis():
+    position = snapshot()
+    assert position.shares_usd == pytest.approx(3.0)
+    assert position.cost_basis == pytest.approx(2.0)
+    assert position.pnl == pytest.approx(1.0)
+
+
+def test_pnl_without_entry_price():
+    assert snapshot(avg_entry_price=None).pnl is None
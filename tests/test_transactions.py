@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Timer
+
+from alpaca_finance.util import get_web3_provider
+from alpaca_finance.automated_vault.price_feed import PriceFeed
+from alpaca_finance.automated_vault.transactions import NonceManager, PendingTransaction, wait_for_all
+
+from eth_account import Account
+import pytest
+
+
+class StaticPriceFeed(PriceFeed):
+    def fetch(self) -> float:
+        return 300.0
+
+
+@pytest.fixture
+def w3(stub):
+    return get_web3_provider(stub.rpc_url)
+
+
+def send(w3, account, nonce: int) -> str:
+    signed = account.sign_transaction({"to": "0x" + "00" * 20, "value": 0, "gas": 21000, "gasPrice": 5 * 10 ** 9,
+                                       "nonce": nonce, "chainId": 56})
+    return w3.eth.send_raw_transaction(signed.rawTransaction).hex()
+
+
+def pending(w3, transaction_hash: str, nonce: int) -> PendingTransaction:
+    return PendingTransaction(w3, transaction_hash, nonce, gas_price=5 * 10 ** 9, price_feed=StaticPriceFeed())
+
+
+def test_allocate_starts_from_the_pending_count(stub, w3):
+    account = Account.create()
+    stub.nonces[account.address.lower()] = 5
+    manager = NonceManager(w3, account.address)
+
+    assert [manager.allocate() for _ in range(3)] == [5, 6, 7]
+    assert stub.stats["rpc:eth_getTransactionCount"] == 1
+
+
+def test_concurrent_allocations_are_unique(stub, w3):
+    manager = NonceManager(w3, Account.create().address)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        nonces = list(executor.map(lambda _: manager.allocate(), range(100)))
+
+    assert sorted(nonces) == list(range(100))
+
+
+def test_resync_reloads_the_count(stub, w3):
+    account = Account.create()
+    manager = NonceManager(w3, account.address)
+    for _ in range(2):
+        send(w3, account, manager.allocate())
+    manager.allocate()  # Allocated but never sent
+
+    manager.resync()
+    assert manager.allocate() == 2
+
+
+def test_wait_for_all_returns_receipts_in_handle_order(stub, w3):
+    account = Account.create()
+    stub.auto_mine = False
+    handles = [pending(w3, send(w3, account, nonce), nonce) for nonce in range(3)]
+    assert not any(handle.done() for handle in handles)
+
+    # Mined in reverse order while waiting
+    for delay, handle in zip((0.3, 0.2, 0.1), handles):
+        Timer(delay, stub.mine, args=(handle.transactionHash.hex(),)).start()
+    receipts = wait_for_all(handles, timeout=5, poll_latency=0.05)
+
+    assert [receipt.transactionHash for receipt in receipts] == [handle.transactionHash for handle in handles]
+    assert all(receipt.gasSpendUSD == pytest.approx(300000 * 5 * 10 ** 9 / 10 ** 18 * 300.0) for receipt in receipts)
+
+
+def test_wait_for_all_timeout(stub, w3):
+    account = Account.create()
+    mined = pending(w3, send(w3, account, 0), 0)
+    stub.auto_mine = False
+    unmined = pending(w3, send(w3, account, 1), 1)
+
+    with pytest.raises(TimeoutError, match=unmined.transactionHash.hex()):
+        wait_for_all([mined, unmined], timeout=0.3, poll_latency=0.05)
+    assert mined.done() and not unmined.done()
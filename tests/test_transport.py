@@ -0,0 +1,48 @@
+from alpaca_finance.block_cache import enable_block_cache
+from alpaca_finance.cassette import use_cassette
+from alpaca_finance.instrumentation import MetricsCollector
+from alpaca_finance.transport import rpc_batch
+from alpaca_finance.util import get_routed_web3_provider, get_web3_provider
+
+import stub_server
+
+
+def blocks(*numbers: int) -> list[tuple[str, list]]:
+    return [("eth_getBlockByNumber", [hex(number), False]) for number in numbers]
+
+
+def test_routed_batch_is_one_request(stub):
+    w3 = get_routed_web3_provider([stub.rpc_url], hedge=False)
+    pinned = stub_server.BLOCK_NUMBER - 1
+
+    with MetricsCollector() as metrics:
+        responses = rpc_batch(w3, blocks(pinned, pinned - 1, pinned - 2))
+    assert [int(response["result"]["number"], 16) for response in responses] == [pinned, pinned - 1, pinned - 2]
+    assert stub.reset_stats()["rpc_requests"] == 1
+    assert metrics.calls_per_operation()["(none)"]["rpc:eth_getBlockByNumber"] == 3
+
+
+def test_batch_is_recorded_and_replayed(stub, tmp_path):
+    w3 = get_web3_provider(stub.rpc_url)
+    path, pinned = str(tmp_path / "batch.json.gz"), stub_server.BLOCK_NUMBER - 1
+
+    with use_cassette(path, mode="record"):
+        recorded = rpc_batch(w3, blocks(pinned, pinned - 1))
+    stub.reset_stats()
+
+    with use_cassette(path, mode="replay"):
+        assert [response["result"] for response in rpc_batch(w3, blocks(pinned, pinned - 1))] == \
+               [response["result"] for response in recorded]
+    assert stub.reset_stats()["rpc_requests"] == 0
+
+
+def test_batched_calls_go_through_the_block_cache(stub):
+    w3 = get_web3_provider(stub.rpc_url)
+    enable_block_cache(w3)
+    call = ("eth_call", [{"to": "0x" + "ab" * 20, "data": "0x313ce567"}, "latest"])  # decimals()
+
+    first = rpc_batch(w3, [call, ("eth_blockNumber", [])])
+    stub.reset_stats()
+    second = rpc_batch(w3, [call, ("eth_blockNumber", [])])
+    assert second[0] == first[0]
+    assert stub.reset_stats()["rpc:eth_call"] == 0